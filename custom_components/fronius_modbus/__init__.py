@@ -13,6 +13,24 @@ from .const import (
     DOMAIN,
     CONF_INVERTER_UNIT_ID,
     CONF_METER_UNIT_ID,
+    CONF_STATUS_SCAN_INTERVAL,
+    CONF_SETTINGS_SCAN_INTERVAL,
+    DEFAULT_STATUS_SCAN_INTERVAL,
+    DEFAULT_SETTINGS_SCAN_INTERVAL,
+    CONF_MAX_CONNECTIONS,
+    DEFAULT_MAX_CONNECTIONS,
+    CONF_WRITE_DEBOUNCE,
+    DEFAULT_WRITE_DEBOUNCE,
+    CONF_SLEEP_SCAN_INTERVAL,
+    DEFAULT_SLEEP_SCAN_INTERVAL,
+    CONF_POWER_DEADBAND,
+    DEFAULT_POWER_DEADBAND,
+    CONF_POWER_DEADBAND_PERCENT,
+    DEFAULT_POWER_DEADBAND_PERCENT,
+    CONF_MIN_PUBLISH_INTERVAL,
+    DEFAULT_MIN_PUBLISH_INTERVAL,
+    CONF_MAX_PUBLISH_AGE,
+    DEFAULT_MAX_PUBLISH_AGE,
 )
 
 from . import hub
@@ -33,21 +51,37 @@ async def async_setup_entry(hass: HomeAssistant, entry: HubConfigEntry) -> bool:
     port = entry.data[CONF_PORT]
     inverter_unit_id = entry.data.get(CONF_INVERTER_UNIT_ID, 1)
     meter_unit_ids = [entry.data.get(CONF_METER_UNIT_ID, 1)]
-    scan_interval = entry.data[CONF_SCAN_INTERVAL]
+    scan_interval = entry.options.get(CONF_SCAN_INTERVAL, entry.data[CONF_SCAN_INTERVAL])
+    status_scan_interval = entry.options.get(CONF_STATUS_SCAN_INTERVAL, DEFAULT_STATUS_SCAN_INTERVAL)
+    settings_scan_interval = entry.options.get(CONF_SETTINGS_SCAN_INTERVAL, DEFAULT_SETTINGS_SCAN_INTERVAL)
+    max_connections = entry.options.get(CONF_MAX_CONNECTIONS, DEFAULT_MAX_CONNECTIONS)
+    write_debounce = entry.options.get(CONF_WRITE_DEBOUNCE, DEFAULT_WRITE_DEBOUNCE)
+    sleep_scan_interval = entry.options.get(CONF_SLEEP_SCAN_INTERVAL, DEFAULT_SLEEP_SCAN_INTERVAL)
+    power_deadband = entry.options.get(CONF_POWER_DEADBAND, DEFAULT_POWER_DEADBAND)
+    power_deadband_percent = entry.options.get(CONF_POWER_DEADBAND_PERCENT, DEFAULT_POWER_DEADBAND_PERCENT)
+    min_publish_interval = entry.options.get(CONF_MIN_PUBLISH_INTERVAL, DEFAULT_MIN_PUBLISH_INTERVAL)
+    max_publish_age = entry.options.get(CONF_MAX_PUBLISH_AGE, DEFAULT_MAX_PUBLISH_AGE)
 
     _LOGGER.debug("Setup %s.%s", DOMAIN, name)
 
     # Store an instance of the "connecting" class that does the work of speaking
     # with your actual devices.
-    entry.runtime_data = hub.Hub(hass = hass, name = name, host = host, port = port, inverter_unit_id=inverter_unit_id, meter_unit_ids=meter_unit_ids, scan_interval = scan_interval)
+    entry.runtime_data = hub.Hub(hass = hass, name = name, host = host, port = port, inverter_unit_id=inverter_unit_id, meter_unit_ids=meter_unit_ids, scan_interval = scan_interval, status_scan_interval = status_scan_interval, settings_scan_interval = settings_scan_interval, max_connections = max_connections, write_debounce = write_debounce, sleep_scan_interval = sleep_scan_interval, power_deadband = power_deadband, power_deadband_percent = power_deadband_percent, min_publish_interval = min_publish_interval, max_publish_age = max_publish_age)
     
-    await entry.runtime_data.init_data()
+    entry.runtime_data.on_device_changed = lambda: hass.config_entries.async_schedule_reload(entry.entry_id)
+    await entry.runtime_data.async_init_data()
 
     # This creates each HA object for each platform your device requires.
     # It's done by calling the `async_setup_entry` function in each platform module.
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+
+    entry.async_on_unload(entry.add_update_listener(async_update_options))
     return True
 
+async def async_update_options(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Reload the entry when options have changed."""
+    await hass.config_entries.async_reload(entry.entry_id)
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
@@ -13,6 +13,8 @@ class FroniusModbusBaseEntity():
         self._platform_name = platform_name
         self._hub:Hub = hub
         self._key = key
+        # slot of the key in the hub data, resolved once
+        self._slot = hub.data_slot(key)
         self._name = name
         self._unit_of_measurement = unit
         self._icon = icon
@@ -42,11 +44,16 @@ class FroniusModbusBaseEntity():
 
     async def async_added_to_hass(self):
         """Register callbacks."""
-        self._hub.async_add_hub_entity(self._modbus_data_updated)
+        self._hub.async_add_hub_entity(self._modbus_data_updated, self.subscribed_keys)
 
     async def async_will_remove_from_hass(self) -> None:
         self._hub.async_remove_hub_entity(self._modbus_data_updated)
 
+    @property
+    def subscribed_keys(self):
+        """Data keys whose changes update the entity."""
+        return [self._key]
+
     @callback
     def _modbus_data_updated(self):
         self.async_write_ha_state()
@@ -0,0 +1,146 @@
+"""Decoding of the same register block read from many units"""
+
+import logging
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy is optional, the pure Python decoder is used without it
+    np = None
+
+from .registermap import RegisterBlock, registers_to_bytes
+
+_LOGGER = logging.getLogger(__name__)
+
+# largest power of ten that keeps scaled 32 bit values exact in 64 bit integers
+_MAX_EXACT_EXPONENT = 9
+# largest integer of a float64 column that is exact
+_MAX_EXACT_FLOAT = 2**53
+
+def decode_batch(block: RegisterBlock, rows, convert_field, use_numpy=None) -> dict:
+    """Decode ``rows`` of ``block.count`` registers, one row per unit.
+
+    ``rows`` is a 2D uint16 array or a sequence of register sequences and
+    ``convert_field`` the converter of single values, ExtModbusClient.convert_field.
+    Returns a column by field key for every published field, holding the value
+    convert_field returns for each row. With NumPy, which is used when installed
+    unless ``use_numpy`` is False, the columns are arrays: unscaled numbers and
+    values of non negative scale factors int64, other scaled values float64,
+    with NaN where convert_field returns None, enums, bitmasks and strings
+    object arrays. Without NumPy the columns are lists.
+    """
+    if use_numpy is None:
+        use_numpy = not np is None
+    if use_numpy:
+        if np is None:
+            raise ImportError('NumPy is not installed')
+        return _decode_numpy(block, rows, convert_field)
+    return _decode_python(block, rows, convert_field)
+
+
+def _decode_python(block, rows, convert_field):
+    columns = {field.key: [] for field in block.published}
+    for row in rows:
+        if len(row) != block.count:
+            raise ValueError(f'Row of {len(row)} registers does not match block {block.name} of {block.count} registers')
+        raw = block.unpack(registers_to_bytes(row))
+        for field in block.published:
+            columns[field.key].append(convert_field(field, raw))
+    return columns
+
+
+def _decode_numpy(block, rows, convert_field):
+    regs = np.asarray(rows, dtype=np.uint16)
+    if regs.ndim != 2 or regs.shape[1] != block.count:
+        raise ValueError(f'Registers of shape {regs.shape} do not match block {block.name} of {block.count} registers')
+
+    raw = {field.name: _raw_column(field, regs) for field in block.fields}
+    columns = {}
+    for field in block.published:
+        if field.type == 'string' or not field.enum is None or not field.bitmask is None:
+            columns[field.key] = _convert_each(field, raw, convert_field)
+        elif field.sf is None:
+            columns[field.key] = raw[field.name]
+        else:
+            sf = raw[field.sf] if isinstance(field.sf, str) else np.full(len(regs), field.sf, dtype=np.int64)
+            columns[field.key] = _scale(field, raw[field.name], sf)
+    return columns
+
+
+def _raw_column(field, regs):
+    """Return the raw values of ``field`` in all rows."""
+    if field.type == 'string':
+        # rows of big endian bytes, as unpacked by the struct decoder
+        chars = regs[:, field.offset:field.offset + field.size].astype('>u2')
+        return [row.tobytes() for row in chars]
+    column = regs[:, field.offset].astype(np.int64)
+    if field.size == 2:
+        column = (column << 16) | regs[:, field.offset + 1]
+    if field.type in ('int16', 'sunssf'):
+        column = np.where(column >= 0x8000, column - 0x10000, column)
+    elif field.type == 'int32':
+        column = np.where(column >= 0x80000000, column - 0x100000000, column)
+    return column
+
+
+def _convert_each(field, raw, convert_field):
+    """Return the values of ``field`` converted by ``convert_field``, once per distinct raw value."""
+    if field.type == 'string':
+        values = raw[field.name]
+        column = np.empty(len(values), dtype=object)
+        column[:] = [convert_field(field, {field.name: value}) for value in values]
+        return column
+    # enums and bitmasks of a fleet take few distinct values
+    distinct, inverse = np.unique(raw[field.name], return_inverse=True)
+    converted = np.empty(len(distinct), dtype=object)
+    converted[:] = [convert_field(field, {field.name: value}) for value in distinct.tolist()]
+    return converted[inverse.reshape(-1)]
+
+
+def _scale(field, value, sf):
+    """Return round(value * 10**sf, digits) of all rows, NaN outside of the bounds.
+
+    Like the scalar decoder non negative scale factors give integers. Negative
+    ones are applied in integers and divided by 10**digits once, which rounds
+    like round() does. Scale factors beyond that range are converted one value
+    at a time.
+    """
+    digits = field.digits
+    if (sf >= 0).all():
+        exponent = sf
+        divisor = None
+    else:
+        exponent = sf + digits
+        divisor = 10.0**digits
+    exact = (exponent >= 0) & (exponent <= _MAX_EXACT_EXPONENT)
+    result = value * np.power(10, np.where(exact, exponent, 0), dtype=np.int64)
+    if not divisor is None:
+        # integers of non negative scale factors have to fit the float mantissa
+        exact &= (sf < 0) | (np.abs(result) <= _MAX_EXACT_FLOAT)
+        result = result / divisor
+    for i in np.flatnonzero(~exact):
+        scaled = round(int(value[i]) * 10**int(sf[i]), digits)
+        if not _fits(result, scaled):
+            # invalid scale factors can give integers beyond the range of the column
+            result = result.astype(object)
+        result[i] = scaled
+
+    out_of_bounds = np.zeros(len(result), dtype=bool)
+    if not field.lower_bound is None:
+        out_of_bounds |= result < field.lower_bound
+    if not field.upper_bound is None:
+        out_of_bounds |= result > field.upper_bound
+    if out_of_bounds.any():
+        _LOGGER.debug(f'{np.count_nonzero(out_of_bounds)} values of {field.name} out of bounds {field.lower_bound} to {field.upper_bound}')
+        if result.dtype == np.int64:
+            result = result.astype(np.float64)
+        result[out_of_bounds] = np.nan
+    return result
+
+
+def _fits(column, value):
+    """True when ``value`` is stored exactly in ``column``."""
+    if column.dtype == np.int64:
+        return -2**63 <= value < 2**63
+    if column.dtype == np.float64:
+        return isinstance(value, float) or abs(value) <= _MAX_EXACT_FLOAT
+    return True
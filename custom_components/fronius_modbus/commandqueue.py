@@ -0,0 +1,80 @@
+"""Prioritized work queue for Modbus commands"""
+
+import asyncio
+import itertools
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+PRIORITY_WRITE = 0
+PRIORITY_READ = 1
+
+class CommandQueue:
+    """Runs submitted coroutines one at a time, lowest priority value first.
+
+    Commands with the same priority run in submission order. Commands
+    submitted with a ``coalesce_key`` that is already waiting in the queue
+    share the pending command's result instead of being queued again.
+    Cancelling the returned future of one caller does not cancel the command
+    for the others.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._queue = asyncio.PriorityQueue()
+        self._counter = itertools.count()
+        self._pending = {}
+        self._worker = None
+        self.coalesced = 0
+
+    def submit(self, priority, func, coalesce_key=None) -> asyncio.Future:
+        """Queue ``func`` (a coroutine function without arguments), returns a future with its result."""
+        if not coalesce_key is None:
+            future = self._pending.get(coalesce_key)
+            if not future is None and not future.done():
+                self.coalesced += 1
+                _LOGGER.debug(f"{self._name}: {coalesce_key} already queued, coalesced: {self.coalesced}")
+                return asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        if not coalesce_key is None:
+            self._pending[coalesce_key] = future
+        self._queue.put_nowait((priority, next(self._counter), func, future, coalesce_key))
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run(), name=f"{self._name} command queue")
+        if coalesce_key is None:
+            return future
+        return asyncio.shield(future)
+
+    async def _run(self):
+        while True:
+            priority, _, func, future, coalesce_key = await self._queue.get()
+            if not coalesce_key is None and self._pending.get(coalesce_key) is future:
+                del self._pending[coalesce_key]
+            if future.done():
+                continue
+            try:
+                result = await func()
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+    @property
+    def size(self):
+        return self._queue.qsize()
+
+    def close(self):
+        """Stop the worker and cancel queued commands."""
+        if not self._worker is None:
+            self._worker.cancel()
+            self._worker = None
+        while not self._queue.empty():
+            future = self._queue.get_nowait()[3]
+            future.cancel()
+        self._pending.clear()
@@ -6,9 +6,9 @@ from typing import Any
 import voluptuous as vol
 
 from homeassistant import config_entries, exceptions
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 
-from .hub import Hub
+from .froniusmodbusclient import FroniusModbusClient
 from homeassistant.const import CONF_NAME, CONF_HOST, CONF_PORT, CONF_SCAN_INTERVAL
 from .const import (
     DOMAIN,
@@ -19,6 +19,26 @@ from .const import (
     DEFAULT_METER_UNIT_ID,
     CONF_INVERTER_UNIT_ID,
     CONF_METER_UNIT_ID,
+    CONF_STATUS_SCAN_INTERVAL,
+    CONF_SETTINGS_SCAN_INTERVAL,
+    DEFAULT_STATUS_SCAN_INTERVAL,
+    DEFAULT_SETTINGS_SCAN_INTERVAL,
+    CONF_MAX_CONNECTIONS,
+    DEFAULT_MAX_CONNECTIONS,
+    MAX_CONNECTIONS,
+    CONF_WRITE_DEBOUNCE,
+    DEFAULT_WRITE_DEBOUNCE,
+    CONF_SLEEP_SCAN_INTERVAL,
+    DEFAULT_SLEEP_SCAN_INTERVAL,
+    CONF_POWER_DEADBAND,
+    DEFAULT_POWER_DEADBAND,
+    CONF_POWER_DEADBAND_PERCENT,
+    DEFAULT_POWER_DEADBAND_PERCENT,
+    CONF_MIN_PUBLISH_INTERVAL,
+    DEFAULT_MIN_PUBLISH_INTERVAL,
+    CONF_MAX_PUBLISH_AGE,
+    DEFAULT_MAX_PUBLISH_AGE,
+    PROBE_TIMEOUT,
     SUPPORTED_MANUFACTURERS,
     SUPPORTED_MODELS,
 )
@@ -71,17 +91,22 @@ async def validate_input(hass: HomeAssistant, data: dict) -> dict[str, Any]:
         _LOGGER.error(f"Modbus addresses are not unique {all_addresses}")
         raise AddressesNotUnique
 
-    try:
-        hub = Hub(hass, data[CONF_NAME], data[CONF_HOST], data[CONF_PORT], data[CONF_INVERTER_UNIT_ID], meter_addresses, data[CONF_SCAN_INTERVAL])
+    client = FroniusModbusClient(host=data[CONF_HOST], port=data[CONF_PORT], inverter_unit_id=data[CONF_INVERTER_UNIT_ID], meter_unit_ids=meter_addresses, timeout=PROBE_TIMEOUT, retries=0)
+    results = await client.probe(all_addresses)
+    for unit_id, result in results.items():
+        _LOGGER.info(f"Probe unit id: {unit_id} reachable: {result['reachable']} sunspec: {result['sunspec']} rtt: {result['rtt']} ms")
 
-        await hub.init_data()
-    except Exception as e:
+    inverter = results[data[CONF_INVERTER_UNIT_ID]]
+    if not inverter['reachable']:
         # If there is an error, raise an exception to notify HA that there was a
         # problem. The UI will also show there was a problem
-        _LOGGER.error(f"Cannot start hub {e}")
+        _LOGGER.error(f"Cannot connect to inverter unit id: {data[CONF_INVERTER_UNIT_ID]}")
         raise CannotConnect
+    for unit_id in meter_addresses:
+        if not results[unit_id]['sunspec']:
+            _LOGGER.warning(f"No meter found at unit id: {unit_id}")
 
-    manufacturer = hub.data.get('i_manufacturer')
+    manufacturer = inverter.get('manufacturer')
     if manufacturer is None:
         _LOGGER.error(f"No manufacturer is returned")
         raise UnsupportedHardware   
@@ -89,7 +114,7 @@ async def validate_input(hass: HomeAssistant, data: dict) -> dict[str, Any]:
         _LOGGER.error(f"Unsupported manufacturer: '{manufacturer}'")
         raise UnsupportedHardware
 
-    model = hub.data.get('i_model')
+    model = inverter.get('model')
     if model is None:
         _LOGGER.error(f"No model type is returned")
         raise UnsupportedHardware
@@ -123,6 +148,12 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     # changes.
     CONNECTION_CLASS = config_entries.CONN_CLASS_LOCAL_PUSH
 
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        """Get the options flow for this handler."""
+        return OptionsFlowHandler()
+
     async def async_step_user(self, user_input=None):
         """Handle the initial step."""
         # This goes through the steps to take the user through the setup process.
@@ -158,6 +189,40 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             step_id="user", data_schema=DATA_SCHEMA, errors=errors
         )
 
+class OptionsFlowHandler(config_entries.OptionsFlow):
+    """Handle polling options."""
+
+    async def async_step_init(self, user_input=None):
+        """Manage the polling intervals."""
+        errors = {}
+        if user_input is not None:
+            if user_input[CONF_SCAN_INTERVAL] < 5:
+                errors["base"] = "scan_interval_too_short"
+            elif user_input[CONF_STATUS_SCAN_INTERVAL] < user_input[CONF_SCAN_INTERVAL] or user_input[CONF_SETTINGS_SCAN_INTERVAL] < user_input[CONF_SCAN_INTERVAL] or user_input[CONF_SLEEP_SCAN_INTERVAL] < user_input[CONF_SCAN_INTERVAL]:
+                errors["base"] = "tier_interval_too_short"
+            else:
+                return self.async_create_entry(title="", data=user_input)
+
+        options = self.config_entry.options
+        scan_interval = options.get(CONF_SCAN_INTERVAL, self.config_entry.data.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL))
+        options_schema = vol.Schema(
+            {
+                vol.Required(CONF_SCAN_INTERVAL, default=scan_interval): int,
+                vol.Required(CONF_STATUS_SCAN_INTERVAL, default=options.get(CONF_STATUS_SCAN_INTERVAL, DEFAULT_STATUS_SCAN_INTERVAL)): int,
+                vol.Required(CONF_SETTINGS_SCAN_INTERVAL, default=options.get(CONF_SETTINGS_SCAN_INTERVAL, DEFAULT_SETTINGS_SCAN_INTERVAL)): int,
+                vol.Required(CONF_SLEEP_SCAN_INTERVAL, default=options.get(CONF_SLEEP_SCAN_INTERVAL, DEFAULT_SLEEP_SCAN_INTERVAL)): int,
+                vol.Required(CONF_MAX_CONNECTIONS, default=options.get(CONF_MAX_CONNECTIONS, DEFAULT_MAX_CONNECTIONS)): vol.All(int, vol.Range(min=1, max=MAX_CONNECTIONS)),
+                vol.Required(CONF_WRITE_DEBOUNCE, default=options.get(CONF_WRITE_DEBOUNCE, DEFAULT_WRITE_DEBOUNCE)): vol.All(vol.Coerce(float), vol.Range(min=0, max=10)),
+                vol.Required(CONF_POWER_DEADBAND, default=options.get(CONF_POWER_DEADBAND, DEFAULT_POWER_DEADBAND)): vol.All(vol.Coerce(float), vol.Range(min=0)),
+                vol.Required(CONF_POWER_DEADBAND_PERCENT, default=options.get(CONF_POWER_DEADBAND_PERCENT, DEFAULT_POWER_DEADBAND_PERCENT)): vol.All(vol.Coerce(float), vol.Range(min=0, max=100)),
+                vol.Required(CONF_MIN_PUBLISH_INTERVAL, default=options.get(CONF_MIN_PUBLISH_INTERVAL, DEFAULT_MIN_PUBLISH_INTERVAL)): vol.All(int, vol.Range(min=0)),
+                vol.Required(CONF_MAX_PUBLISH_AGE, default=options.get(CONF_MAX_PUBLISH_AGE, DEFAULT_MAX_PUBLISH_AGE)): vol.All(int, vol.Range(min=0)),
+            }
+        )
+        return self.async_show_form(
+            step_id="init", data_schema=options_schema, errors=errors
+        )
+
 class CannotConnect(exceptions.HomeAssistantError):
     """Error to indicate we cannot connect."""
 
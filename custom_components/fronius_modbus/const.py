@@ -14,10 +14,87 @@ DEFAULT_INVERTER_UNIT_ID = 1
 DEFAULT_METER_UNIT_ID = 200
 CONF_INVERTER_UNIT_ID = 'inverter_modbus_unit_id'
 CONF_METER_UNIT_ID = 'meter_modbus_unit_id'
+CONF_STATUS_SCAN_INTERVAL = 'status_scan_interval'
+CONF_SETTINGS_SCAN_INTERVAL = 'settings_scan_interval'
+DEFAULT_STATUS_SCAN_INTERVAL = 30
+DEFAULT_SETTINGS_SCAN_INTERVAL = 300
+CONF_MAX_CONNECTIONS = 'max_connections'
+DEFAULT_MAX_CONNECTIONS = 1
+MAX_CONNECTIONS = 4
+CONF_WRITE_DEBOUNCE = 'write_debounce'
+DEFAULT_WRITE_DEBOUNCE = 0.5
+CONF_SLEEP_SCAN_INTERVAL = 'sleep_scan_interval'
+DEFAULT_SLEEP_SCAN_INTERVAL = 60
+CONF_POWER_DEADBAND = 'power_deadband'
+DEFAULT_POWER_DEADBAND = 5
+CONF_POWER_DEADBAND_PERCENT = 'power_deadband_percent'
+DEFAULT_POWER_DEADBAND_PERCENT = 1
+CONF_MIN_PUBLISH_INTERVAL = 'min_publish_interval'
+DEFAULT_MIN_PUBLISH_INTERVAL = 0
+CONF_MAX_PUBLISH_AGE = 'max_publish_age'
+DEFAULT_MAX_PUBLISH_AGE = 300
+
+# Sensors whose changes are filtered by the power deadband options
+POWER_PUBLISH_KEYS = ['acpower', 'pv_power', 'mppt1_power', 'mppt2_power', 'mppt3_power', 'mppt4_power', 'load', 'storage_power']
+METER_POWER_PUBLISH_KEYS = ['power']
+# Fixed deadbands of other measurements by data key: (absolute, relative)
+PUBLISH_DEADBANDS = {
+    'line_frequency': (0.02, 0),
+    'PhVphA': (0.5, 0),
+    'PhVphB': (0.5, 0),
+    'PhVphC': (0.5, 0),
+    'PPVphAB': (0.5, 0),
+    'PPVphBC': (0.5, 0),
+    'PPVphCA': (0.5, 0),
+    'tempcab': (0.5, 0),
+}
+METER_PUBLISH_DEADBANDS = {
+    'line_frequency': (0.02, 0),
+    'PhVphA': (0.5, 0),
+    'PhVphB': (0.5, 0),
+    'PhVphC': (0.5, 0),
+    'PPV': (0.5, 0),
+}
+
+# Timeout in seconds of the connection probe of the config flow
+PROBE_TIMEOUT = 5
+
+# Failed refresh cycles back off up to this interval in seconds, the circuit
+# breaker opens after this number of failed cycles in a row
+BACKOFF_MAX_INTERVAL = 300
+BACKOFF_JITTER = 0.2
+BREAKER_FAILURE_THRESHOLD = 3
+
+# Version of the stored device cache
+STORAGE_VERSION = 1
+
+# Solar API request timeout and refresh interval in seconds
+SOLAR_API_TIMEOUT = 5
+SOLAR_API_SCAN_INTERVAL = 3600
 ATTR_MANUFACTURER = 'Fronius'
 SUPPORTED_MANUFACTURERS = ['Fronius']
 SUPPORTED_MODELS = ['Primo GEN24', 'Symo GEN24']
 
+# Polling tiers, each tier is read at its own interval
+POLL_TIER_FAST = 'fast'
+POLL_TIER_STATUS = 'status'
+POLL_TIER_SETTINGS = 'settings'
+
+BLOCK_POLL_TIERS = {
+    'inverter': POLL_TIER_FAST,
+    'mppt': POLL_TIER_FAST,
+    'storage': POLL_TIER_FAST,
+    'meter': POLL_TIER_FAST,
+    'status': POLL_TIER_STATUS,
+    'controls': POLL_TIER_STATUS,
+    'settings': POLL_TIER_SETTINGS,
+}
+
+# Blocks that are only read while the cycle budget lasts, deferred blocks stay due for the next cycle
+DEFERRABLE_BLOCKS = ['nameplate', 'settings', 'controls', 'status']
+# Share of the scan interval a refresh cycle may take
+CYCLE_BUDGET = 0.8
+
 STORAGE_EXT_CONTROL_MODE = {
     0: 'Auto',
     1: 'PV Charge Limit',
@@ -73,6 +150,20 @@ INVERTER_SENSOR_TYPES = {
     'VArPct_Ena': ['Limit VAr control', 'VArPct_Ena', None, None, None, None, EntityCategory.DIAGNOSTIC],
     'PhVphA': ['AC voltage L1-N', 'PhVphA', SensorDeviceClass.VOLTAGE, SensorStateClass.MEASUREMENT, 'V', 'mdi:lightning-bolt', None],
     'unit_id': ['Modbus ID', 'i_unit_id', None, None, None, None, EntityCategory.DIAGNOSTIC],    
+    'request_rate': ['Modbus request rate', 'request_rate', None, SensorStateClass.MEASUREMENT, 'req/min', 'mdi:swap-horizontal', EntityCategory.DIAGNOSTIC],
+    'latency_p50': ['Modbus latency p50', 'latency_p50', SensorDeviceClass.DURATION, SensorStateClass.MEASUREMENT, 'ms', 'mdi:timer-outline', EntityCategory.DIAGNOSTIC],
+    'latency_p95': ['Modbus latency p95', 'latency_p95', SensorDeviceClass.DURATION, SensorStateClass.MEASUREMENT, 'ms', 'mdi:timer-outline', EntityCategory.DIAGNOSTIC],
+    'latency_max': ['Modbus latency max', 'latency_max', SensorDeviceClass.DURATION, SensorStateClass.MEASUREMENT, 'ms', 'mdi:timer-outline', EntityCategory.DIAGNOSTIC],
+    'cycle_duration': ['Refresh duration', 'cycle_duration', SensorDeviceClass.DURATION, SensorStateClass.MEASUREMENT, 'ms', 'mdi:timer-outline', EntityCategory.DIAGNOSTIC],
+    'link_state': ['Modbus link', 'link_state', None, None, None, 'mdi:lan-connect', EntityCategory.DIAGNOSTIC],
+    'error_rate': ['Refresh error rate', 'error_rate', None, SensorStateClass.MEASUREMENT, '%', 'mdi:alert-circle-outline', EntityCategory.DIAGNOSTIC],
+    'deferred_blocks': ['Deferred blocks', 'deferred_blocks', None, SensorStateClass.MEASUREMENT, None, 'mdi:timer-sand', EntityCategory.DIAGNOSTIC],
+    'poll_profile': ['Polling profile', 'poll_profile', None, None, None, 'mdi:sleep', EntityCategory.DIAGNOSTIC],
+    'cycle_overruns': ['Refresh overruns', 'cycle_overruns', None, SensorStateClass.TOTAL_INCREASING, None, 'mdi:timer-alert-outline', EntityCategory.DIAGNOSTIC],
+    'retries': ['Modbus retries', 'retries', None, SensorStateClass.TOTAL_INCREASING, None, 'mdi:repeat', EntityCategory.DIAGNOSTIC],
+    'exception_responses': ['Modbus exception responses', 'exception_responses', None, SensorStateClass.TOTAL_INCREASING, None, 'mdi:alert-circle-outline', EntityCategory.DIAGNOSTIC],
+    'failed_requests': ['Modbus failed requests', 'failed_requests', None, SensorStateClass.TOTAL_INCREASING, None, 'mdi:alert-circle-outline', EntityCategory.DIAGNOSTIC],
+    'bytes_transferred': ['Modbus data transferred', 'bytes_transferred', SensorDeviceClass.DATA_SIZE, SensorStateClass.TOTAL_INCREASING, 'B', 'mdi:swap-horizontal', EntityCategory.DIAGNOSTIC],
 }
 
 INVERTER_SYMO_SENSOR_TYPES = {
@@ -6,12 +6,26 @@ import logging
 import operator
 #from datetime import timedelta, datetime
 from typing import Optional, Literal
+from contextlib import asynccontextmanager
 import struct
 import asyncio
+import time
 
 from pymodbus.client import AsyncModbusTcpClient
 from pymodbus.exceptions import ModbusIOException, ConnectionException
 from pymodbus import ExceptionResponse
+from pymodbus.pdu.register_message import ReadHoldingRegistersResponse
+
+from .registermap import RegisterBlock, RegisterBuffer, RegisterField, registers_to_bytes
+from .readplanner import plan_reads
+from .stats import (
+    ModbusStats,
+    READ_REQUEST_BYTES,
+    READ_RESPONSE_BYTES,
+    EXCEPTION_RESPONSE_BYTES,
+    WRITE_REQUEST_BYTES,
+    WRITE_RESPONSE_BYTES,
+)
 
 # pymodbus 3.6 removed ``unpack_bitstring`` from ``pymodbus.utilities``.
 # Earlier versions exposed this helper which converted a bytearray to a list
@@ -34,43 +48,139 @@ except Exception:  # pragma: no cover - for newer pymodbus versions
 
 _LOGGER = logging.getLogger(__name__)
 
+class RequestDeferred(Exception):
+    """A deferrable request was not sent, it would not complete before the deadline."""
+
+
+class RegisterBufferResponse(ReadHoldingRegistersResponse):
+    """Read holding registers response that keeps the payload as a RegisterBuffer.
+
+    The pymodbus response unpacks every register into a list, here
+    ``registers`` is only built when accessed.
+    """
+
+    def decode(self, data: bytes) -> None:
+        if (data_len := int(data[0])) >= len(data):
+            raise ModbusIOException(f"byte_count {data_len} > length of packet {len(data)}")
+        self.register_buffer = RegisterBuffer(memoryview(data)[1:data_len + 1])
+
+    @property
+    def registers(self):
+        return list(self.register_buffer)
+
+    @registers.setter
+    def registers(self, registers):
+        self.register_buffer = RegisterBuffer(registers_to_bytes(registers))
+
+    def __str__(self):
+        # pymodbus logs every decoded response, do not format the registers for it
+        return f"{self.__class__.__name__}(dev_id={self.dev_id}, transaction_id={self.transaction_id}, count={len(self.register_buffer)})"
+
+
 class ExtModbusClient:
 
-    def __init__(self, host: str, port: int, unit_id: int, timeout: int, framer:str = None) -> None:
+    def __init__(self, host: str, port: int, unit_id: int, timeout: int, framer:str = None, max_connections: int = 1, retries: int = 3) -> None:
         """Init Class"""
         self._host = host
         self._port = port
         self._unit_id = unit_id
+        self._timeout = timeout
+        self._framer = framer
+        # retries of pymodbus after a request timed out
+        self._retries = retries
         self.busy = False
-        if not framer is None:
-            self._client = AsyncModbusTcpClient(host=host, port=port, framer=framer, timeout=timeout) 
+        self.request_count = 0
+        self.stats = ModbusStats()
+        # requests on one connection are serialized by pymodbus, concurrent
+        # requests are spread over up to max_connections connections
+        self._max_connections = max(1, max_connections)
+        self._client = self._create_client()
+        self._connections = [self._client]
+        self._idle_connections = asyncio.Queue()
+        self._idle_connections.put_nowait(self._client)
+
+    def _create_client(self):
+        if not self._framer is None:
+            client = AsyncModbusTcpClient(host=self._host, port=self._port, framer=self._framer, timeout=self._timeout, retries=self._retries) 
         else:
-            self._client = AsyncModbusTcpClient(host=host, port=port, timeout=timeout) 
+            client = AsyncModbusTcpClient(host=self._host, port=self._port, timeout=self._timeout, retries=self._retries) 
+        client.register(RegisterBufferResponse)
+        return client
 
     def close(self):
         """Disconnect client."""
-        self._client.close()
+        for client in self._connections:
+            client.close()
 
-    async def connect(self, retries = 3):
+    async def connect(self, retries = 3, client = None):
         """Connect client."""
+        if client is None:
+            client = self._client
         for attempts in range(retries): 
             if attempts > 0:
                 _LOGGER.debug(f"Connect retry attempt: {attempts}/{retries} connecting to: {self._host}:{self._port}")
                 await asyncio.sleep(.2)
-            connected = await self._client.connect()
+            connected = await client.connect()
             if connected:
                 break
 
-        if not self._client.connected:
+        if not client.connected:
             raise Exception(f"Failed to connect to {self._host}:{self._port} retries: {retries}")
-        _LOGGER.debug("successfully connected to %s:%s", self._client.comm_params.host, self._client.comm_params.port)
+        _LOGGER.debug("successfully connected to %s:%s", client.comm_params.host, client.comm_params.port)
         return True
     
-    async def _check_and_reconnect(self):
-        if not self._client.connected:
+    async def _check_and_reconnect(self, client = None):
+        if client is None:
+            client = self._client
+        if not client.connected:
             _LOGGER.warning("Modbus client is not connected, reconnecting...", exc_info=True)
-            return await self.connect()
-        return self._client.connected
+            return await self.connect(client=client)
+        return client.connected
+
+    async def _open_extra_connection(self):
+        """Open an additional connection, returns None when the device refuses it."""
+        client = self._create_client()
+        self._connections.append(client)
+        try:
+            if await client.connect():
+                _LOGGER.debug(f"opened connection {len(self._connections)}/{self._max_connections} to {self._host}:{self._port}")
+                return client
+        except Exception as e:
+            _LOGGER.debug(f"error opening additional connection to {self._host}:{self._port} {e}")
+        self._connections.remove(client)
+        client.close()
+        self._max_connections = len(self._connections)
+        _LOGGER.warning(f"Could not open additional connection to {self._host}:{self._port}, limited to {self._max_connections} connection(s)")
+        return None
+
+    @asynccontextmanager
+    async def _connection(self):
+        """Borrow a connection from the pool for one request."""
+        client = None
+        if self._idle_connections.empty() and len(self._connections) < self._max_connections:
+            client = await self._open_extra_connection()
+        if client is None:
+            client = await self._idle_connections.get()
+        try:
+            await self._check_and_reconnect(client)
+            yield client
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            # the reply of a cancelled request may still arrive, do not pair it
+            # with the next request on this connection
+            client = self._replace_connection(client)
+            raise
+        finally:
+            self._idle_connections.put_nowait(client)
+
+    def _replace_connection(self, client):
+        """Close ``client`` and return a new, not yet connected client in its place."""
+        _LOGGER.debug(f"replacing connection to {self._host}:{self._port} after a cancelled request")
+        client.close()
+        replacement = self._create_client()
+        self._connections[self._connections.index(client)] = replacement
+        if client is self._client:
+            self._client = replacement
+        return replacement
 
     @property
     def connected(self) -> bool:
@@ -89,70 +199,196 @@ class ExtModbusClient:
             raise ValueError(f"Value {value} failed validation ({comparison}{against})")
         return value
 
-    async def read_holding_registers(self, unit_id, address, count, retries = 3):
-        """Read holding registers."""
-        await self._check_and_reconnect()
+    async def read_holding_registers(self, unit_id, address, count, retries = 3, deadline = None, deferrable = False, log_errors = True):
+        """Read holding registers.
 
+        With a monotonic ``deadline`` the request times out when it is reached.
+        A ``deferrable`` request that is not expected to complete before the
+        deadline is not sent and raises RequestDeferred. Without ``log_errors``
+        an error response is expected and only logged at debug level.
+        """
+        async with self._connection() as client:
+            timeout = None
+            if not deadline is None:
+                timeout = deadline - time.monotonic()
+                expected = self.stats.latency.p95
+                if deferrable and (timeout <= 0 or (not expected is None and timeout < expected / 1000)):
+                    raise RequestDeferred(f"address: {address} count: {count} unit id: {unit_id}")
+                if timeout <= 0:
+                    # mandatory requests are sent once the budget is spent, limited by the client timeout
+                    timeout = None
+            start = time.monotonic()
+            data = await self._within(self._read_holding_registers(client, unit_id, address, count, retries, log_errors), timeout)
+            if not data is None:
+                self.stats.latency.add(time.monotonic() - start)
+            return data
+
+    async def _within(self, coro, timeout):
+        """Await ``coro``, raise TimeoutError when it did not complete within ``timeout`` seconds.
+
+        pymodbus turns the cancellation of a request into a ModbusIOException,
+        the timeout is raised here so that the connection gets replaced.
+        """
+        if timeout is None:
+            return await coro
+        task = asyncio.ensure_future(coro)
+        done, _ = await asyncio.wait((task,), timeout=timeout)
+        if not done:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise asyncio.TimeoutError()
+        return task.result()
+
+    async def _read_holding_registers(self, client, unit_id, address, count, retries, log_errors=True):
         for attempt in range(retries+1):
+            self.request_count += 1
+            if attempt > 0:
+                self.stats.retries += 1
             try:
-                data = await self._client.read_holding_registers(address=address, count=count, slave=unit_id)
+                data = await client.read_holding_registers(address=address, count=count, slave=unit_id)
             except ModbusIOException as e:
-                _LOGGER.error(f'error reading registers. IO error. connected: {self._client.connected} address: {address} count: {count} unit id: {unit_id}')
+                self.stats.record_request(READ_REQUEST_BYTES, error=True)
+                _LOGGER.error(f'error reading registers. IO error. connected: {client.connected} address: {address} count: {count} unit id: {unit_id}')
                 return None
             except ConnectionException as e:
-                _LOGGER.error(f'error reading registers. connection exception connected: {self._client.connected} address: {address} count: {count} unit id: {unit_id} {e} ')
+                self.stats.record_request(READ_REQUEST_BYTES, error=True)
+                _LOGGER.error(f'error reading registers. connection exception connected: {client.connected} address: {address} count: {count} unit id: {unit_id} {e} ')
                 return None
             except Exception as e:
-                _LOGGER.error(f'error reading registers. unknown error. connected {self._client.connected} address: {address} count: {count} unit id: {unit_id} type {type(e)} error {e} ')
+                self.stats.record_request(READ_REQUEST_BYTES, error=True)
+                _LOGGER.error(f'error reading registers. unknown error. connected {client.connected} address: {address} count: {count} unit id: {unit_id} type {type(e)} error {e} ')
                 return None
 
             if not data.isError():
+                self.stats.record_request(READ_REQUEST_BYTES, READ_RESPONSE_BYTES + 2 * count)
                 break
             else:
+                if isinstance(data, ExceptionResponse):
+                    self.stats.record_request(READ_REQUEST_BYTES, EXCEPTION_RESPONSE_BYTES, exception=True)
+                else:
+                    self.stats.record_request(READ_REQUEST_BYTES)
                 if isinstance(data,ModbusIOException):
-                    _LOGGER.debug(f"io error reading register retries: {attempt}/{retries} connected {self._client.connected} address: {address} count: {count} unit id: {unit_id}  error: {data} ")
+                    _LOGGER.debug(f"io error reading register retries: {attempt}/{retries} connected {client.connected} address: {address} count: {count} unit id: {unit_id}  error: {data} ")
                 elif isinstance(data, ExceptionResponse):
-                    _LOGGER.debug(f"Exception response reading register retries: {attempt}/{retries} connected {self._client.connected} address: {address} count: {count} unit id: {unit_id}  {data}")
+                    _LOGGER.debug(f"Exception response reading register retries: {attempt}/{retries} connected {client.connected} address: {address} count: {count} unit id: {unit_id}  {data}")
                 else:
-                    _LOGGER.debug(f"Unknown data response error reading register retries: {attempt}/{retries} connected {self._client.connected} address: {address} count: {count} unit id: {unit_id}  {data}")
-                await asyncio.sleep(.2) 
+                    _LOGGER.debug(f"Unknown data response error reading register retries: {attempt}/{retries} connected {client.connected} address: {address} count: {count} unit id: {unit_id}  {data}")
+                if attempt < retries:
+                    await asyncio.sleep(.2) 
 
         if data.isError():
-            _LOGGER.error(f"error reading registers. retries: {attempt}/{retries} connected {self._client.connected} register: {address} count: {count} unit id: {unit_id} retries {retries} error: {data} ")
+            self.stats.errors += 1
+            (_LOGGER.error if log_errors else _LOGGER.debug)(f"error reading registers. retries: {attempt}/{retries} connected {client.connected} register: {address} count: {count} unit id: {unit_id} retries {retries} error: {data} ")
             return None
 
         return data
 
-    async def get_registers(self, unit_id, address, count, retries = 0):
-        data = await self.read_holding_registers(unit_id=unit_id, address=address, count=count)
+    async def get_registers(self, unit_id, address, count, retries = 0, deadline = None, deferrable = False):
+        data = await self.read_holding_registers(unit_id=unit_id, address=address, count=count, deadline=deadline, deferrable=deferrable)
+        if data is None:
+            return None
         if data.isError():
             if isinstance(data,ModbusIOException):
                 if retries < 1:
                     _LOGGER.debug(f"IO Error: {data}. Retrying...")
-                    return await self.get_registers(address=address, count=count, retries = retries + 1)
+                    return await self.get_registers(unit_id=unit_id, address=address, count=count, retries = retries + 1, deadline=deadline, deferrable=deferrable)
                 else:
                     _LOGGER.error(f"error reading register: {address} count: {count} unit id: {unit_id} error: {data} ")
             else:
                 _LOGGER.error(f"error reading register: {address} count: {count} unit id: {unit_id} error: {data} ")
             return None
-        return data.registers
+        return data.register_buffer
+
+    async def read_blocks(self, unit_id, blocks, deadline=None, deferrable=()):
+        """Read register blocks of one unit with the fewest requests.
+
+        The requests are issued concurrently within the connection pool, those
+        that only cover blocks named in ``deferrable`` after the others. Every
+        request times out at the monotonic ``deadline``, deferrable requests
+        are only sent while they are expected to complete before it.
+        Returns the registers by block name, None for blocks that could not be
+        read. Deferred blocks are left out.
+        """
+        result = {}
+        deferred = []
+
+        async def read(address, count, optional):
+            try:
+                return await self.get_registers(unit_id=unit_id, address=address, count=count, deadline=deadline, deferrable=optional)
+            except asyncio.TimeoutError:
+                if optional:
+                    raise RequestDeferred(f"address: {address} count: {count} unit id: {unit_id} timed out")
+                _LOGGER.error(f"timeout reading address: {address} count: {count} unit id: {unit_id}")
+                return None
+
+        async def read_request(request, optional):
+            try:
+                start = time.monotonic()
+                regs = await read(request.address, request.count, optional)
+                if regs is None and len(request.blocks) > 1:
+                    _LOGGER.debug(f"merged read failed {request}, reading blocks separately")
+                    for block in request.blocks:
+                        start = time.monotonic()
+                        result[block.name] = await read(block.address, block.count, optional)
+                        if not result[block.name] is None:
+                            self.stats.record_block((unit_id, block.name), time.monotonic() - start)
+                    return
+            except RequestDeferred:
+                deferred.extend(block.name for block in request.blocks if not block.name in result)
+                return
+            except Exception as e:
+                _LOGGER.error(f"error reading {request} unit id: {unit_id} {e}")
+                regs = None
+            for block in request.blocks:
+                result[block.name] = None if regs is None else request.slice(regs, block)
+                if not regs is None:
+                    self.stats.record_block((unit_id, block.name), time.monotonic() - start)
+
+        requests = plan_reads(blocks)
+        optional = [all(block.name in deferrable for block in request.blocks) for request in requests]
+        # connections are handed out in order, mandatory requests go first
+        order = sorted(range(len(requests)), key=lambda i: optional[i])
+        await asyncio.gather(*(read_request(requests[i], optional[i]) for i in order))
+        if deferred:
+            _LOGGER.debug(f"cycle deadline reached, deferred {deferred} unit id: {unit_id}")
+        return result
+
+    async def read_many(self, reads, deadline=None, deferrable=()):
+        """Read blocks of several units concurrently.
+
+        ``reads`` is a list of (unit_id, blocks), returns a list of read_blocks results.
+        """
+        return await asyncio.gather(*(self.read_blocks(unit_id, blocks, deadline, deferrable) for unit_id, blocks in reads))
 
     async def write_registers(self, unit_id, address, payload):
         """Write registers."""
-        await self._check_and_reconnect()
+        async with self._connection() as client:
+            return await self._write_registers(client, unit_id, address, payload)
+
+    async def _write_registers(self, client, unit_id, address, payload):
         #_LOGGER.debug(f"write registers a: {address} p: {payload} unit_id: {unit_id}")
 
+        self.request_count += 1
         try:
-            result = await self._client.write_registers(address=address, values=payload, slave=unit_id)
+            result = await client.write_registers(address=address, values=payload, slave=unit_id)
         except ModbusIOException as e:
-            raise Exception(f'write_registers: IO error {self._client.connected} {e.fcode} {e}')
+            self.stats.record_request(WRITE_REQUEST_BYTES + 2 * len(payload), error=True)
+            raise Exception(f'write_registers: IO error {client.connected} {e.fcode} {e}')
         except ConnectionException as e:
-            raise Exception(f'write_registers: no connection {self._client.connected} {e} ')
+            self.stats.record_request(WRITE_REQUEST_BYTES + 2 * len(payload), error=True)
+            raise Exception(f'write_registers: no connection {client.connected} {e} ')
         except Exception as e:
-            raise Exception(f'write_registers: unknown error {self._client.connected} {type(e)} {e} ')
+            self.stats.record_request(WRITE_REQUEST_BYTES + 2 * len(payload), error=True)
+            raise Exception(f'write_registers: unknown error {client.connected} {type(e)} {e} ')
 
+        if isinstance(result, ExceptionResponse):
+            self.stats.record_request(WRITE_REQUEST_BYTES + 2 * len(payload), EXCEPTION_RESPONSE_BYTES, exception=True, error=True)
+        elif result.isError():
+            self.stats.record_request(WRITE_REQUEST_BYTES + 2 * len(payload), error=True)
+        else:
+            self.stats.record_request(WRITE_REQUEST_BYTES + 2 * len(payload), WRITE_RESPONSE_BYTES)
         if result.isError():
-            raise Exception(f'write_registers: data error {self._client.connected} {type(result)} {result} ')
+            raise Exception(f'write_registers: data error {client.connected} {type(result)} {result} ')
     
         #_LOGGER.debug(f'write result {type(result)} {result}')
         return result
@@ -282,3 +518,45 @@ class ExtModbusClient:
 
     def get_string_from_registers(self, regs):
         return self.strip_escapes(self._client.convert_from_registers(regs, data_type = self._client.DATATYPE.STRING))
+
+    def decode_block(self, block: RegisterBlock, regs, prefix='', scale_factors=None):
+        """Decode a register block in one pass.
+
+        ``scale_factors`` provides raw values of scale factors that are not part of ``regs``.
+        Returns the raw field values and the converted values keyed by prefix + field key.
+        """
+        raw = block.unpack(registers_to_bytes(regs))
+        if scale_factors:
+            for name, sf in scale_factors.items():
+                raw.setdefault(name, sf)
+        values = {}
+        for field in block.published:
+            values[prefix + field.key] = self.convert_field(field, raw)
+        return raw, values
+
+    def decode_block_into(self, block: RegisterBlock, regs, buffer, fields, scale_factors=None):
+        """Decode a register block and write the converted values of ``fields`` to ``buffer``.
+
+        ``fields`` holds (field, slot) pairs of the published fields to convert,
+        the other fields are only unpacked. Returns the raw field values.
+        """
+        raw = block.unpack(registers_to_bytes(regs))
+        if scale_factors:
+            for name, sf in scale_factors.items():
+                raw.setdefault(name, sf)
+        for field, slot in fields:
+            buffer.set_slot(slot, self.convert_field(field, raw))
+        return raw
+
+    def convert_field(self, field: RegisterField, raw: dict):
+        value = raw[field.name]
+        if field.type == 'string':
+            return self.strip_escapes(value.rstrip(b'\x00').decode('utf-8'))
+        if not field.enum is None:
+            return field.enum.get(value)
+        if not field.bitmask is None:
+            return self.bitmask_to_string(value, field.bitmask, default=field.default, bits=field.bits)
+        if not field.sf is None:
+            sf = raw[field.sf] if isinstance(field.sf, str) else field.sf
+            return self.calculate_value(value, sf, field.digits, field.lower_bound, field.upper_bound)
+        return value
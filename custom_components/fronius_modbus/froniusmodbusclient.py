@@ -4,32 +4,41 @@
 
 import asyncio
 import logging
+import time
 from typing import Optional, Literal
 from .extmodbusclient import ExtModbusClient
-import requests
+from .readplanner import MAX_READ_COUNT
+from .batchdecode import decode_batch
+from .snapshot import DataBuffer
 
 from .froniusmodbusclient_const import (
-    INVERTER_ADDRESS,
-    MPPT_ADDRESS,
-    COMMON_ADDRESS,
-    NAMEPLATE_ADDRESS,
-    STORAGE_ADDRESS,
-    METER_ADDRESS,
-    STORAGE_CONTROL_MODE_ADDRESS,
-    MINIMUM_RESERVE_ADDRESS,
-    DISCHARGE_RATE_ADDRESS,
-    CHARGE_RATE_ADDRESS,    
     STORAGE_CONTROL_MODE,
-    CHARGE_STATUS,
-    CHARGE_GRID_STATUS,
     STORAGE_EXT_CONTROL_MODE,
-    FRONIUS_INVERTER_STATUS,
-    CONNECTION_STATUS_CONDENSED,
-    ECP_CONNECTION_STATUS,
-    INVERTER_CONTROLS,
-    INVERTER_EVENTS,
-    CONTROL_STATUS,
+    STORAGE_WRITABLE_FIELDS,
+    CALIBRATION_DISCHARGE,
+    CALIBRATION_AUTO,
     GRID_STATUS,
+    INVERTER_SLEEP_STATES,
+    SUNSPEC_ADDRESS,
+    SUNSPEC_HEADER,
+    DEVICE_INFO_BLOCK,
+    SERIAL_BLOCK,
+    INVERTER_BLOCK,
+    NAMEPLATE_BLOCK,
+    SETTINGS_BLOCK,
+    STATUS_BLOCK,
+    CONTROLS_BLOCK,
+    MPPT_BLOCK,
+    STORAGE_BLOCK,
+    METER_BLOCK,
+    DEFAULT_BLOCKS,
+    MODEL_CHAIN_ADDRESS,
+    END_MODEL_ID,
+    MAX_MODELS,
+    FLOAT_MODEL_IDS,
+    MODEL_BLOCKS,
+    mppt_block,
+    mppt_modules,
 #    INVERTER_STATUS,
 #    CONNECTION_STATUS,
 )
@@ -39,9 +48,21 @@ _LOGGER = logging.getLogger(__name__)
 class FroniusModbusClient(ExtModbusClient):
     """Hub for BYD Battery Box Interface"""
 
-    def __init__(self, host: str, port: int, inverter_unit_id: int, meter_unit_ids, timeout: int) -> None:
+    # Maximum age in seconds of cached scale factors before they are read again
+    SCALE_FACTOR_MAX_AGE = 3600
+    # Seconds single writes are used after the inverter rejected a multi register write
+    STORAGE_MULTI_WRITE_RETRY = 3600
+    # Data keys decoded without a consuming entity, they drive the polling profile and storage control
+    INTERNAL_KEYS = ('statusvendor', 'soc')
+    # Data keys needed to compute derived values
+    DERIVED_INPUTS = {
+        'load': ('acpower', 'm1_power'),
+        'grid_status': ('line_frequency', 'm1_power', 'm1_line_frequency'),
+    }
+
+    def __init__(self, host: str, port: int, inverter_unit_id: int, meter_unit_ids, timeout: int, max_connections: int = 1, retries: int = 3) -> None:
         """Init hub."""
-        super(FroniusModbusClient, self).__init__(host = host, port = port, unit_id=inverter_unit_id, timeout=timeout)
+        super(FroniusModbusClient, self).__init__(host = host, port = port, unit_id=inverter_unit_id, timeout=timeout, max_connections=max_connections, retries=retries)
 
         self.initialized = False
 
@@ -61,12 +82,29 @@ class FroniusModbusClient(ExtModbusClient):
         self._inverter_frequency_lower_bound = self._grid_frequency - 5
         self._inverter_frequency_upper_bound = self._grid_frequency + 5
 
-        self.data = {}
+        self.data = DataBuffer()
+        self._field_slots = {}
+        self._mppt_slots = {}
+        # data keys decoded by the poll, None to decode all fields
+        self._consumed = None
+        self._scale_factors = {}
+        # SunSpec models by unit id as [model id, data address, length]
+        self._models = {}
+        # blocks located by the model chain by (unit id, block name)
+        self._blocks = {}
+        # last read registers of the storage block as (address, registers)
+        self._storage_image = None
+        self.skipped_writes = 0
+        # monotonic time until which multi register writes of storage controls are not used
+        self._storage_multi_write_retry = 0
+        # calibration step requested by the last storage read, run by the hub
+        self.calibration_step = None
 
     async def init_data(self):
         await self.connect()
         try: 
-            result = await self.read_device_info_data(prefix='i_', unit_id=self._inverter_unit_id)
+            regs = await self.read_blocks(self._inverter_unit_id, [DEVICE_INFO_BLOCK])
+            result = self.decode_device_info_data(regs.get(DEVICE_INFO_BLOCK.name), prefix='i_', unit_id=self._inverter_unit_id)
         except Exception as e:
             _LOGGER.error(f"Error reading inverter info {self._host}:{self._port} unit id: {self._inverter_unit_id}", exc_info=True)
             raise Exception(f"Error reading inverter info unit id: {self._inverter_unit_id}")
@@ -74,11 +112,17 @@ class FroniusModbusClient(ExtModbusClient):
             _LOGGER.error(f"Empty inverter info {self._host}:{self._port} unit id: {self._inverter_unit_id}")
             raise Exception(f"Empty inverter info unit id: {self._inverter_unit_id}")
 
-        try:
-            if await self.read_mppt_data():
-                self.mppt_configured = True
-        except Exception as e:
-            _LOGGER.warning(f"Error while checking mppt data {e}")
+        await self.discover_models(self._inverter_unit_id)
+
+        blocks = [self.block(NAMEPLATE_BLOCK.name)]
+        if self.has_block(MPPT_BLOCK.name):
+            blocks.append(self.block(MPPT_BLOCK.name))
+        regs = await self.read_blocks(self._inverter_unit_id, [self.block_layout(block, self._inverter_unit_id) for block in blocks])
+        results = self.decode_inverter_blocks(blocks, regs)
+        if results.get(NAMEPLATE_BLOCK.name) == False:
+            _LOGGER.error(f"Error reading nameplate data")
+        if results.get(MPPT_BLOCK.name):
+            self.mppt_configured = True
 
         if len(self._meter_unit_ids)>5:
             _LOGGER.error(f"Too many meters configured, max 5")
@@ -86,11 +130,13 @@ class FroniusModbusClient(ExtModbusClient):
         #elif len(self._meter_unit_ids)>0:
         #    self.meter_configured = True
 
+        meter_regs = await self.read_many([(unit_id, [DEVICE_INFO_BLOCK]) for unit_id in self._meter_unit_ids])
         for i in range(len(self._meter_unit_ids)):
             unit_id = self._meter_unit_ids[i]
             try:
-                result = await self.read_device_info_data(prefix=f'm{i+1}_', unit_id=unit_id)
+                result = self.decode_device_info_data(meter_regs[i].get(DEVICE_INFO_BLOCK.name), prefix=f'm{i+1}_', unit_id=unit_id)
                 if result:
+                    await self.discover_models(unit_id)
                     if not self.meter_configured:
                         self.meter_configured = True
                 else:
@@ -98,311 +144,452 @@ class FroniusModbusClient(ExtModbusClient):
             except Exception as e:
                 _LOGGER.error(f"Error reading meter info unit id: {unit_id}", exc_info=True)
 
-        if await self.read_inverter_nameplate_data() == False:
-            _LOGGER.error(f"Error reading nameplate data", exc_info=True)
-
         _LOGGER.debug(f"Init done. data: {self.data}")
 
         return True
     
-    def get_json_storage_info(self):
-        self.data['s_manufacturer'] = None
-        self.data['s_model'] = 'Battery Storage'
-        self.data['s_serial'] = None
+    async def probe(self, unit_ids):
+        """Read the SunSpec header and common block of each unit over one connection and close it.
+
+        The reads run concurrently and are bounded by the client timeout.
+        Returns by unit id a dict with ``reachable``, ``sunspec``, the round trip
+        time ``rtt`` in ms and the device info keys.
+        """
+        results = {unit_id: {'reachable': False, 'sunspec': False, 'rtt': None} for unit_id in unit_ids}
+        count = len(SUNSPEC_HEADER) + DEVICE_INFO_BLOCK.count
+
+        async def probe_unit(unit_id):
+            start = time.monotonic()
+            data = await self.read_holding_registers(unit_id=unit_id, address=SUNSPEC_ADDRESS, count=count, retries=0)
+            if data is None or data.isError() or len(data.registers) != count:
+                _LOGGER.warning(f"Probe of unit id: {unit_id} failed {data}")
+                return
+            result = results[unit_id]
+            result['reachable'] = True
+            result['rtt'] = round((time.monotonic() - start) * 1000)
+            result['sunspec'] = data.registers[:len(SUNSPEC_HEADER)] == SUNSPEC_HEADER
+            if result['sunspec']:
+                raw, values = self.decode_block(DEVICE_INFO_BLOCK, data.registers[len(SUNSPEC_HEADER):])
+                result.update(values)
 
-        url = f"http://{self._host}/solar_api/v1/GetStorageRealtimeData.cgi"
+        try:
+            await self.connect(retries=1)
+            await asyncio.wait_for(asyncio.gather(*(probe_unit(unit_id) for unit_id in unit_ids)), self._timeout)
+        except asyncio.TimeoutError:
+            _LOGGER.error(f"Probe of {self._host}:{self._port} timed out after {self._timeout}s")
+        except Exception as e:
+            _LOGGER.error(f"Probe of {self._host}:{self._port} failed {e}")
+        finally:
+            self.close()
+        return results
 
+    async def check_health(self) -> bool:
+        """Read the SunSpec marker of the inverter with a single request, True when it answers."""
         try:
-            response = requests.get(url)
+            data = await self.read_holding_registers(unit_id=self._inverter_unit_id, address=SUNSPEC_ADDRESS, count=2, retries=0,
+                deadline=time.monotonic() + self._timeout)
+        except Exception as e:
+            _LOGGER.debug(f"Health probe of {self._host}:{self._port} failed {type(e)} {e}")
+            return False
+        return not data is None and data.registers == SUNSPEC_HEADER[:2]
+
+    async def discover_models(self, unit_id):
+        """Walk the SunSpec model chain of a unit and locate its blocks.
+
+        The chain is read in requests of up to MAX_READ_COUNT registers, a model
+        header beyond the registers read starts the next request. Requests end
+        at the end of a known chain. When a device rejects a request past the
+        end of its registers the remaining headers are read one at a time.
+        Blocks keep their default location when the chain cannot be read.
+        """
+        known = self._models.get(unit_id)
+        end = known[-1][1] + known[-1][2] + 2 if known else None
+        models = []
+        address = MODEL_CHAIN_ADDRESS
+        chunk_address = address
+        chunk = []
+        count = MAX_READ_COUNT
+        for _ in range(MAX_MODELS):
+            if address + 2 > chunk_address + len(chunk):
+                if not end is None and address + 2 <= end:
+                    count = min(MAX_READ_COUNT, end - address)
+                chunk_address = address
+                chunk = await self.chain_registers(unit_id, address, count)
+                if chunk is None and count > 2:
+                    _LOGGER.debug(f"Model chain read unit id: {unit_id} address: {address} count: {count} rejected, reading model headers")
+                    count = 2
+                    chunk = await self.chain_registers(unit_id, address, count)
+                if chunk is None:
+                    _LOGGER.warning(f"Error reading SunSpec model chain unit id: {unit_id} address: {address}, using default addresses")
+                    return False
+            model_id = chunk[address - chunk_address]
+            length = chunk[address - chunk_address + 1]
+            if model_id == END_MODEL_ID:
+                break
+            if model_id in FLOAT_MODEL_IDS:
+                _LOGGER.warning(f"SunSpec float model {model_id} unit id: {unit_id}, only int+SF models are decoded. Switch the inverter to int+SF in the Modbus settings")
+            models.append([model_id, address + 2, length])
+            address += 2 + length
+        _LOGGER.debug(f"SunSpec models unit id: {unit_id} {models}")
+        self.apply_models(unit_id, models)
+        return True
 
-            if response.status_code == 200:
-                data = response.json()
+    async def chain_registers(self, unit_id, address, count):
+        """Read registers of the model chain without retries, None when the device rejects the request."""
+        data = await self.read_holding_registers(unit_id=unit_id, address=address, count=count, retries=0, log_errors=False)
+        if data is None:
+            return None
+        return data.register_buffer
+
+    def apply_models(self, unit_id, models):
+        """Locate the blocks of ``unit_id`` from its model chain."""
+        for key in [key for key in self._blocks if key[0] == unit_id]:
+            del self._blocks[key]
+        self._models[unit_id] = models
+        for model_id, address, length in models:
+            name = MODEL_BLOCKS.get(model_id)
+            if name is None:
+                continue
+            if name == MPPT_BLOCK.name:
+                block = mppt_block(mppt_modules(length), address)
             else:
-                _LOGGER.error(f"Error storage json data {response.status_code}")
-                return
+                block = DEFAULT_BLOCKS[name].relocated(address, length)
+            self._blocks[(unit_id, name)] = block
+        self.invalidate_scale_factors(unit_id)
+
+    def block(self, name, unit_id=None):
+        """Return the block ``name`` of a unit, located by its model chain when discovered."""
+        if unit_id is None:
+            unit_id = self._inverter_unit_id
+        return self._blocks.get((unit_id, name), DEFAULT_BLOCKS[name])
+
+    def has_block(self, name, unit_id=None):
+        """Return False when the model chain of the unit does not contain the block."""
+        if unit_id is None:
+            unit_id = self._inverter_unit_id
+        if not unit_id in self._models:
+            return True
+        return (unit_id, name) in self._blocks
+
+    # Attributes of the client that are derived from static device data
+    STATIC_ATTRIBUTES = ['meter_configured', 'mppt_configured', 'storage_configured', 'max_charge_rate_w', 'max_discharge_rate_w']
+
+    def static_data_keys(self):
+        """Return the data keys that only change with the device or its firmware."""
+        keys = [f'i_{field.key}' for field in DEVICE_INFO_BLOCK.published]
+        for i in range(len(self._meter_unit_ids)):
+            keys += [f'm{i+1}_{field.key}' for field in DEVICE_INFO_BLOCK.published]
+        keys += [field.key for field in NAMEPLATE_BLOCK.published]
+        keys += ['s_manufacturer', 's_model', 's_serial']
+        return keys
+
+    def get_static_data(self):
+        """Return device identity, nameplate data and configuration detected by init_data."""
+        return {
+            'unit_ids': [self._inverter_unit_id] + list(self._meter_unit_ids),
+            'data': {key: self.data[key] for key in self.static_data_keys() if key in self.data},
+            'attributes': {name: getattr(self, name) for name in self.STATIC_ATTRIBUTES},
+            'models': {str(unit_id): models for unit_id, models in self._models.items()},
+        }
+
+    def restore_static_data(self, static) -> bool:
+        """Restore data returned by get_static_data, returns False when it does not match the configuration."""
+        if static.get('unit_ids') != [self._inverter_unit_id] + list(self._meter_unit_ids):
+            return False
+        if static['data'].get('i_serial') is None:
+            return False
+        self.data.update(static['data'])
+        for name in self.STATIC_ATTRIBUTES:
+            if name in static['attributes']:
+                setattr(self, name, static['attributes'][name])
+        for unit_id, models in static.get('models', {}).items():
+            self.apply_models(int(unit_id), models)
+        return True
 
+    @property
+    def inverter_poll_blocks(self):
+        """Register blocks of the inverter unit that are polled every cycle."""
+        names = [INVERTER_BLOCK.name, SETTINGS_BLOCK.name, STATUS_BLOCK.name, CONTROLS_BLOCK.name]
+        if self.mppt_configured:
+            names.append(MPPT_BLOCK.name)
+        if self.storage_configured:
+            names.append(STORAGE_BLOCK.name)
+        return [self.block(name) for name in names if self.has_block(name) and self.consumes(self.block(name))]
+
+    @property
+    def sleep_poll_blocks(self):
+        """Register blocks of the inverter unit that are polled while the inverter sleeps."""
+        # the inverter block holds the operating state that ends the sleep profile
+        names = [INVERTER_BLOCK.name]
+        if self.storage_configured:
+            names.append(STORAGE_BLOCK.name)
+        return [self.block(name) for name in names if self.has_block(name)]
+
+    @property
+    def sleeping(self) -> bool:
+        """True when the last read operating state of the inverter is off or sleeping."""
+        return self.data.get('statusvendor_id') in INVERTER_SLEEP_STATES
+
+    @property
+    def poll_meters(self):
+        """Prefix and unit id of the meters that are polled."""
+        if not self.meter_configured:
+            return []
+        return [(f'm{i+1}_', unit_id) for i, unit_id in enumerate(self._meter_unit_ids)
+                if self.consumes(self.block(METER_BLOCK.name, unit_id), f'm{i+1}_')]
+
+    async def read_poll_data(self, blocks, read_meters=True, deadline=None, deferrable=()):
+        """Read inverter blocks and meters concurrently, then decode them in order.
+
+        Blocks named in ``deferrable`` are only read until the monotonic ``deadline``.
+        Returns the decode result by block name and by meter prefix, deferred
+        blocks are left out.
+        """
+        reads = [(self._inverter_unit_id, [self.block_layout(block, self._inverter_unit_id) for block in blocks])]
+        meters = self.poll_meters if read_meters else []
+        for _, unit_id in meters:
+            reads.append((unit_id, [self.block_layout(self.block(METER_BLOCK.name, unit_id), unit_id)]))
+
+        regs = await self.read_many(reads, deadline, deferrable)
+
+        results = self.decode_inverter_blocks(blocks, regs[0])
+        for i, (meter_prefix, unit_id) in enumerate(meters):
             try:
-                bodydata = data['Body']['Data']
+                results[meter_prefix] = self.decode_meter_data(regs[i + 1].get(METER_BLOCK.name), meter_prefix, unit_id)
             except Exception as e:
-                _LOGGER.error(f"Error no body data in json data: {data}")
-                return
-            
-            for c in bodydata.keys():
-                try:
-                    details = bodydata[c]['Controller']['Details']
-                except Exception as e:
-                    _LOGGER.error(f"Error no details in json bodydata: {bodydata}")
-                    return
-
-                self.data['s_manufacturer'] = details['Manufacturer']
-                self.data['s_model'] = details['Model']
-                self.data['s_serial'] = str(details['Serial']).strip()
-                break
- 
-        except Exception as e:
-            _LOGGER.error(f"Error storage json data {url} {e}", exc_info=True)
-
-    async def read_device_info_data(self, prefix, unit_id):
-        regs = await self.get_registers(unit_id=unit_id, address=COMMON_ADDRESS, count=65)
+                _LOGGER.error(f"Error reading meter data {unit_id}.", exc_info=True)
+                results[meter_prefix] = False
+        return results
+
+    def decode_inverter_blocks(self, blocks, regs):
+        decoders = {
+            INVERTER_BLOCK.name: self.decode_inverter_data,
+            NAMEPLATE_BLOCK.name: self.decode_inverter_nameplate_data,
+            SETTINGS_BLOCK.name: self.decode_inverter_model_settings_data,
+            STATUS_BLOCK.name: self.decode_inverter_status_data,
+            CONTROLS_BLOCK.name: self.decode_inverter_controls_data,
+            MPPT_BLOCK.name: self.decode_mppt_data,
+            STORAGE_BLOCK.name: self.decode_inverter_storage_data,
+        }
+        results = {}
+        for block in blocks:
+            if not block.name in regs:
+                continue
+            try:
+                results[block.name] = decoders[block.name](regs.get(block.name))
+            except Exception as e:
+                _LOGGER.exception(f"Error decoding {block.name} data", exc_info=True)
+                results[block.name] = False
+        return results
+
+    def block_layout(self, block, unit_id):
+        """Return the part of a block to read, leaving out scale factors that are cached."""
+        cached = self._scale_factors.get((unit_id, block.name))
+        if not cached is None and time.monotonic() - cached[0] < self.SCALE_FACTOR_MAX_AGE:
+            return block.trimmed(scale_factors=False)
+        return block.trimmed()
+
+    def layout_of(self, block, regs):
+        """Return the layout returned by block_layout that ``regs`` were read for."""
+        layout = block.trimmed()
+        if len(regs) != layout.count:
+            layout = block.trimmed(scale_factors=False)
+        return layout
+
+    def set_consumed_keys(self, keys):
+        """Decode and poll only the fields of the data ``keys`` and those needed internally, all fields with None."""
+        if not keys is None:
+            keys = set(keys)
+            keys.update(self.INTERNAL_KEYS)
+            for key, inputs in self.DERIVED_INPUTS.items():
+                if key in keys:
+                    keys.update(inputs)
+            if 'pv_power' in keys or 'storage_power' in keys:
+                modules = mppt_modules(self.block(MPPT_BLOCK.name).count)
+                keys.update(f'mppt{module}_power' for module in range(1, modules + 1))
+        if keys != self._consumed:
+            self._consumed = keys
+            self._field_slots.clear()
+
+    def consumes(self, block, prefix=''):
+        """True when any published field of ``block`` is decoded."""
+        return len(self.field_slots(block, prefix)) > 0
+
+    def field_slots(self, block, prefix=''):
+        """Return the decoded fields of ``block`` with their data slots, assigned once per block and prefix."""
+        fields = self._field_slots.get((block, prefix))
+        if fields is None:
+            fields = self._field_slots[(block, prefix)] = tuple(
+                (field, self.data.index.slot(prefix + field.key)) for field in block.published
+                if self._consumed is None or prefix + field.key in self._consumed)
+        return fields
+
+    def decode_scaled_block(self, block, regs, unit_id, prefix='', store=False):
+        """Decode registers read for block_layout and maintain the scale factor cache.
+
+        With ``store`` the values are written to the data slots directly and
+        None is returned instead of the values.
+        """
+        key = (unit_id, block.name)
+        layout = self.layout_of(block, regs)
+        cached = self._scale_factors.get(key)
+        scale_factors = None if cached is None else cached[1]
+        if store:
+            raw = self.decode_block_into(layout, regs, self.data, self.field_slots(layout, prefix), scale_factors)
+            values = None
+        else:
+            raw, values = self.decode_block(layout, regs, prefix, scale_factors)
+
+        if len(layout.scale_factors) == len(block.scale_factors):
+            scale_factors = {name: raw[name] for name in block.scale_factors}
+            if not cached is None and cached[1] != scale_factors:
+                _LOGGER.info(f"Scale factors of {block.name} unit id: {unit_id} changed from {cached[1]} to {scale_factors}")
+            self._scale_factors[key] = (time.monotonic(), scale_factors)
+        return raw, values
+
+    def decode_batch(self, name, rows, unit_id=None, use_numpy=None) -> dict:
+        """Decode the block ``name`` read from many units with the layout of ``unit_id``.
+
+        ``rows`` hold the registers of the whole block for each unit, for example
+        an N x 103 uint16 array of meter blocks. Returns a column by field key,
+        see batchdecode.decode_batch.
+        """
+        return decode_batch(self.block(name, unit_id), rows, self.convert_field, use_numpy)
+
+    def invalidate_scale_factors(self, unit_id):
+        """Drop cached scale factors so they are read with the next poll."""
+        for key in [key for key in self._scale_factors if key[0] == unit_id]:
+            del self._scale_factors[key]
+
+    def decode_device_info_data(self, regs, prefix, unit_id):
         if regs is None:
             return False
 
-        manufacturer = self.get_string_from_registers(regs[0:16])
-        model = self.get_string_from_registers(regs[16:32])
-        options = self.get_string_from_registers(regs[32:40])
-        sw_version = self.get_string_from_registers(regs[40:48])
-        serial =  self.get_string_from_registers(regs[48:64])
-        modbus_id = self._client.convert_from_registers(regs[64:65], data_type = self._client.DATATYPE.UINT16)
-
-        self.data[prefix + 'manufacturer'] = manufacturer
-        self.data[prefix + 'model'] = model
-        self.data[prefix + 'options'] = options
-        self.data[prefix + 'sw_version'] = sw_version
-        self.data[prefix + 'serial'] = serial
-        self.data[prefix + 'unit_id'] = modbus_id
+        raw, values = self.decode_block(DEVICE_INFO_BLOCK, regs, prefix)
+        sw_version = self.data.get(prefix + 'sw_version')
+        if not sw_version is None and sw_version != values[prefix + 'sw_version']:
+            _LOGGER.info(f"Firmware of unit id: {unit_id} changed from {sw_version} to {values[prefix + 'sw_version']}")
+            self.invalidate_scale_factors(unit_id)
+        self.data.update(values)
 
         return True
 
-    async def read_inverter_data(self):
-        regs = await self.get_registers(unit_id=self._inverter_unit_id, address=INVERTER_ADDRESS, count=50)
+    async def read_serial(self, unit_id=None):
+        """Read only the serial number of the common block, None when it cannot be read."""
+        if unit_id is None:
+            unit_id = self._inverter_unit_id
+        regs = (await self.read_blocks(unit_id, [SERIAL_BLOCK])).get(SERIAL_BLOCK.name)
+        if regs is None:
+            return None
+        _, values = self.decode_block(SERIAL_BLOCK, regs)
+        return values['serial']
+
+    def decode_inverter_data(self, regs):
         if regs is None:
             return False
 
-        PPVphAB = self._client.convert_from_registers(regs[5:6], data_type = self._client.DATATYPE.UINT16)
-        PPVphBC = self._client.convert_from_registers(regs[6:7], data_type = self._client.DATATYPE.UINT16)
-        PPVphCA = self._client.convert_from_registers(regs[7:8], data_type = self._client.DATATYPE.UINT16)
-        PhVphA = self._client.convert_from_registers(regs[8:9], data_type = self._client.DATATYPE.UINT16)
-        PhVphB = self._client.convert_from_registers(regs[9:10], data_type = self._client.DATATYPE.UINT16)
-        PhVphC = self._client.convert_from_registers(regs[10:11], data_type = self._client.DATATYPE.UINT16)
-        V_SF = self._client.convert_from_registers(regs[11:12], data_type = self._client.DATATYPE.INT16)
-
-        W = self._client.convert_from_registers(regs[12:13], data_type = self._client.DATATYPE.INT16)
-        W_SF = self._client.convert_from_registers(regs[13:14], data_type = self._client.DATATYPE.INT16)
-        Hz = self._client.convert_from_registers(regs[14:15], data_type = self._client.DATATYPE.INT16)
-        Hz_SF = self._client.convert_from_registers(regs[15:16], data_type = self._client.DATATYPE.INT16)
-
-        WH = self._client.convert_from_registers(regs[22:24], data_type = self._client.DATATYPE.UINT32)
-        WH_SF = self._client.convert_from_registers(regs[24:25], data_type = self._client.DATATYPE.INT16)
-
-        TmpCab = self._client.convert_from_registers(regs[31:32], data_type = self._client.DATATYPE.INT16)
-        Tmp_SF = self._client.convert_from_registers(regs[35:36], data_type = self._client.DATATYPE.INT16)
-        #St = self._client.convert_from_registers(regs[36:37], data_type = self._client.DATATYPE.UINT16)
-        StVnd = self._client.convert_from_registers(regs[37:38], data_type = self._client.DATATYPE.UINT16)
-        #EvtVnd1 = self._client.convert_from_registers(regs[42:44], data_type = self._client.DATATYPE.UINT32)
-        EvtVnd2 = self._client.convert_from_registers(regs[44:46], data_type = self._client.DATATYPE.UINT32)
-
-        self.data['PPVphAB'] = self.calculate_value(PPVphAB, V_SF)
-        self.data['PPVphBC'] = self.calculate_value(PPVphBC, V_SF)
-        self.data['PPVphCA'] = self.calculate_value(PPVphCA, V_SF)
-        self.data['PhVphA'] = self.calculate_value(PhVphA, V_SF)
-        self.data['PhVphB'] = self.calculate_value(PhVphB, V_SF)
-        self.data['PhVphC'] = self.calculate_value(PhVphC, V_SF)
-        self.data['tempcab'] = self.calculate_value(TmpCab, Tmp_SF)
-        self.data["acpower"] = self.calculate_value(W, W_SF, 2, -50000, 50000)
-        self.data["line_frequency"] = self.calculate_value(Hz, Hz_SF, 2, 0, 100)
-        self.data["acenergy"] = self.calculate_value(WH, WH_SF) 
-        #self.data["status"] = INVERTER_STATUS[St]
-        self.data["statusvendor"] = FRONIUS_INVERTER_STATUS[StVnd]
-        self.data["statusvendor_id"] = StVnd
-        #self.data["events1"] = self.bitmask_to_string(EvtVnd1,INVERTER_EVENTS,default='None',bits=32)  
-        self.data["events2"] = self.bitmask_to_string(EvtVnd2,INVERTER_EVENTS,default='None',bits=32)  
+        raw, _ = self.decode_scaled_block(self.block(INVERTER_BLOCK.name), regs, self._inverter_unit_id, store=True)
+        self.data["statusvendor_id"] = raw['StVnd']
 
         return True
 
-    async def read_inverter_nameplate_data(self):
-        """start reading storage data"""
-        regs = await self.get_registers(unit_id=self._inverter_unit_id, address=NAMEPLATE_ADDRESS, count=120)
+    def decode_inverter_nameplate_data(self, regs):
         if regs is None:
             return False
 
-        # DERTyp: Type of DER device. Default value is 4 to indicate PV device.
-        DERTyp = self._client.convert_from_registers(regs[0:1], data_type = self._client.DATATYPE.UINT16)
-        # WHRtg: Nominal energy rating of storage device.
-        WHRtg = self._client.convert_from_registers(regs[17:18], data_type = self._client.DATATYPE.UINT16)
-        # MaxChaRte: Maximum rate of energy transfer into the storage device.
-        MaxChaRte = self._client.convert_from_registers(regs[21:22], data_type = self._client.DATATYPE.UINT16)
-        # MaxDisChaRte: Maximum rate of energy transfer out of the storage device.
-        MaxDisChaRte = self._client.convert_from_registers(regs[23:24], data_type = self._client.DATATYPE.UINT16)
+        raw, _ = self.decode_scaled_block(self.block(NAMEPLATE_BLOCK.name), regs, self._inverter_unit_id, store=True)
 
-        if DERTyp == 82:
+        if raw['DERTyp'] == 82:
             self.storage_configured = True
-        self.data['WHRtg'] = WHRtg
-        self.data['MaxChaRte'] = MaxChaRte
-        self.data['MaxDisChaRte'] = MaxDisChaRte
-    
-        self.max_charge_rate_w = MaxChaRte
-        self.max_discharge_rate_w = MaxDisChaRte
+
+        self.max_charge_rate_w = raw['MaxChaRte']
+        self.max_discharge_rate_w = raw['MaxDisChaRte']
 
         return True
 
-    async def read_inverter_status_data(self):
-        regs = await self.get_registers(unit_id=self._inverter_unit_id, address=40183, count=44)
+    def decode_inverter_status_data(self, regs):
         if regs is None:
             return False
 
-        PVConn = self._client.convert_from_registers(regs[0:1], data_type = self._client.DATATYPE.UINT16)
-        StorConn = self._client.convert_from_registers(regs[1:2], data_type = self._client.DATATYPE.UINT16)
-        ECPConn = self._client.convert_from_registers(regs[2:3], data_type = self._client.DATATYPE.UINT16)
-
-        StActCtl = self._client.convert_from_registers(regs[33:35], data_type = self._client.DATATYPE.UINT32)
-        
-        self.data['pv_connection'] = CONNECTION_STATUS_CONDENSED[PVConn]
-        self.data['storage_connection'] = CONNECTION_STATUS_CONDENSED[StorConn] 
-        self.data['ecp_connection'] = ECP_CONNECTION_STATUS[ECPConn]
-        self.data['inverter_controls'] = self.bitmask_to_string(StActCtl, INVERTER_CONTROLS, 'Normal')  
+        self.decode_scaled_block(self.block(STATUS_BLOCK.name), regs, self._inverter_unit_id, store=True)
 
         return True
 
-    async def read_inverter_model_settings_data(self):
-        regs = await self.get_registers(unit_id=self._inverter_unit_id, address=40151, count=30)
+    def decode_inverter_model_settings_data(self, regs):
         if regs is None:
             return False
 
-        WMax = self._client.convert_from_registers(regs[0:1], data_type = self._client.DATATYPE.UINT16)
-        #VRef = self._client.convert_from_registers(regs[1:2], data_type = self._client.DATATYPE.UINT16)
-        #VRefOfs = self._client.convert_from_registers(regs[2:3], data_type = self._client.DATATYPE.UINT16)
-
-        WMax_SF = self._client.convert_from_registers(regs[20:21], data_type = self._client.DATATYPE.INT16)
-        #VRef_SF = self._client.convert_from_registers(regs[21:22], data_type = self._client.DATATYPE.INT16)
-        #VRefOfs_SF = self._client.convert_from_registers(regs[21:22], data_type = self._client.DATATYPE.INT16)
-
-        self.data['max_power'] = self.calculate_value(WMax, WMax_SF,2,0,50000) 
-        #self.data['vref'] = self.calculate_value(VRef, VRef_SF) # At PCC 
-        #self.data['vrefofs'] = self.calculate_value(VRefOfs, VRefOfs_SF) # At PCC 
+        self.decode_scaled_block(self.block(SETTINGS_BLOCK.name), regs, self._inverter_unit_id, store=True)
 
         return True
 
-    async def read_inverter_controls_data(self):
-        regs = await self.get_registers(unit_id=self._inverter_unit_id, address=40229, count=24)
+    def decode_inverter_controls_data(self, regs):
         if regs is None:
             return False
 
-        Conn = self._client.convert_from_registers(regs[2:3], data_type = self._client.DATATYPE.UINT16)
-        WMaxLim_Ena = self._client.convert_from_registers(regs[7:8], data_type = self._client.DATATYPE.UINT16)
-        OutPFSet_Ena = self._client.convert_from_registers(regs[12:13], data_type = self._client.DATATYPE.UINT16)
-        VArPct_Ena = self._client.convert_from_registers(regs[20:21], data_type = self._client.DATATYPE.INT16)
-
-        self.data['Conn'] = CONTROL_STATUS[Conn]
-        self.data['WMaxLim_Ena'] = CONTROL_STATUS[WMaxLim_Ena]
-        self.data['OutPFSet_Ena'] = CONTROL_STATUS[OutPFSet_Ena]
-        self.data['VArPct_Ena'] = CONTROL_STATUS[VArPct_Ena]
+        self.decode_scaled_block(self.block(CONTROLS_BLOCK.name), regs, self._inverter_unit_id, store=True)
 
         return True
 
-    async def read_mppt_data(self):
-        regs = await self.get_registers(unit_id=self._inverter_unit_id, address=MPPT_ADDRESS, count=88)
+    def decode_mppt_data(self, regs):
         if regs is None:
             return False
 
-        DCW_SF = self._client.convert_from_registers(regs[2:3], data_type = self._client.DATATYPE.INT16)
-        DCWH_SF = self._client.convert_from_registers(regs[3:4], data_type = self._client.DATATYPE.INT16)
-        #N = self._client.convert_from_registers(regs[6:7], data_type = self._client.DATATYPE.UINT16)
-        # if N != 4:
-        #     _LOGGER.error(f"Integration only supports 4 mppt modules. Found only: {N}")
-        #     return
+        block = self.block(MPPT_BLOCK.name)
+        raw, _ = self.decode_scaled_block(block, regs, self._inverter_unit_id, store=True)
 
-        module_1_DCW = self._client.convert_from_registers(regs[19:20], data_type = self._client.DATATYPE.UINT16)
-        module_1_DCWH = self._client.convert_from_registers(regs[20:22], data_type = self._client.DATATYPE.UINT32)
+        # with storage the last two modules are storage charging and discharging. The
+        # default block used without a model chain can be longer than the model, the
+        # number of modules N of the model limits it
+        modules = mppt_modules(block.count)
+        if 0 < raw['N'] < modules:
+            modules = raw['N']
+        slots = self.mppt_slots(modules)
 
-        module_2_DCW = self._client.convert_from_registers(regs[39:40], data_type = self._client.DATATYPE.UINT16)
-        module_2_DCWH = self._client.convert_from_registers(regs[40:42], data_type = self._client.DATATYPE.UINT32)
-
-        mppt1_power = self.calculate_value(module_1_DCW, DCW_SF, 2, 0, 15000)
-        mppt2_power = self.calculate_value(module_2_DCW, DCW_SF, 2, 0, 15000)
-        if not mppt1_power is None and not mppt2_power is None:
-             pv_power = mppt1_power + mppt2_power
+        pv_power = [self.data.get_slot(slot) for slot in slots['pv']]
+        if not None in pv_power:
+            pv_power = sum(pv_power)
         else:
             pv_power = None
+        self.data.set_slot(slots['pv_power'], pv_power)
 
-        mppt1_lfte = self.calculate_value(module_1_DCWH, DCWH_SF)
-        mppt2_lfte = self.calculate_value(module_2_DCWH, DCWH_SF)
-
-        self.data['mppt1_power'] = mppt1_power
-        self.data['mppt2_power'] = mppt2_power
-        self.data['pv_power'] = pv_power
-        self.data['mppt1_lfte'] = mppt1_lfte
-        self.data['mppt2_lfte'] = mppt2_lfte
-
-        if self.storage_configured:
-            module_3_DCW = self._client.convert_from_registers(regs[59:60], data_type = self._client.DATATYPE.UINT16)
-            module_3_DCWH = self._client.convert_from_registers(regs[60:62], data_type = self._client.DATATYPE.UINT32)
-
-            module_4_DCW = self._client.convert_from_registers(regs[79:80], data_type = self._client.DATATYPE.UINT16)
-            module_4_DCWH = self._client.convert_from_registers(regs[80:82], data_type = self._client.DATATYPE.UINT32)
-
-            mppt3_power = self.calculate_value(module_3_DCW, DCW_SF, 2, 0, 15000)
-            mppt4_power = self.calculate_value(module_4_DCW, DCW_SF, 2, 0, 15000)
-            if not mppt3_power is None and not mppt4_power is None:
-                storage_power = mppt4_power - mppt3_power
+        if self.storage_configured and modules >= 2:
+            charge_power = self.data.get_slot(slots['charge'])
+            discharge_power = self.data.get_slot(slots['discharge'])
+            if not charge_power is None and not discharge_power is None:
+                storage_power = discharge_power - charge_power
             else:
                 storage_power = None
-        
-            mppt3_lfte = self.calculate_value(module_3_DCWH, DCWH_SF)
-            mppt4_lfte = self.calculate_value(module_4_DCWH, DCWH_SF)
-
-            self.data['mppt3_power'] = mppt3_power
-            self.data['mppt4_power'] = mppt4_power
-            self.data['storage_power'] = storage_power
-
-            self.data['mppt3_lfte'] = mppt3_lfte
-            self.data['mppt4_lfte'] = mppt4_lfte
+            self.data.set_slot(slots['storage_power'], storage_power)
 
         return True
 
-    async def read_inverter_storage_data(self):
-        """start reading storage data"""
-        regs = await self.get_registers(unit_id=self._inverter_unit_id, address=STORAGE_ADDRESS, count=24)
+    def mppt_slots(self, modules):
+        """Return the data slots of the MPPT power values and totals for ``modules`` modules."""
+        key = (modules, self.storage_configured)
+        slots = self._mppt_slots.get(key)
+        if slots is None:
+            pv_modules = modules - 2 if self.storage_configured else modules
+            slot = self.data.index.slot
+            slots = self._mppt_slots[key] = {
+                'pv': [slot(f'mppt{module}_power') for module in range(1, pv_modules + 1)],
+                'pv_power': slot('pv_power'),
+                'charge': slot(f'mppt{modules - 1}_power'),
+                'discharge': slot(f'mppt{modules}_power'),
+                'storage_power': slot('storage_power'),
+            }
+        return slots
+
+    def decode_inverter_storage_data(self, regs):
         if regs is None:
             return False
-        
-        # WChaMax: Reference Value for maximum Charge and Discharge.
-        max_charge = self._client.convert_from_registers(regs[0:1], data_type = self._client.DATATYPE.UINT16)
-        # WChaGra: Setpoint for maximum charging rate. Default is MaxChaRte.
-        WChaGra = self._client.convert_from_registers(regs[1:2], data_type = self._client.DATATYPE.UINT16)
-        # WDisChaGra: Setpoint for maximum discharge rate. Default is MaxDisChaRte.
-        WDisChaGra = self._client.convert_from_registers(regs[2:3], data_type = self._client.DATATYPE.UINT16)
-        # StorCtl_Mod: Active hold/discharge/charge storage control mode.
-        storage_control_mode = self._client.convert_from_registers(regs[3:4], data_type = self._client.DATATYPE.UINT16)
-        # VAChaMax: not supported
-        # MinRsvPct: Setpoint for minimum reserve for storage as a percentage of the nominal maximum storage.
-        minimum_reserve = self._client.convert_from_registers(regs[5:6], data_type = self._client.DATATYPE.UINT16)
-        # ChaState: Currently available energy as a percent of the capacity rating.
-        charge_state = self._client.convert_from_registers(regs[6:7], data_type = self._client.DATATYPE.UINT16)
-        # StorAval: not supported 
-        # InBatV: not supported
-        # ChaSt:  Charge status of storage device.
-        charge_status = self._client.convert_from_registers(regs[9:10], data_type = self._client.DATATYPE.UINT16)
-        # OutWRte: Defines maximum Discharge rate. If not used than the default is 100 and WChaMax defines max. Discharge rate.
-        discharge_power = self._client.convert_from_registers(regs[10:11], data_type = self._client.DATATYPE.INT16)
-        # InWRte: Defines maximum Charge rate. If not used than the default is 100 and WChaMax defines max. Charge rate.
-        charge_power = self._client.convert_from_registers(regs[11:12], data_type = self._client.DATATYPE.INT16)
-        # InOutWRte_WinTms: not supported
-        # InOutWRte_RvrtTms: Timeout period for charge/discharge rate.
-        #InOutWRte_RvrtTms = self._client.convert_from_registers(regs[13:14], data_type = self._client.DATATYPE.INT16)
-        # InOutWRte_RmpTms: not supported
-        # ChaGriSet
-        charge_grid_set = self._client.convert_from_registers(regs[15:16], data_type = self._client.DATATYPE.UINT16)
-        # WChaMax_SF: Scale factor for maximum charge. 0
-        #max_charge_sf = self._client.convert_from_registers(regs[16:17], data_type = self._client.DATATYPE.INT16)
-        # WChaDisChaGra_SF: Scale factor for maximum charge and discharge rate. 0
-        # VAChaMax_SF: not supported
-        # MinRsvPct_SF: Scale factor for minimum reserve percentage. -2
-        # ChaState_SF: Scale factor for available energy percent. -2
-        #charge_state_sf = self._client.convert_from_registers(regs[20:21], data_type = self._client.DATATYPE.INT16)
-        # StorAval_SF: not supported
-        # InBatV_SF: not supported
-        # InOutWRte_SF: Scale factor for percent charge/discharge rate. -2
-
-        self.data['grid_charging'] = CHARGE_GRID_STATUS.get(charge_grid_set)
-        #self.data['power'] = power
-        self.data['charge_status'] = CHARGE_STATUS.get(charge_status)
-        self.data['minimum_reserve'] =  self.calculate_value(minimum_reserve, -2, 2, 0, 100)
-        self.data['discharging_power'] = self.calculate_value(discharge_power, -2, 2, -100, 100)
-        self.data['charging_power'] = self.calculate_value(charge_power, -2, 2, -100, 100)
-        self.data['soc'] = self.calculate_value(charge_state, -2, 2, 0, 100)
-        self.data['max_charge'] = self.calculate_value(max_charge, 0, 0)
-        self.data['WChaGra'] = self.calculate_value(WChaGra, 0, 0)
-        self.data['WDisChaGra'] = self.calculate_value(WDisChaGra, 0, 0)
+
+        raw, _ = self.decode_scaled_block(self.block(STORAGE_BLOCK.name), regs, self._inverter_unit_id, store=True)
+        self._storage_image = (self.layout_of(self.block(STORAGE_BLOCK.name), regs).address, list(regs))
+
+        storage_control_mode = raw['StorCtl_Mod']
+        discharge_power = raw['OutWRte']
+        charge_power = raw['InWRte']
 
         control_mode = self.data.get('control_mode')
         if control_mode is None or control_mode != STORAGE_CONTROL_MODE.get(storage_control_mode):
@@ -447,96 +634,184 @@ class FroniusModbusClient(ExtModbusClient):
             soc = self.data.get('soc')
             if storage_control_mode == 2 and soc == 100:
                 _LOGGER.error(f'Calibration hit 100%, start discharge')
-                self.change_settings(1, 0, 100, 0)
+                self.calibration_step = CALIBRATION_DISCHARGE
             elif storage_control_mode == 3 and soc <= 5: 
                 _LOGGER.error(f'Calibration hit 5%, return to auto mode')
-                self.set_auto_mode()
-                self.set_minimum_reserve(30)
-                self.data['ext_control_mode'] = STORAGE_EXT_CONTROL_MODE[0]
-                self.storage_extended_control_mode = 0
+                self.calibration_step = CALIBRATION_AUTO
 
         return True
 
-    async def read_meter_data(self, meter_prefix, unit_id):
-        """start reading meter data"""
-        regs = await self.get_registers(unit_id=unit_id, address=METER_ADDRESS, count=103)
+    def decode_meter_data(self, regs, meter_prefix, unit_id):
         if regs is None:
             return False
 
-        PhVphA = self._client.convert_from_registers(regs[6:7], data_type = self._client.DATATYPE.INT16)
-        PhVphB = self._client.convert_from_registers(regs[7:8], data_type = self._client.DATATYPE.INT16)
-        PhVphC = self._client.convert_from_registers(regs[8:9], data_type = self._client.DATATYPE.INT16)
-        PPV = self._client.convert_from_registers(regs[9:10], data_type = self._client.DATATYPE.INT16)
-        V_SF = self._client.convert_from_registers(regs[13:14], data_type = self._client.DATATYPE.INT16)
-
-        Hz = self._client.convert_from_registers(regs[14:15], data_type = self._client.DATATYPE.INT16)
-        Hz_SF = self._client.convert_from_registers(regs[15:16], data_type = self._client.DATATYPE.INT16)
-        W = self._client.convert_from_registers(regs[16:17], data_type = self._client.DATATYPE.INT16)
-        W_SF = self._client.convert_from_registers(regs[20:21], data_type = self._client.DATATYPE.INT16)
-
-        TotWhExp = self._client.convert_from_registers(regs[36:38], data_type = self._client.DATATYPE.UINT32)
-        TotWhImp = self._client.convert_from_registers(regs[44:46], data_type = self._client.DATATYPE.UINT32)
-        TotWh_SF = self._client.convert_from_registers(regs[52:53], data_type = self._client.DATATYPE.INT16)
-
-        acpower = self.calculate_value(W, W_SF, 2, -50000, 50000)
-        m_frequency = self.calculate_value(Hz, Hz_SF, 2, 0, 100)
- 
-        self.data[meter_prefix + "PhVphA"] = self.calculate_value(PhVphA, V_SF,1,0,1000)
-        self.data[meter_prefix + "PhVphB"] = self.calculate_value(PhVphB, V_SF,1,0,1000)
-        self.data[meter_prefix + "PhVphC"] = self.calculate_value(PhVphC, V_SF,1,0,1000)
-        self.data[meter_prefix + "PPV"] = self.calculate_value(PPV, V_SF,1,0,1000)
-        self.data[meter_prefix + "exported"] = self.calculate_value(TotWhExp, TotWh_SF)
-        self.data[meter_prefix + "imported"] = self.calculate_value(TotWhImp, TotWh_SF)
-        self.data[meter_prefix + "line_frequency"] = m_frequency
-        self.data[meter_prefix + "power"] = acpower
-
-        if meter_prefix == 'm1_':
+        self.decode_scaled_block(self.block(METER_BLOCK.name, unit_id), regs, unit_id, meter_prefix, store=True)
+
+        return True
+
+    def update_derived_data(self):
+        """Compute load and grid status from the inverter and first meter values written in this cycle."""
+        if not self.data.was_written('m1_power'):
+            return
+
+        acpower = self.data.get('m1_power')
+        m_frequency = self.data.get('m1_line_frequency')
+
+        if self.data.was_written('acpower'):
             inverter_acpower = self.data.get('acpower')
             if not acpower is None and not inverter_acpower is None:
                 if self.is_numeric(acpower) and self.is_numeric(inverter_acpower):
                     self.data['load'] = round(acpower + inverter_acpower,2)
                 elif not self.is_numeric(acpower):
-                    _LOGGER.error(f'meter {meter_prefix} acpower not numeric {acpower}')
+                    _LOGGER.error(f'meter m1_ acpower not numeric {acpower}')
                 elif not self.is_numeric(inverter_acpower):
                     _LOGGER.error(f'inverter acpower not numeric {inverter_acpower}')
 
-            status_str = ""
-            i_frequency = self.data["line_frequency"]
-            #_LOGGER.debug(f'grid status m: {m_frequency} i: {i_frequency}')
-            if not i_frequency is None and self.is_numeric(i_frequency) and not m_frequency is None and self.is_numeric(m_frequency):
-                m_online = False
-                if m_frequency and m_frequency > self._grid_frequency_lower_bound and m_frequency < self._grid_frequency_upper_bound:
-                    m_online = True
-                
-                if m_online and i_frequency > self._grid_frequency_lower_bound and i_frequency < self._grid_frequency_upper_bound:
-                    status_str = GRID_STATUS.get(3)
-                elif not m_online and i_frequency > self._inverter_frequency_lower_bound and i_frequency < self._inverter_frequency_upper_bound:
-                    status_str = GRID_STATUS.get(1)
-                elif i_frequency < 1:
-                    if m_online:
-                        status_str = GRID_STATUS.get(2)
-                    elif m_frequency < 1:
-                        status_str = GRID_STATUS.get(0)
-            if status_str is None:
-                _LOGGER.error(f'Could not establish grid connection status m: {m_frequency} i: {i_frequency}')
-                self.data["grid_status"] = None
-            else:
-                self.data["grid_status"] = status_str
+        if not self.data.was_written('line_frequency'):
+            return
 
-        return True
+        status_str = ""
+        i_frequency = self.data["line_frequency"]
+        #_LOGGER.debug(f'grid status m: {m_frequency} i: {i_frequency}')
+        if not i_frequency is None and self.is_numeric(i_frequency) and not m_frequency is None and self.is_numeric(m_frequency):
+            m_online = False
+            if m_frequency and m_frequency > self._grid_frequency_lower_bound and m_frequency < self._grid_frequency_upper_bound:
+                m_online = True
+            
+            if m_online and i_frequency > self._grid_frequency_lower_bound and i_frequency < self._grid_frequency_upper_bound:
+                status_str = GRID_STATUS.get(3)
+            elif not m_online and i_frequency > self._inverter_frequency_lower_bound and i_frequency < self._inverter_frequency_upper_bound:
+                status_str = GRID_STATUS.get(1)
+            elif i_frequency < 1:
+                if m_online:
+                    status_str = GRID_STATUS.get(2)
+                elif m_frequency < 1:
+                    status_str = GRID_STATUS.get(0)
+        if status_str is None:
+            _LOGGER.error(f'Could not establish grid connection status m: {m_frequency} i: {i_frequency}')
+            self.data["grid_status"] = None
+        else:
+            self.data["grid_status"] = status_str
+
+    def storage_address(self, name):
+        """Return the register address of storage control field ``name``."""
+        block = self.block(STORAGE_BLOCK.name)
+        return block.address + block.field(name).offset
+
+    async def write_storage_registers(self, changes):
+        """Write storage control registers, ``changes`` maps register address to value.
+
+        Registers are merged with the cached image of the storage block and the
+        changed span, e.g. StorCtl_Mod to InWRte, is written with one multi
+        register write. The span is read right before, so the read only registers
+        it covers are written back with the values just read. Single writes in
+        the order of ``changes`` are used when there is no image. After the
+        inverter rejects the write of a span, the runs of adjacent writable
+        registers are written separately for STORAGE_MULTI_WRITE_RETRY seconds,
+        the run of StorCtl_Mod last so that a new mode never runs with old rates.
+        """
+        if self._storage_image is None:
+            await self._write_storage_registers_single(changes)
+            return
 
-    async def set_storage_control_mode(self, mode: int):
+        image_address, image = self._storage_image
+        changed = {address: value for address, value in changes.items() if image_address <= address < image_address + len(image) and image[address - image_address] != value}
+        other = {address: value for address, value in changes.items() if not (image_address <= address < image_address + len(image))}
+        if other:
+            await self._write_storage_registers_single(other)
+        skipped = len(changes) - len(changed) - len(other)
+        if skipped:
+            self.skipped_writes += skipped
+            _LOGGER.debug(f'Skipped {skipped} storage register writes matching the inverter values, total skipped: {self.skipped_writes}')
+        if not changed:
+            return
+
+        if len(changed) > 1 and time.monotonic() >= self._storage_multi_write_retry:
+            try:
+                await self._write_storage_span(changed)
+                return
+            except Exception as e:
+                _LOGGER.warning(f'Multi register write of storage controls {min(changed)} count: {max(changed) - min(changed) + 1} failed, writing registers separately for {self.STORAGE_MULTI_WRITE_RETRY}s. {e}')
+                self._storage_multi_write_retry = time.monotonic() + self.STORAGE_MULTI_WRITE_RETRY
+
+        for run in self.storage_write_runs(changed):
+            if len(run) > 1:
+                start = run[0]
+                payload = [changed.get(address, image[address - image_address]) for address in range(start, run[-1] + 1)]
+                try:
+                    await self.write_registers(unit_id=self._inverter_unit_id, address=start, payload=payload)
+                    image[start - image_address:start - image_address + len(payload)] = payload
+                    continue
+                except Exception as e:
+                    _LOGGER.warning(f'Multi register write of storage controls {start} count: {len(payload)} failed, using single writes. {e}')
+            await self._write_storage_registers_single({address: changed[address] for address in run})
+
+    async def _write_storage_span(self, changed):
+        """Read the registers from the first to the last changed one and write them back with the changes."""
+        image_address, image = self._storage_image
+        start = min(changed)
+        count = max(changed) - start + 1
+        regs = await self.get_registers(unit_id=self._inverter_unit_id, address=start, count=count)
+        if regs is None:
+            raise Exception(f'could not read storage controls {start} count: {count}')
+        payload = list(regs)
+        for address, value in changed.items():
+            payload[address - start] = value
+        await self.write_registers(unit_id=self._inverter_unit_id, address=start, payload=payload)
+        image[start - image_address:start - image_address + count] = payload
+
+    def storage_write_runs(self, changed):
+        """Group the changed register addresses into runs that span only writable registers.
+
+        The run of StorCtl_Mod is returned last.
+        """
+        writable = {self.storage_address(name) for name in STORAGE_WRITABLE_FIELDS}
+        runs = []
+        for address in sorted(changed):
+            if runs and all(a in writable for a in range(runs[-1][-1] + 1, address)):
+                runs[-1].append(address)
+            else:
+                runs.append([address])
+        mode = self.storage_address('StorCtl_Mod')
+        runs.sort(key=lambda run: mode in run)
+        return runs
+
+    async def _write_storage_registers_single(self, changes):
+        for address, value in changes.items():
+            await self.write_registers(unit_id=self._inverter_unit_id, address=address, payload=[value])
+            if not self._storage_image is None:
+                image_address, image = self._storage_image
+                if image_address <= address < image_address + len(image):
+                    image[address - image_address] = value
+
+    def encode_storage_control_mode(self, mode: int):
         if not mode in [0,1,2,3]:
             _LOGGER.error(f'Attempted to set to unsupported storage control mode. Value: {mode}')
-            return
-        await self.write_registers(unit_id=self._inverter_unit_id, address=STORAGE_CONTROL_MODE_ADDRESS, payload=[mode])
+            return None
+        return mode
 
-    async def set_minimum_reserve(self, minimum_reserve: float):
+    def encode_minimum_reserve(self, minimum_reserve: float):
         if minimum_reserve < 5:
             _LOGGER.error(f'Attempted to set minimum reserve below 5%. Value: {minimum_reserve}')
+            return None
+        return round(minimum_reserve * 100)
+
+    def encode_rate(self, rate):
+        if rate < 0:
+            return int(65536 + (rate * 100))
+        return int(round(rate * 100))
+
+    async def set_storage_control_mode(self, mode: int):
+        mode = self.encode_storage_control_mode(mode)
+        if mode is None:
+            return
+        await self.write_storage_registers({self.storage_address('StorCtl_Mod'): mode})
+
+    async def set_minimum_reserve(self, minimum_reserve: float):
+        minimum_reserve = self.encode_minimum_reserve(minimum_reserve)
+        if minimum_reserve is None:
             return
-        minimum_reserve = round(minimum_reserve * 100)
-        await self.write_registers(unit_id=self._inverter_unit_id, address=MINIMUM_RESERVE_ADDRESS, payload=[minimum_reserve])
+        await self.write_storage_registers({self.storage_address('MinRsvPct'): minimum_reserve})
 
     async def set_discharge_rate_w(self, discharge_rate_w):
         if discharge_rate_w > self.max_discharge_rate_w:
@@ -548,11 +823,7 @@ class FroniusModbusClient(ExtModbusClient):
         await self.set_discharge_rate(discharge_rate)
 
     async def set_discharge_rate(self, discharge_rate):
-        if discharge_rate < 0:
-            discharge_rate = int(65536 + (discharge_rate * 100))
-        else:
-            discharge_rate = int(round(discharge_rate * 100))
-        await self.write_registers(unit_id=self._inverter_unit_id, address=DISCHARGE_RATE_ADDRESS, payload=[discharge_rate])
+        await self.write_storage_registers({self.storage_address('OutWRte'): self.encode_rate(discharge_rate)})
 
     async def set_charge_rate_w(self, charge_rate_w):
         if charge_rate_w > self.max_charge_rate_w:
@@ -598,16 +869,21 @@ class FroniusModbusClient(ExtModbusClient):
             return
 
     async def set_charge_rate(self, charge_rate):
-        if charge_rate < 0:
-            charge_rate =  int(65536 + (charge_rate * 100))
-        else:
-            charge_rate = int(round(charge_rate * 100))
-        await self.write_registers(unit_id=self._inverter_unit_id, address=CHARGE_RATE_ADDRESS, payload=[charge_rate])
+        await self.write_storage_registers({self.storage_address('InWRte'): self.encode_rate(charge_rate)})
 
     async def change_settings(self, mode, charge_limit, discharge_limit, grid_charge_power=0, grid_discharge_power=0, minimum_reserve=None):
-        await self.set_storage_control_mode(mode)
-        await self.set_charge_rate(charge_limit)
-        await self.set_discharge_rate(discharge_limit)
+        # the mode goes last when the registers are written one by one
+        changes = {}
+        changes[self.storage_address('InWRte')] = self.encode_rate(charge_limit)
+        changes[self.storage_address('OutWRte')] = self.encode_rate(discharge_limit)
+        if not minimum_reserve is None:
+            minimum_reserve = self.encode_minimum_reserve(minimum_reserve)
+            if not minimum_reserve is None:
+                changes[self.storage_address('MinRsvPct')] = minimum_reserve
+        mode = self.encode_storage_control_mode(mode)
+        if not mode is None:
+            changes[self.storage_address('StorCtl_Mod')] = mode
+        await self.write_storage_registers(changes)
         self.data['charge_limit'] = charge_limit
         if self.storage_extended_control_mode == 4:
             self.data['discharge_limit'] = 0
@@ -619,9 +895,16 @@ class FroniusModbusClient(ExtModbusClient):
             self.data['charge_limit'] = charge_limit
         self.data['grid_charge_power'] = grid_charge_power
         self.data['grid_discharge_power'] = grid_discharge_power
-        if not minimum_reserve is None:
-            await self.set_minimum_reserve(minimum_reserve)
         
+    async def run_calibration_step(self, step):
+        """Apply a calibration step requested by decode_inverter_storage_data."""
+        if step == CALIBRATION_DISCHARGE:
+            await self.change_settings(1, 0, 100, 0)
+        elif step == CALIBRATION_AUTO:
+            await self.set_auto_mode()
+            await self.set_minimum_reserve(30)
+            self.data['ext_control_mode'] = STORAGE_EXT_CONTROL_MODE[0]
+
     async def restore_defaults(self):
         await self.change_settings(mode=0, charge_limit=100, discharge_limit=100, minimum_reserve=7)
         _LOGGER.info(f"restored defaults")
@@ -1,9 +1,17 @@
+from .registermap import RegisterBlock, RegisterField
+
 SUPPORTED_MANUFACTURERS = ['Fronius']
 SUPPORTED_MODELS = ['Primo GEN24', 'Symo GEN24']
 
+SUNSPEC_ADDRESS = 40000
+# 'SunS' marker, common model id and length in front of the common block
+SUNSPEC_HEADER = [0x5375, 0x6E53, 1, 65]
 COMMON_ADDRESS = 40004
 INVERTER_ADDRESS = 40071
 NAMEPLATE_ADDRESS = 40123
+SETTINGS_ADDRESS = 40151
+STATUS_ADDRESS = 40183
+CONTROLS_ADDRESS = 40229
 MPPT_ADDRESS = 40255
 METER_ADDRESS = 40071
 STORAGE_ADDRESS = 40345
@@ -24,6 +32,10 @@ STORAGE_CONTROL_MODE = {
     3: 'Change and Discharge',
 }
 
+# calibration steps the hub runs after a storage read
+CALIBRATION_DISCHARGE = 'discharge'
+CALIBRATION_AUTO = 'auto'
+
 CHARGE_STATUS = {
     1: 'Off',
     2: 'Empty',
@@ -73,6 +85,9 @@ FRONIUS_INVERTER_STATUS = {
     13: 'ACFI event',
 }
 
+# Operating states in which the inverter does not produce
+INVERTER_SLEEP_STATES = [1, 2]
+
 CHARGE_GRID_STATUS = {
     1: 'Disabled',
     2: 'Enabled',
@@ -119,3 +134,171 @@ STORAGE_EXT_CONTROL_MODE = {
     7: 'Block Charging',
 #    8: 'Calibrate',
 }
+
+DEVICE_INFO_BLOCK = RegisterBlock('device_info', COMMON_ADDRESS, 65, [
+    RegisterField('Mn', 0, 'string', 16, key='manufacturer'),
+    RegisterField('Md', 16, 'string', 16, key='model'),
+    RegisterField('Opt', 32, 'string', 8, key='options'),
+    RegisterField('Vr', 40, 'string', 8, key='sw_version'),
+    RegisterField('SN', 48, 'string', 16, key='serial'),
+    RegisterField('DA', 64, 'uint16', key='unit_id'),
+])
+
+# serial number of the common block, read to revalidate cached device data
+SERIAL_BLOCK = RegisterBlock('serial', COMMON_ADDRESS + 48, 16, [
+    RegisterField('SN', 0, 'string', 16, key='serial'),
+])
+
+INVERTER_BLOCK = RegisterBlock('inverter', INVERTER_ADDRESS, 50, [
+    RegisterField('PPVphAB', 5, 'uint16', key='PPVphAB', sf='V_SF'),
+    RegisterField('PPVphBC', 6, 'uint16', key='PPVphBC', sf='V_SF'),
+    RegisterField('PPVphCA', 7, 'uint16', key='PPVphCA', sf='V_SF'),
+    RegisterField('PhVphA', 8, 'uint16', key='PhVphA', sf='V_SF'),
+    RegisterField('PhVphB', 9, 'uint16', key='PhVphB', sf='V_SF'),
+    RegisterField('PhVphC', 10, 'uint16', key='PhVphC', sf='V_SF'),
+    RegisterField('V_SF', 11, 'sunssf'),
+    RegisterField('W', 12, 'int16', key='acpower', sf='W_SF', lower_bound=-50000, upper_bound=50000),
+    RegisterField('W_SF', 13, 'sunssf'),
+    RegisterField('Hz', 14, 'int16', key='line_frequency', sf='Hz_SF', lower_bound=0, upper_bound=100),
+    RegisterField('Hz_SF', 15, 'sunssf'),
+    RegisterField('WH', 22, 'acc32', key='acenergy', sf='WH_SF'),
+    RegisterField('WH_SF', 24, 'sunssf'),
+    RegisterField('TmpCab', 31, 'int16', key='tempcab', sf='Tmp_SF'),
+    RegisterField('Tmp_SF', 35, 'sunssf'),
+    RegisterField('StVnd', 37, 'enum16', key='statusvendor', enum=FRONIUS_INVERTER_STATUS),
+    RegisterField('EvtVnd2', 44, 'bitfield32', key='events2', bitmask=INVERTER_EVENTS, default='None'),
+])
+
+NAMEPLATE_BLOCK = RegisterBlock('nameplate', NAMEPLATE_ADDRESS, 120, [
+    # DERTyp: Type of DER device. Default value is 4 to indicate PV device.
+    RegisterField('DERTyp', 0, 'enum16'),
+    # WHRtg: Nominal energy rating of storage device.
+    RegisterField('WHRtg', 17, 'uint16', key='WHRtg'),
+    # MaxChaRte: Maximum rate of energy transfer into the storage device.
+    RegisterField('MaxChaRte', 21, 'uint16', key='MaxChaRte'),
+    # MaxDisChaRte: Maximum rate of energy transfer out of the storage device.
+    RegisterField('MaxDisChaRte', 23, 'uint16', key='MaxDisChaRte'),
+])
+
+SETTINGS_BLOCK = RegisterBlock('settings', SETTINGS_ADDRESS, 30, [
+    RegisterField('WMax', 0, 'uint16', key='max_power', sf='WMax_SF', lower_bound=0, upper_bound=50000),
+    RegisterField('WMax_SF', 20, 'sunssf'),
+])
+
+STATUS_BLOCK = RegisterBlock('status', STATUS_ADDRESS, 44, [
+    RegisterField('PVConn', 0, 'bitfield16', key='pv_connection', enum=CONNECTION_STATUS_CONDENSED),
+    RegisterField('StorConn', 1, 'bitfield16', key='storage_connection', enum=CONNECTION_STATUS_CONDENSED),
+    RegisterField('ECPConn', 2, 'bitfield16', key='ecp_connection', enum=ECP_CONNECTION_STATUS),
+    RegisterField('StActCtl', 33, 'bitfield32', key='inverter_controls', bitmask=INVERTER_CONTROLS, default='Normal', bits=16),
+])
+
+CONTROLS_BLOCK = RegisterBlock('controls', CONTROLS_ADDRESS, 24, [
+    RegisterField('Conn', 2, 'enum16', key='Conn', enum=CONTROL_STATUS),
+    RegisterField('WMaxLim_Ena', 7, 'enum16', key='WMaxLim_Ena', enum=CONTROL_STATUS),
+    RegisterField('OutPFSet_Ena', 12, 'enum16', key='OutPFSet_Ena', enum=CONTROL_STATUS),
+    RegisterField('VArPct_Ena', 20, 'enum16', key='VArPct_Ena', enum=CONTROL_STATUS),
+])
+
+# Registers of the fixed part and of each module of the MPPT model
+MPPT_HEADER_LENGTH = 8
+MPPT_MODULE_LENGTH = 20
+
+def mppt_block(modules, address=MPPT_ADDRESS):
+    """Return the MPPT block with ``modules`` modules."""
+    return RegisterBlock('mppt', address, MPPT_HEADER_LENGTH + MPPT_MODULE_LENGTH * modules, [
+        RegisterField('DCW_SF', 2, 'sunssf'),
+        RegisterField('DCWH_SF', 3, 'sunssf'),
+        RegisterField('N', 6, 'uint16'),
+    ] + [
+        field
+        for module in range(1, modules + 1)
+        for field in (
+            RegisterField(f'module_{module}_DCW', 20 * module - 1, 'uint16', key=f'mppt{module}_power', sf='DCW_SF', lower_bound=0, upper_bound=15000),
+            RegisterField(f'module_{module}_DCWH', 20 * module, 'acc32', key=f'mppt{module}_lfte', sf='DCWH_SF'),
+        )
+    ])
+
+def mppt_modules(length):
+    """Return the number of modules of an MPPT model or block of ``length`` registers."""
+    return (length - MPPT_HEADER_LENGTH) // MPPT_MODULE_LENGTH
+
+MPPT_BLOCK = mppt_block(4)
+
+STORAGE_BLOCK = RegisterBlock('storage', STORAGE_ADDRESS, 24, [
+    # WChaMax: Reference Value for maximum Charge and Discharge.
+    RegisterField('WChaMax', 0, 'uint16', key='max_charge', sf=0, digits=0),
+    # WChaGra: Setpoint for maximum charging rate. Default is MaxChaRte.
+    RegisterField('WChaGra', 1, 'uint16', key='WChaGra', sf=0, digits=0),
+    # WDisChaGra: Setpoint for maximum discharge rate. Default is MaxDisChaRte.
+    RegisterField('WDisChaGra', 2, 'uint16', key='WDisChaGra', sf=0, digits=0),
+    # StorCtl_Mod: Active hold/discharge/charge storage control mode.
+    RegisterField('StorCtl_Mod', 3, 'bitfield16'),
+    # VAChaMax: not supported
+    # MinRsvPct: Setpoint for minimum reserve for storage as a percentage of the nominal maximum storage. SF -2
+    RegisterField('MinRsvPct', 5, 'uint16', key='minimum_reserve', sf=-2, lower_bound=0, upper_bound=100),
+    # ChaState: Currently available energy as a percent of the capacity rating. SF -2
+    RegisterField('ChaState', 6, 'uint16', key='soc', sf=-2, lower_bound=0, upper_bound=100),
+    # StorAval: not supported
+    # InBatV: not supported
+    # ChaSt: Charge status of storage device.
+    RegisterField('ChaSt', 9, 'enum16', key='charge_status', enum=CHARGE_STATUS),
+    # OutWRte: Defines maximum Discharge rate. If not used than the default is 100 and WChaMax defines max. Discharge rate.
+    RegisterField('OutWRte', 10, 'int16', key='discharging_power', sf=-2, lower_bound=-100, upper_bound=100),
+    # InWRte: Defines maximum Charge rate. If not used than the default is 100 and WChaMax defines max. Charge rate.
+    RegisterField('InWRte', 11, 'int16', key='charging_power', sf=-2, lower_bound=-100, upper_bound=100),
+    # InOutWRte_WinTms: not supported
+    # InOutWRte_RvrtTms: Timeout period for charge/discharge rate.
+    # InOutWRte_RmpTms: not supported
+    # ChaGriSet
+    RegisterField('ChaGriSet', 15, 'enum16', key='grid_charging', enum=CHARGE_GRID_STATUS),
+    # WChaMax_SF, WChaDisChaGra_SF: 0, MinRsvPct_SF, ChaState_SF, InOutWRte_SF: -2
+])
+
+# Storage control fields that the GEN24 accepts writes to
+STORAGE_WRITABLE_FIELDS = ['StorCtl_Mod', 'MinRsvPct', 'OutWRte', 'InWRte', 'ChaGriSet']
+
+METER_BLOCK = RegisterBlock('meter', METER_ADDRESS, 103, [
+    RegisterField('PhVphA', 6, 'int16', key='PhVphA', sf='V_SF', digits=1, lower_bound=0, upper_bound=1000),
+    RegisterField('PhVphB', 7, 'int16', key='PhVphB', sf='V_SF', digits=1, lower_bound=0, upper_bound=1000),
+    RegisterField('PhVphC', 8, 'int16', key='PhVphC', sf='V_SF', digits=1, lower_bound=0, upper_bound=1000),
+    RegisterField('PPV', 9, 'int16', key='PPV', sf='V_SF', digits=1, lower_bound=0, upper_bound=1000),
+    RegisterField('V_SF', 13, 'sunssf'),
+    RegisterField('Hz', 14, 'int16', key='line_frequency', sf='Hz_SF', lower_bound=0, upper_bound=100),
+    RegisterField('Hz_SF', 15, 'sunssf'),
+    RegisterField('W', 16, 'int16', key='power', sf='W_SF', lower_bound=-50000, upper_bound=50000),
+    RegisterField('W_SF', 20, 'sunssf'),
+    RegisterField('TotWhExp', 36, 'acc32', key='exported', sf='TotWh_SF'),
+    RegisterField('TotWhImp', 44, 'acc32', key='imported', sf='TotWh_SF'),
+    RegisterField('TotWh_SF', 52, 'sunssf'),
+])
+
+DEFAULT_BLOCKS = {block.name: block for block in [
+    DEVICE_INFO_BLOCK, INVERTER_BLOCK, NAMEPLATE_BLOCK, SETTINGS_BLOCK, STATUS_BLOCK,
+    CONTROLS_BLOCK, MPPT_BLOCK, STORAGE_BLOCK, METER_BLOCK,
+]}
+
+# SunSpec model chain, starting with the common model after the 'SunS' marker
+MODEL_CHAIN_ADDRESS = 40002
+END_MODEL_ID = 0xFFFF
+MAX_MODELS = 32
+
+# SunSpec float models, the blocks are only decoded from the int+SF models
+FLOAT_MODEL_IDS = [111, 112, 113, 211, 212, 213]
+
+# Block decoding each SunSpec int+SF model id
+MODEL_BLOCKS = {
+    1: DEVICE_INFO_BLOCK.name,
+    101: INVERTER_BLOCK.name,
+    102: INVERTER_BLOCK.name,
+    103: INVERTER_BLOCK.name,
+    120: NAMEPLATE_BLOCK.name,
+    121: SETTINGS_BLOCK.name,
+    122: STATUS_BLOCK.name,
+    123: CONTROLS_BLOCK.name,
+    124: STORAGE_BLOCK.name,
+    160: MPPT_BLOCK.name,
+    201: METER_BLOCK.name,
+    202: METER_BLOCK.name,
+    203: METER_BLOCK.name,
+    204: METER_BLOCK.name,
+}
@@ -1,7 +1,11 @@
 """Fronius Modbus Hub."""
 from __future__ import annotations
 
+import asyncio
+import functools
 import logging
+import time
+from collections import deque
 from datetime import timedelta
 from typing import Optional
 from importlib.metadata import version, PackageNotFoundError
@@ -10,11 +14,45 @@ from packaging.version import Version
 from homeassistant.core import callback
 from homeassistant.helpers.event import async_track_time_interval
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
 
 from .froniusmodbusclient import FroniusModbusClient
+from .commandqueue import CommandQueue, PRIORITY_READ, PRIORITY_WRITE
+from .solarapi import SolarApiClient
+from .scheduler import AdaptiveScheduler
+from .publishfilter import PublishFilter
+from .snapshot import DataSnapshot, MISSING
 
 from .const import (
     DOMAIN,
+    STORAGE_VERSION,
+    DEFAULT_STATUS_SCAN_INTERVAL,
+    DEFAULT_SETTINGS_SCAN_INTERVAL,
+    DEFAULT_MAX_CONNECTIONS,
+    DEFAULT_WRITE_DEBOUNCE,
+    DEFAULT_SLEEP_SCAN_INTERVAL,
+    DEFAULT_POWER_DEADBAND,
+    DEFAULT_POWER_DEADBAND_PERCENT,
+    DEFAULT_MIN_PUBLISH_INTERVAL,
+    DEFAULT_MAX_PUBLISH_AGE,
+    POWER_PUBLISH_KEYS,
+    METER_POWER_PUBLISH_KEYS,
+    PUBLISH_DEADBANDS,
+    METER_PUBLISH_DEADBANDS,
+    SOLAR_API_TIMEOUT,
+    SOLAR_API_SCAN_INTERVAL,
+    BACKOFF_MAX_INTERVAL,
+    BREAKER_FAILURE_THRESHOLD,
+    BACKOFF_JITTER,
+    POLL_TIER_FAST,
+    POLL_TIER_STATUS,
+    POLL_TIER_SETTINGS,
+    BLOCK_POLL_TIERS,
+    DEFERRABLE_BLOCKS,
+    CYCLE_BUDGET,
+    STORAGE_EXT_CONTROL_MODE,
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -23,50 +61,192 @@ class Hub:
     """Hub for Fronius Battery Storage Modbus Interface"""
 
     PYMODBUS_VERSION = '3.9.2'
+    # Window in seconds over which the effective request rate is reported
+    REQUEST_RATE_WINDOW = 300
 
-    def __init__(self, hass: HomeAssistant, name: str, host: str, port: int, inverter_unit_id: int, meter_unit_ids, scan_interval: int) -> None:
+    def __init__(self, hass: HomeAssistant, name: str, host: str, port: int, inverter_unit_id: int, meter_unit_ids, scan_interval: int, status_scan_interval: int = DEFAULT_STATUS_SCAN_INTERVAL, settings_scan_interval: int = DEFAULT_SETTINGS_SCAN_INTERVAL, max_connections: int = DEFAULT_MAX_CONNECTIONS, write_debounce: float = DEFAULT_WRITE_DEBOUNCE, sleep_scan_interval: int = DEFAULT_SLEEP_SCAN_INTERVAL, power_deadband: float = DEFAULT_POWER_DEADBAND, power_deadband_percent: float = DEFAULT_POWER_DEADBAND_PERCENT, min_publish_interval: int = DEFAULT_MIN_PUBLISH_INTERVAL, max_publish_age: int = DEFAULT_MAX_PUBLISH_AGE) -> None:
         """Init hub."""
         self._hass = hass
         self._name = name
 
         self._id = f"{name.lower()}_{host.lower().replace('.', '')}"
+        self._host = host
+        self._solar_api = None
+        self._storage_info_task = None
+        self._calibration_task = None
+        self._revalidate_task = None
+        # called when revalidation finds a different device or configuration
+        self.on_device_changed = None
         self.online = True        
 
-        self._client = FroniusModbusClient(host=host, port=port, inverter_unit_id=inverter_unit_id, meter_unit_ids=meter_unit_ids, timeout=max(3, (scan_interval - 1)))
+        self._client = FroniusModbusClient(host=host, port=port, inverter_unit_id=inverter_unit_id, meter_unit_ids=meter_unit_ids, timeout=max(3, (scan_interval - 1)), max_connections=max_connections)
         self._scan_interval = timedelta(seconds=scan_interval)
+        self._tier_intervals = {
+            POLL_TIER_FAST: scan_interval,
+            POLL_TIER_STATUS: max(scan_interval, status_scan_interval),
+            POLL_TIER_SETTINGS: max(scan_interval, settings_scan_interval),
+        }
+        self._tier_last_poll = {}
+        self._block_last_read = {}
+        # while the inverter sleeps only its operating state, the storage and the meters are polled
+        self._sleep_interval = max(scan_interval, sleep_scan_interval)
+        self._sleeping = False
+        self._last_sleep_poll = None
+        self._scheduler = AdaptiveScheduler(scan_interval, max_interval=BACKOFF_MAX_INTERVAL, failure_threshold=BREAKER_FAILURE_THRESHOLD, jitter=BACKOFF_JITTER)
+        self._request_log = deque()
+        self._cycle_overruns = 0
+        self._attributes = {}
         self._unsub_interval_method = None
         self._entities = []
         self._entities_dict = {}
-        self._busy = False
-
-    def toggle_busy(func):
-        async def wrapper(self, *args, **kwargs):
-            if self._busy:
-                #_LOGGER.debug(f"skip {func.__name__} hub busy") 
-                return
-            self._busy = True
-            error = None
+        # update callbacks by data slot, None for callbacks of all slots
+        self._subscribers = {}
+        # entities read the snapshot of the last commit, the client decodes into its own buffer
+        self._snapshot = DataSnapshot(self._client.data.index)
+        self._publish_filters = {self.data_slot(key): publish_filter for key, publish_filter in self._create_publish_filters(len(meter_unit_ids), power_deadband, power_deadband_percent, min_publish_interval, max_publish_age).items()}
+        self._queue = CommandQueue(self._id)
+        self._write_debounce = write_debounce
+        self._pending_writes = {}
+        self.debounced_writes = 0
+
+    @staticmethod
+    def _create_publish_filters(meter_count, power_deadband, power_deadband_percent, min_interval, max_age):
+        """Return the publish filters of noisy sensors by data key."""
+        deadbands = {key: (power_deadband, power_deadband_percent / 100) for key in POWER_PUBLISH_KEYS}
+        deadbands.update(PUBLISH_DEADBANDS)
+        for i in range(meter_count):
+            deadbands.update({f'm{i+1}_{key}': (power_deadband, power_deadband_percent / 100) for key in METER_POWER_PUBLISH_KEYS})
+            deadbands.update({f'm{i+1}_{key}': deadband for key, deadband in METER_PUBLISH_DEADBANDS.items()})
+        return {key: PublishFilter(absolute, relative, min_interval, max_age) for key, (absolute, relative) in deadbands.items()}
+
+    def queued(priority, coalesce=False):
+        """Run the decorated method through the hub command queue.
+
+        Writes run before queued reads. With ``coalesce`` a call made while the
+        same method is still waiting in the queue shares its result.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(self, *args, **kwargs):
+                coalesce_key = func.__name__ if coalesce else None
+                return await self._queue.submit(priority, functools.partial(func, self, *args, **kwargs), coalesce_key=coalesce_key)
+            return wrapper
+        return decorator
+
+    def debounced(func):
+        """Delay the decorated setter by the write debounce window.
+
+        Calls for the same setter within the window replace the pending value,
+        only the last value is written and all callers get its result.
+        """
+        @functools.wraps(func)
+        async def wrapper(self, value):
+            return await self._debounce_write(func.__name__, functools.partial(func, self), value)
+        return wrapper
+
+    async def _debounce_write(self, key, write, value):
+        if not self._write_debounce:
+            return await write(value)
+
+        pending = self._pending_writes.get(key)
+        if not pending is None:
+            self.debounced_writes += 1
+            _LOGGER.debug(f"{key} {pending['value']} replaced by {value}")
+            pending['value'] = value
+            return await asyncio.shield(pending['future'])
+
+        pending = {'value': value, 'future': asyncio.get_running_loop().create_future()}
+        self._pending_writes[key] = pending
+
+        async def write_pending():
+            await asyncio.sleep(self._write_debounce)
+            del self._pending_writes[key]
             try:
-                result = await func(self, *args, **kwargs)
+                pending['future'].set_result(await write(pending['value']))
             except Exception as e:
-                _LOGGER.warning(f'Exception in wrapper {e}')
-                error = e
-            self._busy = False
-            if not error is None:
-                raise error
-            return result
-        return wrapper
+                pending['future'].set_exception(e)
+
+        pending['task'] = asyncio.create_task(write_pending())
+        return await asyncio.shield(pending['future'])
+
+    async def async_init_data(self):
+        """Initialize from the device cache if possible and revalidate it in the background."""
+        store = Store(self._hass, STORAGE_VERSION, f"{DOMAIN}.{self._id}")
+        cached = await store.async_load()
+        if not cached is None and self._client.restore_static_data(cached):
+            _LOGGER.debug(f"Using cached device data of serial {cached['data'].get('i_serial')}")
+            self._create_solar_api()
+            self._commit()
+            self._revalidate_task = self._hass.async_create_background_task(
+                self._revalidate_static_data(store, cached), f"{self._id} revalidate device data")
+            return
+
+        await self.init_data()
+        await store.async_save(self._client.get_static_data())
+
+    async def _revalidate_static_data(self, store, cached):
+        """Read the serial of the inverter, the device data is only read again when it changed."""
+        try:
+            serial = await self.read_serial()
+        except Exception as e:
+            _LOGGER.warning(f"Error revalidating cached device data {e}")
+            return
+        if serial is None:
+            _LOGGER.warning(f"Could not read the serial to revalidate cached device data")
+            return
+        if serial == cached['data'].get('i_serial'):
+            _LOGGER.debug(f"Serial {serial} unchanged, keeping cached device data")
+            return
 
-    @toggle_busy
+        try:
+            await self.init_data()
+        except Exception as e:
+            _LOGGER.warning(f"Error revalidating cached device data {e}")
+            return
+
+        static = self._client.get_static_data()
+        if static == cached:
+            return
+        await store.async_save(static)
+        if (static['data'].get('i_serial') != cached['data'].get('i_serial')
+                or static['attributes'] != cached['attributes']):
+            _LOGGER.info(f"Device {cached['data'].get('i_serial')} changed to {static['data'].get('i_serial')}, reloading")
+            if not self.on_device_changed is None:
+                self.on_device_changed()
+
+    @queued(PRIORITY_READ)
     async def init_data(self, close = False, read_status_data = False):
         await self._hass.async_add_executor_job(self.check_pymodbus_version)  
         result = await self._client.init_data()
 
         if self.storage_configured:
-            result : bool = await self._hass.async_add_executor_job(self._client.get_json_storage_info)                
-
+            self._create_solar_api()
+            # defaults until the Solar API answers, revalidation keeps the cached identity
+            for key, default in (('s_manufacturer', None), ('s_model', 'Battery Storage'), ('s_serial', None)):
+                if not key in self._client.data:
+                    self._client.data[key] = default
+            await self.update_storage_info()
+
+        # entities are notified of values that changed since the cached data was published
+        self._publish()
         return
 
+    @queued(PRIORITY_READ)
+    async def read_serial(self):
+        return await self._client.read_serial()
+
+    def _create_solar_api(self):
+        if self.storage_configured and self._solar_api is None:
+            self._solar_api = SolarApiClient(async_get_clientsession(self._hass), self._host, timeout=SOLAR_API_TIMEOUT)
+
+    async def update_storage_info(self):
+        """Read the battery storage identity from the Solar API, cached for SOLAR_API_SCAN_INTERVAL."""
+        storage_info = await self._solar_api.get_storage_info(max_age=SOLAR_API_SCAN_INTERVAL)
+        if storage_info is None:
+            return
+        for key, value in storage_info.items():
+            self._client.data[f's_{key}'] = value
+
     def check_pymodbus_version(self):
         try:
             installed = Version(version("pymodbus"))
@@ -88,33 +268,33 @@ class Hub:
     def device_info_storage(self) -> dict:
         return {
             "identifiers": {(DOMAIN, f"{self._name}_battery_storage")},
-            "name": f"{self._client.data.get('s_model')}",
-            "manufacturer": self._client.data.get('s_manufacturer'),
-            "model": self._client.data.get('s_model'),
-            "serial_number": self._client.data.get('s_serial'),
+            "name": f"{self.data.get('s_model')}",
+            "manufacturer": self.data.get('s_manufacturer'),
+            "model": self.data.get('s_model'),
+            "serial_number": self.data.get('s_serial'),
         }
 
     @property 
     def device_info_inverter(self) -> dict:
         return {
             "identifiers": {(DOMAIN, f"{self._name}_inverter")},
-            "name": f"Fronius {self._client.data.get('i_model')}",
-            "manufacturer": self._client.data.get('i_manufacturer'),
-            "model": self._client.data.get('i_model'),
-            "serial_number": self._client.data.get('i_serial'),
-            "sw_version": self._client.data.get('i_sw_version'),
-            #"hw_version": f"modbus id-{self._client.data.get('i_unit_id')}",
+            "name": f"Fronius {self.data.get('i_model')}",
+            "manufacturer": self.data.get('i_manufacturer'),
+            "model": self.data.get('i_model'),
+            "serial_number": self.data.get('i_serial'),
+            "sw_version": self.data.get('i_sw_version'),
+            #"hw_version": f"modbus id-{self.data.get('i_unit_id')}",
         }
     
     def get_device_info_meter(self, id) -> dict:
         return {
             "identifiers": {(DOMAIN, f"{self._name}_meter{id}")},
-            "name": f"Fronius {self._client.data.get(f'm{id}_model')} {self._client.data.get(f'm{id}_options')}",
-            "manufacturer": self._client.data.get(f'm{id}_manufacturer'),
-            "model": self._client.data.get(f'm{id}_model'),
-            "serial_number": self._client.data.get(f'm{id}_serial'),
-            "sw_version": self._client.data.get(f'm{id}_sw_version'),
-            #"hw_version": f"modbus id-{self._client.data.get(f'm{id}_unit_id')}",
+            "name": f"Fronius {self.data.get(f'm{id}_model')} {self.data.get(f'm{id}_options')}",
+            "manufacturer": self.data.get(f'm{id}_manufacturer'),
+            "model": self.data.get(f'm{id}_model'),
+            "serial_number": self.data.get(f'm{id}_serial'),
+            "sw_version": self.data.get(f'm{id}_sw_version'),
+            #"hw_version": f"modbus id-{self.data.get(f'm{id}_unit_id')}",
         }
 
     @property
@@ -123,19 +303,26 @@ class Hub:
         return self._id
 
     @callback
-    def async_add_hub_entity(self, update_callback):
-        """Listen for data updates."""
+    def async_add_hub_entity(self, update_callback, keys=None):
+        """Listen for updates of the data ``keys``, of any key when ``keys`` is None."""
         # This is the first entity, set up interval.
         if not self._entities:
             self._unsub_interval_method = async_track_time_interval(
                 self._hass, self.async_refresh_modbus_data, self._scan_interval
             )
         self._entities.append(update_callback)
+        for slot in [None] if keys is None else [self.data_slot(key) for key in keys]:
+            self._subscribers.setdefault(slot, []).append(update_callback)
+        self._update_consumed_keys()
 
     @callback
     def async_remove_hub_entity(self, update_callback):
         """Remove data update."""
         self._entities.remove(update_callback)
+        for callbacks in self._subscribers.values():
+            if update_callback in callbacks:
+                callbacks.remove(update_callback)
+        self._update_consumed_keys()
 
         if not self._entities:
             """stop the interval timer upon removal of last entity"""
@@ -143,65 +330,243 @@ class Hub:
             self._unsub_interval_method = None
             self.close()
 
-    @toggle_busy
+    def _update_consumed_keys(self):
+        """Decode and poll only the data keys of the entities added to Home Assistant.
+
+        Entities disabled in the entity registry are not added, their fields are
+        not decoded and blocks without enabled entities are not read. Enabling an
+        entity reloads the config entry, which subscribes it again.
+        """
+        if self._subscribers.get(None):
+            keys = None
+        else:
+            index_keys = self._client.data.index.keys
+            keys = [index_keys[slot] for slot, callbacks in self._subscribers.items() if callbacks]
+        self._client.set_consumed_keys(keys)
+
+    def _due_tiers(self, now):
+        """Return the polling tiers that are due at monotonic time ``now``."""
+        # allow half a scan interval of jitter so tiers do not slip a cycle
+        tolerance = self._tier_intervals[POLL_TIER_FAST] / 2
+        due = set()
+        for tier, interval in self._tier_intervals.items():
+            last_poll = self._tier_last_poll.get(tier)
+            if last_poll is None or now - last_poll >= interval - tolerance:
+                due.add(tier)
+        return due
+
+    def _sleep_poll_due(self, now):
+        tolerance = self._tier_intervals[POLL_TIER_FAST] / 2
+        return self._last_sleep_poll is None or now - self._last_sleep_poll >= self._sleep_interval - tolerance
+
+    def _update_poll_profile(self, now):
+        """Switch between the full and the sleep profile on the last read operating state."""
+        sleeping = self._client.sleeping
+        if sleeping != self._sleeping:
+            _LOGGER.info(f"Inverter {self._client.data.get('statusvendor')}, {'sleep' if sleeping else 'full'} polling profile")
+            self._sleeping = sleeping
+            self._last_sleep_poll = now
+            if not sleeping:
+                # all tiers are read in the first cycle after waking up
+                self._tier_last_poll.clear()
+        self._client.data['poll_profile'] = 'Sleep' if sleeping else 'Normal'
+
+    def _update_deferred(self, blocks, results, previous_polls, now):
+        """Keep the tiers of deferred blocks due and publish which blocks were deferred."""
+        deferred = [block.name for block in blocks if not block.name in results]
+        for name in deferred:
+            tier = BLOCK_POLL_TIERS[name]
+            if tier in previous_polls:
+                self._tier_last_poll[tier] = previous_polls[tier]
+            else:
+                self._tier_last_poll.pop(tier, None)
+        if deferred:
+            _LOGGER.debug(f"Cycle budget exhausted, deferred {deferred}")
+
+        for name, result in results.items():
+            if result:
+                self._block_last_read[name.rstrip('_')] = now
+        self._client.data['deferred_blocks'] = len(deferred)
+        self._attributes['deferred_blocks'] = {
+            'deferred': deferred,
+            'data_age': {name: round(now - last_read) for name, last_read in sorted(self._block_last_read.items())},
+        }
+
+    def _update_link_state(self):
+        self.online = not self._scheduler.breaker_open
+        self._client.data['link_state'] = self._scheduler.state
+        self._client.data['error_rate'] = self._scheduler.error_rate
+
+    def _update_request_rate(self, now):
+        """Record the requests of this cycle and publish requests per minute."""
+        self._request_log.append((now, self._client.request_count))
+        while now - self._request_log[0][0] > self.REQUEST_RATE_WINDOW:
+            self._request_log.popleft()
+        first_time, first_count = self._request_log[0]
+        if now > first_time:
+            self._client.data['request_rate'] = round((self._client.request_count - first_count) / (now - first_time) * 60, 1)
+
+    def _update_stats(self, cycle_duration):
+        """Publish request statistics of the client and the last cycle."""
+        stats = self._client.stats
+        if cycle_duration > self._tier_intervals[POLL_TIER_FAST]:
+            self._cycle_overruns += 1
+            _LOGGER.debug(f"Refresh took {cycle_duration:.2f}s, longer than the scan interval, overruns: {self._cycle_overruns}")
+        data = self._client.data
+        data['cycle_duration'] = round(cycle_duration * 1000)
+        # cycles that were coalesced had to wait for the previous cycle
+        data['cycle_overruns'] = self._cycle_overruns + self._queue.coalesced
+        data['latency_p50'] = stats.latency.p50
+        data['latency_p95'] = stats.latency.p95
+        data['latency_max'] = stats.latency.max
+        data['retries'] = stats.retries
+        data['exception_responses'] = stats.exception_responses
+        data['failed_requests'] = stats.errors
+        data['bytes_transferred'] = stats.bytes_transferred
+
+        blocks = {}
+        for (unit_id, name), summary in stats.block_summary().items():
+            if unit_id != self._client._inverter_unit_id:
+                name = f'{name} {unit_id}'
+            blocks[name] = f"p50 {summary['p50']} ms, p95 {summary['p95']} ms, max {summary['max']} ms"
+        self._attributes['latency_p95'] = blocks
+
+    def data_slot(self, key) -> int:
+        """Return the data slot of ``key`` for fast access to the snapshot values."""
+        return self._client.data.index.slot(key)
+
+    def published_value(self, slot):
+        """Return the last published value of ``slot``, the current value for slots without a publish filter."""
+        publish_filter = self._publish_filters.get(slot)
+        if publish_filter is None or publish_filter.published_at is None:
+            return self._snapshot.get_slot(slot)
+        return publish_filter.value
+
+    def get_attributes(self, key):
+        """Return extra state attributes of the entity for ``key``."""
+        return self._attributes.get(key)
+
+    @queued(PRIORITY_READ, coalesce=True)
     async def async_refresh_modbus_data(self, _now: Optional[int] = None) -> dict:
         """Time to update."""
 
         if not self._entities:
             return False
 
-        try:
-            update_result = await self._client.read_inverter_data()
-        except Exception as e:
-            _LOGGER.exception("Error reading inverter data", exc_info=True)
-            update_result = False
-
-        try:
-            update_result = await self._client.read_inverter_status_data()
-        except Exception as e:
-            _LOGGER.exception("Error reading inverter status data", exc_info=True)
-            update_result = False
-
-        try:
-            update_result = await self._client.read_inverter_model_settings_data()
-        except Exception as e:
-            _LOGGER.exception("Error reading inverter model settings data", exc_info=True)
-            update_result = False
+        now = time.monotonic()
+        if not self._scheduler.due(now):
+            return False
+        previous_attributes = dict(self._attributes)
+        if self._scheduler.breaker_open:
+            if not await self._check_link(now):
+                self._publish(previous_attributes)
+                return False
+            now = time.monotonic()
+
+        deadline = now + self._tier_intervals[POLL_TIER_FAST] * CYCLE_BUDGET
+        previous_polls = dict(self._tier_last_poll)
+        if self._sleeping:
+            if not self._sleep_poll_due(now):
+                return False
+            self._last_sleep_poll = now
+            blocks = self._client.sleep_poll_blocks
+            read_meters = True
+        else:
+            due_tiers = self._due_tiers(now)
+            for tier in due_tiers:
+                self._tier_last_poll[tier] = now
+
+            blocks = [block for block in self._client.inverter_poll_blocks if BLOCK_POLL_TIERS[block.name] in due_tiers]
+            read_meters = BLOCK_POLL_TIERS['meter'] in due_tiers
+
+            # the Solar API is read next to the Modbus queue on the settings tier
+            if (POLL_TIER_SETTINGS in due_tiers and not self._solar_api is None
+                    and (self._storage_info_task is None or self._storage_info_task.done())):
+                self._storage_info_task = self._hass.async_create_task(self.update_storage_info())
+
+        if not blocks and not (read_meters and self._client.poll_meters):
+            # nothing is due, the cycle is neither a success nor a failure of the link
+            return False
 
+        results = {}
         try:
-            update_result = await self._client.read_inverter_controls_data()
+            results = await self._client.read_poll_data(blocks, read_meters=read_meters, deadline=deadline, deferrable=DEFERRABLE_BLOCKS)
+            update_result = any(results.values())
+            if results.get('inverter'):
+                self._update_poll_profile(now)
         except Exception as e:
-            _LOGGER.exception("Error reading inverter model settings data", exc_info=True)
+            _LOGGER.exception("Error reading inverter data", exc_info=True)
             update_result = False
 
-        if self._client.meter_configured:
-            for meter_address in self._client._meter_unit_ids:
-                try:
-                    update_result = await self._client.read_meter_data(meter_prefix="m1_", unit_id=meter_address)
-                except Exception as e:
-                    _LOGGER.error(f"Error reading meter data {meter_address}.", exc_info=True)
-                    #update_result = False
-
-        if self._client.mppt_configured:
-            try:
-                update_result = await self._client.read_mppt_data()
-            except Exception as e:
-                _LOGGER.exception("Error reading mptt data", exc_info=True)
-                update_result = False
-        
-        if self._client.storage_configured:
-            try:
-                update_result = await self._client.read_inverter_storage_data()
-            except Exception as e:
-                _LOGGER.exception("Error reading inverter storage data", exc_info=True)
-                update_result = False
-
-
-        if update_result:
-            for update_callback in self._entities:
-                update_callback()
-
-    @toggle_busy
+        end = time.monotonic()
+        self._update_deferred(blocks, results, previous_polls, end)
+        self._scheduler.record(end, update_result, end - now)
+        self._update_request_rate(end)
+        self._update_stats(end - now)
+        self._update_link_state()
+
+        self._publish(previous_attributes, end)
+
+        # the storage read can request a calibration step, written after this queued read
+        step = self._client.calibration_step
+        if not step is None and (self._calibration_task is None or self._calibration_task.done()):
+            self._client.calibration_step = None
+            self._calibration_task = self._hass.async_create_task(self.run_calibration_step(step))
+
+    def _commit(self):
+        """Compute derived values and swap in a snapshot of the client buffer."""
+        self._client.update_derived_data()
+        self._snapshot = self._snapshot.commit(self._client.data, dt_util.utcnow())
+
+    def _publish(self, previous_attributes=None, now=None):
+        """Commit the client buffer and update the entities of the changed keys."""
+        previous_data = self._snapshot
+        self._commit()
+        self._notify(self._changed_slots(previous_data, self._attributes if previous_attributes is None else previous_attributes, now))
+
+    def _changed_slots(self, previous_data, previous_attributes, now=None):
+        """Return the data slots whose value or attributes changed since the previous snapshot.
+
+        Slots with a publish filter are returned when the filter publishes their value.
+        """
+        if now is None:
+            now = time.monotonic()
+        values = self._snapshot.values
+        previous = previous_data.values
+        changed = {slot for slot, value in enumerate(values) if slot >= len(previous) or (not previous[slot] is value and previous[slot] != value)}
+        changed.update(self.data_slot(key) for key, value in self._attributes.items() if previous_attributes.get(key) != value)
+        # filtered slots are checked every cycle so that suppressed changes reach the maximum age
+        for slot, publish_filter in self._publish_filters.items():
+            value = self._snapshot.get_slot(slot, MISSING)
+            if not value is MISSING and publish_filter.update(value, now):
+                changed.add(slot)
+            else:
+                changed.discard(slot)
+        return changed
+
+    def _notify(self, changed):
+        """Call the update callbacks of the entities subscribed to ``changed`` slots."""
+        if not changed:
+            return
+        callbacks = dict.fromkeys(self._subscribers.get(None, []))
+        for slot in changed:
+            callbacks.update(dict.fromkeys(self._subscribers.get(slot, [])))
+        _LOGGER.debug(f"{len(changed)} value(s) changed, updating {len(callbacks)} of {len(self._entities)} entities")
+        for update_callback in callbacks:
+            update_callback()
+
+    async def _check_link(self, start):
+        """Run the health probe while the circuit breaker is open, True when the link recovered."""
+        healthy = await self._client.check_health()
+        end = time.monotonic()
+        self._scheduler.record(end, healthy, end - start)
+        self._update_link_state()
+        if healthy:
+            # all tiers are read in the first cycle after the recovery
+            self._tier_last_poll.clear()
+        return healthy
+
+    @queued(PRIORITY_READ)
     async def test_connection(self) -> bool:
         """Test connectivity"""
         try:
@@ -212,12 +577,20 @@ class Hub:
 
     def close(self):
         """Disconnect client."""
-        #with self._lock:
+        for pending in self._pending_writes.values():
+            pending['task'].cancel()
+            pending['future'].cancel()
+        self._pending_writes.clear()
+        for task in (self._storage_info_task, self._revalidate_task, self._calibration_task):
+            if not task is None:
+                task.cancel()
+        self._queue.close()
         self._client.close()
 
     @property
     def data(self):
-        return self._client.data
+        """Snapshot of the last completed cycle."""
+        return self._snapshot
 
     @property
     def meter_configured(self):
@@ -239,7 +612,7 @@ class Hub:
     def storage_extended_control_mode(self):
         return self._client.storage_extended_control_mode
 
-    @toggle_busy
+    @queued(PRIORITY_WRITE)
     async def set_mode(self, mode):
         if mode == 0:
             await self._client.set_auto_mode()
@@ -259,25 +632,42 @@ class Hub:
             await self._client.set_block_charge_mode()
         elif mode == 8:
             await self._client.set_calibrate_mode()
+        self._client.data['ext_control_mode'] = STORAGE_EXT_CONTROL_MODE.get(mode)
+        self._publish()
+
+    @queued(PRIORITY_WRITE)
+    async def run_calibration_step(self, step):
+        await self._client.run_calibration_step(step)
+        self._publish()
 
-    @toggle_busy
+    @debounced
+    @queued(PRIORITY_WRITE)
     async def set_minimum_reserve(self, value):
         await self._client.set_minimum_reserve(value)
+        self._publish()
 
-    @toggle_busy
+    @debounced
+    @queued(PRIORITY_WRITE)
     async def set_charge_limit(self, value):
         await self._client.set_charge_limit(value)
+        self._publish()
 
-    @toggle_busy
+    @debounced
+    @queued(PRIORITY_WRITE)
     async def set_discharge_limit(self, value):
         await self._client.set_discharge_limit(value)
+        self._publish()
 
-    @toggle_busy
+    @debounced
+    @queued(PRIORITY_WRITE)
     async def set_grid_charge_power(self, value):
         await self._client.set_grid_charge_power(value)
+        self._publish()
            
-    @toggle_busy
+    @debounced
+    @queued(PRIORITY_WRITE)
     async def set_grid_discharge_power(self, value):
         await self._client.set_grid_discharge_power(value)
+        self._publish()
 
 
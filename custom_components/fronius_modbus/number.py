@@ -57,18 +57,19 @@ class FroniusModbusNumber(FroniusModbusBaseEntity, NumberEntity):
     def native_value(self) -> float | None:
         """Return the current value in watts."""
 
-        if self._key not in self._hub.data:
+        value = self._hub.data.get_slot(self._slot)
+        if value is None:
             return None
 
         if self._key == "discharge_limit":
             max_rate = self._hub.max_discharge_rate_w or 10000
-            return round(self._hub.data[self._key] / 100.0 * max_rate, 0)
+            return round(value / 100.0 * max_rate, 0)
 
         if self._key == "charge_limit":
             max_rate = self._hub.max_charge_rate_w or 10000
-            return round(self._hub.data[self._key] / 100.0 * max_rate, 0)
+            return round(value / 100.0 * max_rate, 0)
 
-        return self._hub.data[self._key]
+        return value
 
     async def async_set_native_value(self, value: float) -> None:
         """Change the selected value."""
@@ -87,6 +88,11 @@ class FroniusModbusNumber(FroniusModbusBaseEntity, NumberEntity):
         #_LOGGER.debug(f"Number {self._key} set to {value}")
         self.async_write_ha_state()
 
+    @property
+    def subscribed_keys(self):
+        # availability depends on the storage control mode
+        return [self._key, 'ext_control_mode']
+
     @property
     def available(self) -> bool:
         """Return depending on mode."""
@@ -0,0 +1,41 @@
+"""Deadband and rate limit of published sensor values"""
+
+class PublishFilter:
+    """Decides whether a new value of a noisy sensor is published.
+
+    A numeric change is published when it exceeds the absolute or the relative
+    deadband and at least ``min_interval`` seconds passed since the last
+    publish. A value that differs from the published one is always published
+    once the published value is ``max_age`` seconds old.
+    """
+
+    __slots__ = ('absolute', 'relative', 'min_interval', 'max_age', 'value', 'published_at')
+
+    def __init__(self, absolute=0, relative=0, min_interval=0, max_age=300):
+        self.absolute = absolute
+        self.relative = relative
+        self.min_interval = min_interval
+        self.max_age = max_age
+        self.value = None
+        self.published_at = None
+
+    def update(self, value, now) -> bool:
+        """Return True when ``value`` is to be published at monotonic time ``now``."""
+        if self.published_at is None or not is_number(value) or not is_number(self.value):
+            if value == self.value and not self.published_at is None:
+                return False
+        elif value == self.value:
+            return False
+        elif now - self.published_at < self.max_age:
+            if now - self.published_at < self.min_interval:
+                return False
+            if abs(value - self.value) <= max(self.absolute, abs(self.value) * self.relative):
+                return False
+
+        self.value = value
+        self.published_at = now
+        return True
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
@@ -0,0 +1,52 @@
+"""Modbus read request planner"""
+
+# Maximum number of registers in a single FC3 request
+MAX_READ_COUNT = 125
+# Maximum number of unused registers read to merge two blocks
+MAX_READ_GAP = 40
+
+class ReadRequest:
+    """Single holding register read covering one or more blocks."""
+
+    __slots__ = ('address', 'count', 'blocks')
+
+    def __init__(self, address, count, blocks):
+        self.address = address
+        self.count = count
+        self.blocks = blocks
+
+    @property
+    def end(self):
+        return self.address + self.count
+
+    def slice(self, regs, block):
+        """Return the registers of ``block`` from the registers of this request."""
+        start = block.address - self.address
+        return regs[start:start + block.count]
+
+    def __repr__(self):
+        return f'ReadRequest({self.address}, {self.count}, {[block.name for block in self.blocks]})'
+
+
+def plan_reads(blocks, max_count=MAX_READ_COUNT, max_gap=MAX_READ_GAP) -> list[ReadRequest]:
+    """Merge register blocks into the fewest reads within the Modbus request limit.
+
+    Blocks need ``name``, ``address`` and ``count`` attributes. Blocks are merged
+    when they overlap or are separated by at most ``max_gap`` registers and the
+    merged read does not exceed ``max_count`` registers.
+    """
+    requests = []
+    current = None
+    for block in sorted(blocks, key=lambda b: b.address):
+        if block.count > max_count:
+            raise ValueError(f'Block {block.name} exceeds maximum read count {max_count}')
+        block_end = block.address + block.count
+        if (not current is None
+                and block.address - current.end <= max_gap
+                and max(block_end, current.end) - current.address <= max_count):
+            current.count = max(block_end, current.end) - current.address
+            current.blocks.append(block)
+            continue
+        current = ReadRequest(block.address, block.count, [block])
+        requests.append(current)
+    return requests
@@ -0,0 +1,180 @@
+"""Declarative SunSpec register maps"""
+
+import copy
+import struct
+from collections.abc import Sequence
+
+# SunSpec point types: struct format and size in registers
+REGISTER_TYPES = {
+    'uint16': ('H', 1),
+    'int16': ('h', 1),
+    'sunssf': ('h', 1),
+    'enum16': ('H', 1),
+    'bitfield16': ('H', 1),
+    'uint32': ('I', 2),
+    'acc32': ('I', 2),
+    'bitfield32': ('I', 2),
+    'int32': ('i', 2),
+}
+
+_REGISTER = struct.Struct('>H')
+
+class RegisterField:
+    """Single point of a SunSpec register block.
+
+    ``sf`` is either the name of a scale factor field in the same block or a
+    fixed scale factor. Fields without ``key`` are decoded but not published.
+    """
+
+    __slots__ = ('name', 'offset', 'type', 'size', 'key', 'sf', 'digits', 'lower_bound', 'upper_bound', 'enum', 'bitmask', 'default', 'bits')
+
+    def __init__(self, name, offset, type, size=None, key=None, sf=None, digits=2, lower_bound=None, upper_bound=None, enum=None, bitmask=None, default='NA', bits=None):
+        self.name = name
+        self.offset = offset
+        self.type = type
+        if size is None:
+            size = REGISTER_TYPES[type][1]
+        self.size = size
+        self.key = key
+        self.sf = sf
+        self.digits = digits
+        self.lower_bound = lower_bound
+        self.upper_bound = upper_bound
+        self.enum = enum
+        self.bitmask = bitmask
+        self.default = default
+        if bits is None:
+            bits = size * 16
+        self.bits = bits
+
+    @property
+    def format(self):
+        if self.type == 'string':
+            return f'{self.size * 2}s'
+        return REGISTER_TYPES[self.type][0]
+
+    @property
+    def is_scale_factor(self):
+        return self.type == 'sunssf'
+
+    def shifted(self, offset):
+        """Return a copy of this field moved by ``offset`` registers."""
+        field = copy.copy(self)
+        field.offset += offset
+        return field
+
+
+class RegisterBlock:
+    """Register block compiled into a single struct decoder."""
+
+    def __init__(self, name, address, count, fields):
+        self.name = name
+        self.address = address
+        self.count = count
+        self.fields = tuple(sorted(fields, key=lambda f: f.offset))
+        self._by_name = {f.name: f for f in self.fields}
+        self.published = tuple(f for f in self.fields if not f.key is None)
+        self.scale_factors = tuple(f.name for f in self.fields if f.is_scale_factor)
+        self._struct, self._names = self._compile(self.fields, self.count)
+        self._trimmed = {}
+
+    @staticmethod
+    def _compile(fields, count):
+        fmt = ['>']
+        names = []
+        pos = 0
+        for field in fields:
+            if field.offset < pos:
+                raise ValueError(f'Overlapping field {field.name} at offset {field.offset}')
+            if field.offset + field.size > count:
+                raise ValueError(f'Field {field.name} exceeds block length {count}')
+            if field.offset > pos:
+                fmt.append(f'{(field.offset - pos) * 2}x')
+            fmt.append(field.format)
+            names.append(field.name)
+            pos = field.offset + field.size
+        return struct.Struct(''.join(fmt)), tuple(names)
+
+    def field(self, name) -> RegisterField:
+        return self._by_name[name]
+
+    def trimmed(self, scale_factors=True):
+        """Return a block covering only the registers spanned by its fields.
+
+        Without ``scale_factors`` the span is that of the value fields, scale
+        factors outside of it are left out and have to be taken from a cache.
+        """
+        scale_factors = bool(scale_factors)
+        if not scale_factors in self._trimmed:
+            spanning = [f for f in self.fields if scale_factors or not f.is_scale_factor]
+            start = min(f.offset for f in spanning)
+            end = max(f.offset + f.size for f in spanning)
+            fields = [f.shifted(-start) for f in self.fields if f.offset >= start and f.offset + f.size <= end]
+            self._trimmed[scale_factors] = RegisterBlock(self.name, self.address + start, end - start, fields)
+        return self._trimmed[scale_factors]
+
+    def relocated(self, address, count=None):
+        """Return the block at ``address``, limited to ``count`` registers.
+
+        Fields that do not fit into ``count`` registers are left out.
+        """
+        count = self.count if count is None else min(count, self.count)
+        fields = [f for f in self.fields if f.offset + f.size <= count]
+        return RegisterBlock(self.name, address, count, fields)
+
+    @property
+    def size(self):
+        """Size in bytes of the decoded block."""
+        return self._struct.size
+
+    def unpack(self, buffer, offset=0) -> dict:
+        """Return raw values of all fields from a big endian register buffer."""
+        return dict(zip(self._names, self._struct.unpack_from(buffer, offset)))
+
+
+class RegisterBuffer(Sequence):
+    """Read only sequence of 16 bit registers backed by a big endian byte buffer.
+
+    Slices are views of the same buffer, decoders unpack fields from
+    ``buffer`` without building a list of registers first.
+    """
+
+    __slots__ = ('buffer',)
+
+    def __init__(self, buffer):
+        self.buffer = memoryview(buffer)
+
+    def __len__(self):
+        return len(self.buffer) // 2
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return RegisterBuffer(self.buffer[2 * start:2 * max(start, stop)])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('register index out of range')
+        return _REGISTER.unpack_from(self.buffer, 2 * index)[0]
+
+    def __iter__(self):
+        return (value for (value,) in _REGISTER.iter_unpack(self.buffer))
+
+    def __eq__(self, other):
+        if isinstance(other, RegisterBuffer):
+            return self.buffer == other.buffer
+        if isinstance(other, (list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f'RegisterBuffer({list(self)})'
+
+
+def registers_to_bytes(regs):
+    """Return a big endian byte buffer of 16 bit registers, the underlying buffer of a RegisterBuffer."""
+    if isinstance(regs, RegisterBuffer):
+        return regs.buffer
+    return struct.pack(f'>{len(regs)}H', *regs)
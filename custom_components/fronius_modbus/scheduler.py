@@ -0,0 +1,74 @@
+"""Adaptive refresh schedule for failing Modbus links"""
+
+import logging
+import random
+from collections import deque
+
+_LOGGER = logging.getLogger(__name__)
+
+LINK_ONLINE = 'Online'
+LINK_BACKOFF = 'Backing off'
+LINK_OPEN = 'Circuit open'
+
+class AdaptiveScheduler:
+    """Decides when the next refresh cycle runs.
+
+    Failed cycles back off exponentially with jitter. After ``failure_threshold``
+    failed cycles in a row the circuit breaker opens: reads are skipped and only a
+    health probe runs when the backoff delay has passed. A successful probe or
+    cycle closes the breaker and restores the scan interval.
+    """
+
+    def __init__(self, scan_interval, max_interval=300, failure_threshold=3, jitter=0.2, window=20):
+        self._scan_interval = scan_interval
+        self._max_interval = max(scan_interval, max_interval)
+        self._failure_threshold = failure_threshold
+        self._jitter = jitter
+        self._results = deque(maxlen=window)
+        self.failures = 0
+        self.breaker_open = False
+        self.next_attempt = None
+
+    def due(self, now) -> bool:
+        """True when a cycle or health probe may run at monotonic time ``now``."""
+        # allow half a scan interval of jitter so cycles do not slip a timer tick
+        return self.next_attempt is None or now >= self.next_attempt - self._scan_interval / 2
+
+    def backoff(self) -> float:
+        """Return the delay in seconds after the current number of failed cycles."""
+        delay = min(self._max_interval, self._scan_interval * 2 ** (self.failures - 1))
+        return delay * random.uniform(1 - self._jitter, 1 + self._jitter)
+
+    def record(self, now, success, duration):
+        """Record the result of a cycle or health probe that ended at ``now``."""
+        self._results.append(success)
+        if success:
+            if self.failures:
+                _LOGGER.info(f"Modbus link recovered after {self.failures} failed cycle(s)")
+            self.failures = 0
+            self.breaker_open = False
+            # cycles that take longer than the scan interval stretch it instead of overlapping
+            self.next_attempt = now + duration if duration > self._scan_interval else None
+            return
+
+        self.failures += 1
+        if not self.breaker_open and self.failures >= self._failure_threshold:
+            self.breaker_open = True
+            _LOGGER.warning(f"Modbus link failed {self.failures} cycles in a row, reads suspended until a health probe succeeds")
+        self.next_attempt = now + self.backoff()
+        _LOGGER.debug(f"Refresh failed {self.failures} time(s), next attempt in {self.next_attempt - now:.1f}s")
+
+    @property
+    def error_rate(self):
+        """Percentage of failed cycles of the recent cycles, None without cycles."""
+        if not self._results:
+            return None
+        return round(self._results.count(False) / len(self._results) * 100)
+
+    @property
+    def state(self) -> str:
+        if self.breaker_open:
+            return LINK_OPEN
+        if self.failures:
+            return LINK_BACKOFF
+        return LINK_ONLINE
@@ -46,8 +46,7 @@ class FroniusModbusSelect(FroniusModbusBaseEntity, SelectEntity):
 
     @property
     def current_option(self) -> str:
-        if self._key in self._hub.data:
-            return self._hub.data[self._key]
+        return self._hub.data.get_slot(self._slot)
 
     async def async_select_option(self, option: str) -> None:
         """Change the selected option."""
@@ -55,7 +54,6 @@ class FroniusModbusSelect(FroniusModbusBaseEntity, SelectEntity):
 
         await self._hub.set_mode(new_mode)
 
-        self._hub.data[self._key] = option
         # self._hub.storage_extended_control_mode = new_mode
         self.async_write_ha_state()
 
@@ -126,13 +126,12 @@ class FroniusModbusSensor(FroniusModbusBaseEntity, SensorEntity):
     @property
     def state(self):
         """Return the state of the sensor."""
-        if self._key in self._hub.data:
-            value = self._hub.data[self._key]
-            if isinstance(value, str):
-                if len(value)>255:
-                    value = value[:255]
-                    _LOGGER.error(f'state length > 255. k: {self._key} v: {value}')
-            return value
+        value = self._hub.published_value(self._slot)
+        if isinstance(value, str):
+            if len(value)>255:
+                value = value[:255]
+                _LOGGER.error(f'state length > 255. k: {self._key} v: {value}')
+        return value
 
             # self._icon = icon_for_battery_level(
             #     battery_level=self.native_value, charging=False
@@ -140,7 +139,7 @@ class FroniusModbusSensor(FroniusModbusBaseEntity, SensorEntity):
 
     @property
     def extra_state_attributes(self):
-        return None
+        return self._hub.get_attributes(self._key)
 
 
 
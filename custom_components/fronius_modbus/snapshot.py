@@ -0,0 +1,123 @@
+"""Slot indexed working buffer and published snapshots of the device data"""
+
+from collections.abc import Mapping
+
+# value of slots that have not been written
+MISSING = object()
+
+class KeyIndex:
+    """Assigns a fixed integer slot to each data key."""
+
+    __slots__ = ('_slots', 'keys')
+
+    def __init__(self):
+        self._slots = {}
+        self.keys = []
+
+    def slot(self, key) -> int:
+        """Return the slot of ``key``, assigning the next free slot to new keys."""
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = len(self.keys)
+            self.keys.append(key)
+        return slot
+
+    def find(self, key):
+        """Return the slot of ``key``, None for unknown keys."""
+        return self._slots.get(key)
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class SlotMapping(Mapping):
+    """Read access by key to values stored by slot."""
+
+    __slots__ = ()
+
+    def get_slot(self, slot, default=None):
+        if slot < len(self.values):
+            value = self.values[slot]
+            if not value is MISSING:
+                return value
+        return default
+
+    def __getitem__(self, key):
+        slot = self.index.find(key)
+        value = MISSING if slot is None else self.get_slot(slot, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        return (key for key, value in zip(self.index.keys, self.values) if not value is MISSING)
+
+    def __len__(self):
+        return sum(1 for value in self.values if not value is MISSING)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({dict(self)})'
+
+
+class DataBuffer(SlotMapping):
+    """Values the client decodes into, records the slots written since the last commit."""
+
+    __slots__ = ('index', 'values', 'written')
+
+    def __init__(self, index=None):
+        self.index = KeyIndex() if index is None else index
+        self.values = []
+        self.written = set()
+
+    def set_slot(self, slot, value):
+        if slot >= len(self.values):
+            self.values.extend([MISSING] * (slot + 1 - len(self.values)))
+        self.values[slot] = value
+        self.written.add(slot)
+
+    def __setitem__(self, key, value):
+        self.set_slot(self.index.slot(key), value)
+
+    def update(self, values):
+        for key, value in values.items():
+            self.set_slot(self.index.slot(key), value)
+
+    def was_written(self, key) -> bool:
+        """True when ``key`` was written since the last commit."""
+        return self.index.find(key) in self.written
+
+
+class DataSnapshot(SlotMapping):
+    """Immutable copy of the device data published at the end of a cycle.
+
+    ``sequence`` counts the commits, ``timestamp`` is the commit time and
+    ``updated`` holds by slot the commit time at which each value was last written.
+    """
+
+    __slots__ = ('index', 'values', 'sequence', 'timestamp', 'updated')
+
+    def __init__(self, index=None, values=(), sequence=0, timestamp=None, updated=()):
+        self.index = KeyIndex() if index is None else index
+        self.values = tuple(values)
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.updated = tuple(updated)
+
+    def __repr__(self):
+        return f'DataSnapshot({self.sequence}, {self.timestamp}, {dict(self)})'
+
+    def updated_at(self, key):
+        """Return the commit time at which ``key`` was last written, None for unknown keys."""
+        slot = self.index.find(key)
+        if slot is None or slot >= len(self.updated):
+            return None
+        return self.updated[slot]
+
+    def commit(self, buffer: DataBuffer, timestamp):
+        """Return the next snapshot with the values of ``buffer`` and clear its written slots."""
+        updated = list(self.updated)
+        updated.extend([None] * (len(buffer.values) - len(updated)))
+        for slot in buffer.written:
+            updated[slot] = timestamp
+        buffer.written.clear()
+        return DataSnapshot(buffer.index, buffer.values, self.sequence + 1, timestamp, updated)
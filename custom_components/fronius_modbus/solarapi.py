@@ -0,0 +1,78 @@
+"""Fronius Solar API client"""
+
+import asyncio
+import logging
+import time
+
+import aiohttp
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_REALTIME_DATA = 'GetStorageRealtimeData.cgi'
+
+class SolarApiClient:
+    """Reads Solar API endpoints of the datamanager with a timeout and a response cache."""
+
+    def __init__(self, session: aiohttp.ClientSession, host: str, timeout: float = 5) -> None:
+        self._session = session
+        self._host = host
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._cache = {}
+        self._locks = {}
+
+    def url(self, endpoint):
+        return f"http://{self._host}/solar_api/v1/{endpoint}"
+
+    async def get(self, endpoint, max_age=0):
+        """Return the JSON response of ``endpoint``, None on errors.
+
+        Responses younger than ``max_age`` seconds are served from the cache.
+        Concurrent calls for the same endpoint share one request.
+        """
+        lock = self._locks.setdefault(endpoint, asyncio.Lock())
+        async with lock:
+            cached = self._cache.get(endpoint)
+            if not cached is None and time.monotonic() - cached[0] < max_age:
+                return cached[1]
+
+            url = self.url(endpoint)
+            try:
+                async with self._session.get(url, timeout=self._timeout) as response:
+                    if response.status != 200:
+                        _LOGGER.error(f"Error solar api {url} status: {response.status}")
+                        return None
+                    data = await response.json(content_type=None)
+            except asyncio.TimeoutError:
+                _LOGGER.error(f"Timeout reading solar api {url}")
+                return None
+            except Exception as e:
+                _LOGGER.error(f"Error reading solar api {url} {e}")
+                return None
+
+            self._cache[endpoint] = (time.monotonic(), data)
+            return data
+
+    async def get_storage_info(self, max_age=0):
+        """Return manufacturer, model and serial of the first storage controller, None on errors."""
+        data = await self.get(STORAGE_REALTIME_DATA, max_age)
+        if data is None:
+            return None
+
+        try:
+            bodydata = data['Body']['Data']
+        except Exception as e:
+            _LOGGER.error(f"Error no body data in json data: {data}")
+            return None
+
+        for c in bodydata.keys():
+            try:
+                details = bodydata[c]['Controller']['Details']
+                return {
+                    'manufacturer': details['Manufacturer'],
+                    'model': details['Model'],
+                    'serial': str(details['Serial']).strip(),
+                }
+            except Exception as e:
+                _LOGGER.error(f"Error no details in json bodydata: {bodydata}")
+                return None
+        return None
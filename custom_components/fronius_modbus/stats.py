@@ -0,0 +1,86 @@
+"""Modbus request statistics"""
+
+from collections import deque
+
+# Modbus TCP frame sizes: MBAP header 7 bytes, function code 1 byte
+READ_REQUEST_BYTES = 12
+READ_RESPONSE_BYTES = 9
+EXCEPTION_RESPONSE_BYTES = 9
+WRITE_REQUEST_BYTES = 13
+WRITE_RESPONSE_BYTES = 12
+
+class LatencyWindow:
+    """Latencies of the most recent requests."""
+
+    def __init__(self, size=100):
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, fraction):
+        """Return the latency percentile in ms, None without samples."""
+        if not self._samples:
+            return None
+        samples = sorted(self._samples)
+        return round(samples[min(len(samples) - 1, round(fraction * (len(samples) - 1)))] * 1000, 1)
+
+    @property
+    def p50(self):
+        return self.percentile(0.5)
+
+    @property
+    def p95(self):
+        return self.percentile(0.95)
+
+    @property
+    def max(self):
+        if not self._samples:
+            return None
+        return round(max(self._samples) * 1000, 1)
+
+    def summary(self):
+        return {'p50': self.p50, 'p95': self.p95, 'max': self.max}
+
+
+class ModbusStats:
+    """Counters and latencies of the requests of one Modbus client."""
+
+    def __init__(self, window=100):
+        self._window = window
+        self.latency = LatencyWindow(window)
+        self.block_latency = {}
+        self.retries = 0
+        self.exception_responses = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def record_request(self, sent, received=0, exception=False, error=False):
+        """Record the frame sizes of one request.
+
+        ``error`` marks a request that failed after all retries.
+        """
+        self.bytes_sent += sent
+        self.bytes_received += received
+        if exception:
+            self.exception_responses += 1
+        if error:
+            self.errors += 1
+
+    def record_block(self, name, seconds):
+        window = self.block_latency.get(name)
+        if window is None:
+            window = self.block_latency[name] = LatencyWindow(self._window)
+        window.add(seconds)
+
+    @property
+    def bytes_transferred(self):
+        return self.bytes_sent + self.bytes_received
+
+    def block_summary(self):
+        """Return p50, p95 and max latency in ms by (unit id, block name)."""
+        return {key: window.summary() for key, window in sorted(self.block_latency.items())}
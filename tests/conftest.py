@@ -0,0 +1,29 @@
+"""Test setup, the integration modules are imported without Home Assistant."""
+
+import os
+import socket
+import sys
+import types
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.realpath(__file__))
+REPOSITORY_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, REPOSITORY_DIR)
+sys.path.insert(0, os.path.join(REPOSITORY_DIR, 'tools'))
+
+# register the integration packages without running their __init__, which
+# imports Home Assistant, like tools/benchmark.py
+for package in ['custom_components', 'custom_components.fronius_modbus']:
+    if not package in sys.modules:
+        module = types.ModuleType(package)
+        module.__path__ = [os.path.join(REPOSITORY_DIR, *package.split('.'))]
+        sys.modules[package] = module
+
+
+@pytest.fixture
+def port():
+    """Return a free TCP port for a simulator."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
@@ -0,0 +1,105 @@
+"""Priorities, coalescing and cancellation of the command queue."""
+
+import asyncio
+
+import pytest
+
+from custom_components.fronius_modbus.commandqueue import CommandQueue, PRIORITY_READ, PRIORITY_WRITE
+
+
+def command(log, name, result=None, event=None):
+    async def func():
+        if not event is None:
+            await event.wait()
+        log.append(name)
+        return result
+    return func
+
+
+def test_writes_run_before_queued_reads():
+    async def test():
+        queue = CommandQueue('test')
+        log = []
+        release = asyncio.Event()
+        first = queue.submit(PRIORITY_READ, command(log, 'read 1', event=release))
+        await asyncio.sleep(0)
+        second = queue.submit(PRIORITY_READ, command(log, 'read 2'))
+        write = queue.submit(PRIORITY_WRITE, command(log, 'write'))
+        release.set()
+        await asyncio.gather(first, second, write)
+        assert log == ['read 1', 'write', 'read 2']
+        queue.close()
+    asyncio.run(test())
+
+
+def test_waiting_commands_are_coalesced():
+    async def test():
+        queue = CommandQueue('test')
+        log = []
+        release = asyncio.Event()
+        busy = queue.submit(PRIORITY_WRITE, command(log, 'write', event=release))
+        first = queue.submit(PRIORITY_READ, command(log, 'refresh', 1), coalesce_key='refresh')
+        second = queue.submit(PRIORITY_READ, command(log, 'refresh', 2), coalesce_key='refresh')
+        release.set()
+        assert await asyncio.gather(busy, first, second) == [None, 1, 1]
+        assert log == ['write', 'refresh']
+        assert queue.coalesced == 1
+
+        # a command that already runs is not coalesced with a new one
+        third = queue.submit(PRIORITY_READ, command(log, 'refresh', 3), coalesce_key='refresh')
+        assert await third == 3
+        queue.close()
+    asyncio.run(test())
+
+
+def test_cancelled_caller_does_not_cancel_coalesced_callers():
+    async def test():
+        queue = CommandQueue('test')
+        log = []
+        release = asyncio.Event()
+        busy = queue.submit(PRIORITY_WRITE, command(log, 'write', event=release))
+
+        async def caller():
+            return await queue.submit(PRIORITY_READ, command(log, 'refresh', 1), coalesce_key='refresh')
+
+        first = asyncio.create_task(caller())
+        second = asyncio.create_task(caller())
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        assert await second == 1
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        await busy
+        assert log == ['write', 'refresh']
+        queue.close()
+    asyncio.run(test())
+
+
+def test_exceptions_are_passed_to_the_caller():
+    async def test():
+        queue = CommandQueue('test')
+
+        async def fail():
+            raise ValueError('failed')
+
+        with pytest.raises(ValueError):
+            await queue.submit(PRIORITY_WRITE, fail)
+        # the worker keeps running
+        assert await queue.submit(PRIORITY_READ, command([], 'read', 1)) == 1
+        queue.close()
+    asyncio.run(test())
+
+
+def test_close_cancels_queued_commands():
+    async def test():
+        queue = CommandQueue('test')
+        release = asyncio.Event()
+        busy = queue.submit(PRIORITY_WRITE, command([], 'write', event=release))
+        queued = queue.submit(PRIORITY_READ, command([], 'read'))
+        await asyncio.sleep(0)
+        queue.close()
+        assert queued.cancelled()
+        with pytest.raises(asyncio.CancelledError):
+            await busy
+    asyncio.run(test())
@@ -0,0 +1,51 @@
+"""Deadbands and rate limits of published values."""
+
+from custom_components.fronius_modbus.publishfilter import PublishFilter
+
+
+def test_first_value_is_published():
+    publish_filter = PublishFilter(absolute=10)
+    assert publish_filter.update(100, 0)
+    assert not publish_filter.update(100, 1)
+
+
+def test_absolute_deadband():
+    publish_filter = PublishFilter(absolute=10)
+    publish_filter.update(100, 0)
+    assert not publish_filter.update(110, 1)
+    assert publish_filter.update(111, 2)
+    assert publish_filter.value == 111
+
+
+def test_relative_deadband():
+    publish_filter = PublishFilter(relative=0.05)
+    publish_filter.update(1000, 0)
+    assert not publish_filter.update(1050, 1)
+    assert publish_filter.update(949, 2)
+
+
+def test_min_interval():
+    publish_filter = PublishFilter(absolute=10, min_interval=5)
+    publish_filter.update(100, 0)
+    assert not publish_filter.update(200, 4)
+    assert publish_filter.update(200, 5)
+
+
+def test_max_age_publishes_changes_within_the_deadband():
+    publish_filter = PublishFilter(absolute=10, max_age=60)
+    publish_filter.update(100, 0)
+    assert not publish_filter.update(105, 59)
+    assert publish_filter.update(105, 60)
+    # an unchanged value is not published again
+    assert not publish_filter.update(105, 200)
+
+
+def test_values_that_are_not_numbers():
+    publish_filter = PublishFilter(absolute=10)
+    publish_filter.update(100, 0)
+    assert publish_filter.update(None, 1)
+    assert publish_filter.update(101, 2)
+    assert publish_filter.update('Normal', 3)
+    assert not publish_filter.update('Normal', 4)
+    assert publish_filter.update(True, 5)
+    assert publish_filter.update(False, 6)
@@ -0,0 +1,49 @@
+"""Merging of register blocks into read requests."""
+
+import pytest
+
+from custom_components.fronius_modbus.readplanner import plan_reads, MAX_READ_COUNT
+from custom_components.fronius_modbus.registermap import RegisterBlock
+
+
+def block(name, address, count):
+    return RegisterBlock(name, address, count, [])
+
+
+def test_adjacent_and_close_blocks_are_merged():
+    requests = plan_reads([block('b', 120, 10), block('a', 100, 10), block('c', 170, 5)], max_gap=40)
+    assert len(requests) == 1
+    assert (requests[0].address, requests[0].count) == (100, 75)
+    assert [b.name for b in requests[0].blocks] == ['a', 'b', 'c']
+
+
+def test_gap_limit():
+    requests = plan_reads([block('a', 100, 10), block('b', 151, 10)], max_gap=40)
+    assert [(r.address, r.count) for r in requests] == [(100, 10), (151, 10)]
+    requests = plan_reads([block('a', 100, 10), block('b', 150, 10)], max_gap=40)
+    assert [(r.address, r.count) for r in requests] == [(100, 60)]
+
+
+def test_count_limit():
+    requests = plan_reads([block('a', 100, 60), block('b', 160, 66)])
+    assert [(r.address, r.count) for r in requests] == [(100, 60), (160, 66)]
+    requests = plan_reads([block('a', 100, 60), block('b', 160, 65)])
+    assert [(r.address, r.count) for r in requests] == [(100, MAX_READ_COUNT)]
+
+
+def test_overlapping_blocks():
+    requests = plan_reads([block('a', 100, 20), block('b', 110, 5)])
+    assert [(r.address, r.count) for r in requests] == [(100, 20)]
+
+
+def test_block_exceeding_count_limit():
+    with pytest.raises(ValueError):
+        plan_reads([block('a', 100, MAX_READ_COUNT + 1)])
+
+
+def test_slice():
+    a, b = block('a', 100, 3), block('b', 105, 2)
+    request = plan_reads([a, b])[0]
+    regs = list(range(100, 107))
+    assert request.slice(regs, a) == [100, 101, 102]
+    assert request.slice(regs, b) == [105, 106]
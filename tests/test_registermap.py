@@ -0,0 +1,61 @@
+"""Register block layouts and decoding."""
+
+from custom_components.fronius_modbus.registermap import RegisterBlock, RegisterField, RegisterBuffer, registers_to_bytes
+
+BLOCK = RegisterBlock('test', 1000, 12, [
+    RegisterField('A', 2, 'uint16', key='a', sf='SF'),
+    RegisterField('B', 4, 'int32', key='b'),
+    RegisterField('SF', 8, 'sunssf'),
+    RegisterField('C', 9, 'uint16', key='c'),
+])
+
+
+def test_unpack():
+    regs = [0] * 12
+    regs[2] = 1234
+    regs[4:6] = [0xFFFF, 0xFFFE]
+    regs[8] = 0xFFFE
+    regs[9] = 7
+    assert BLOCK.unpack(registers_to_bytes(regs)) == {'A': 1234, 'B': -2, 'SF': -2, 'C': 7}
+
+
+def test_trimmed_with_scale_factors():
+    trimmed = BLOCK.trimmed()
+    assert (trimmed.address, trimmed.count) == (1002, 8)
+    assert [(f.name, f.offset) for f in trimmed.fields] == [('A', 0), ('B', 2), ('SF', 6), ('C', 7)]
+    assert BLOCK.trimmed() is trimmed
+
+
+def test_trimmed_without_scale_factors():
+    block = RegisterBlock('test', 1000, 12, [
+        RegisterField('SF', 0, 'sunssf'),
+        RegisterField('A', 3, 'uint16', key='a', sf='SF'),
+        RegisterField('B', 5, 'uint16', key='b', sf='SF'),
+    ])
+    trimmed = block.trimmed(scale_factors=False)
+    assert (trimmed.address, trimmed.count) == (1003, 3)
+    assert [(f.name, f.offset) for f in trimmed.fields] == [('A', 0), ('B', 2)]
+    assert trimmed.scale_factors == ()
+    assert block.trimmed().count == 6
+
+
+def test_relocated():
+    relocated = BLOCK.relocated(2000)
+    assert (relocated.address, relocated.count) == (2000, 12)
+    assert [f.name for f in relocated.fields] == ['A', 'B', 'SF', 'C']
+
+    # fields beyond a shorter model are left out
+    shorter = BLOCK.relocated(2000, 9)
+    assert shorter.count == 9
+    assert [f.name for f in shorter.fields] == ['A', 'B', 'SF']
+
+    # a longer model does not extend the block
+    assert BLOCK.relocated(2000, 20).count == 12
+
+
+def test_register_buffer():
+    buffer = RegisterBuffer(registers_to_bytes([1, 2, 0xFFFF]))
+    assert len(buffer) == 3
+    assert list(buffer) == [1, 2, 0xFFFF]
+    assert buffer[1:] == [2, 0xFFFF]
+    assert registers_to_bytes(buffer) == registers_to_bytes([1, 2, 0xFFFF])
@@ -0,0 +1,58 @@
+"""Backoff and circuit breaker of the refresh schedule."""
+
+from custom_components.fronius_modbus.scheduler import AdaptiveScheduler, LINK_ONLINE, LINK_BACKOFF, LINK_OPEN
+
+
+def scheduler():
+    return AdaptiveScheduler(scan_interval=10, max_interval=60, failure_threshold=3, jitter=0)
+
+
+def test_backoff_doubles_up_to_the_maximum():
+    schedule = scheduler()
+    delays = []
+    for _ in range(5):
+        schedule.record(100, False, 1)
+        delays.append(schedule.next_attempt - 100)
+    assert delays == [10, 20, 40, 60, 60]
+
+
+def test_due():
+    schedule = scheduler()
+    assert schedule.due(0)
+    schedule.record(100, False, 1)
+    assert not schedule.due(104)
+    # half a scan interval early still counts as due
+    assert schedule.due(105)
+
+
+def test_breaker_opens_after_failure_threshold():
+    schedule = scheduler()
+    schedule.record(100, False, 1)
+    schedule.record(110, False, 1)
+    assert schedule.state == LINK_BACKOFF
+    assert not schedule.breaker_open
+    schedule.record(130, False, 1)
+    assert schedule.breaker_open
+    assert schedule.state == LINK_OPEN
+
+    schedule.record(170, True, 1)
+    assert not schedule.breaker_open
+    assert schedule.failures == 0
+    assert schedule.next_attempt is None
+    assert schedule.state == LINK_ONLINE
+
+
+def test_slow_cycles_stretch_the_interval():
+    schedule = scheduler()
+    schedule.record(100, True, 15)
+    assert schedule.next_attempt == 115
+    schedule.record(115, True, 5)
+    assert schedule.next_attempt is None
+
+
+def test_error_rate():
+    schedule = scheduler()
+    assert schedule.error_rate is None
+    for success in (True, True, False, True):
+        schedule.record(100, success, 1)
+    assert schedule.error_rate == 25
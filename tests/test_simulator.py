@@ -0,0 +1,157 @@
+"""FroniusModbusClient and Hub against the GEN24 simulator."""
+
+import asyncio
+import types
+
+import pytest
+
+from custom_components.fronius_modbus.froniusmodbusclient import FroniusModbusClient
+from custom_components.fronius_modbus.froniusmodbusclient_const import INVERTER_BLOCK, STORAGE_BLOCK
+from gen24_simulator import Gen24Simulator
+
+INVERTER_UNIT_ID = 1
+METER_UNIT_ID = 200
+
+
+def run_with_client(port, test, **simulator_options):
+    """Run ``test(simulator, client)`` with an initialized client of a simulator."""
+    async def run():
+        async with Gen24Simulator(port=port, meter_unit_ids=[METER_UNIT_ID], seed=0, **simulator_options) as simulator:
+            client = FroniusModbusClient('127.0.0.1', port, INVERTER_UNIT_ID, [METER_UNIT_ID], timeout=1)
+            try:
+                await client.init_data()
+                await test(simulator, client)
+            finally:
+                client.close()
+    asyncio.run(run())
+
+
+def test_decoded_values(port):
+    async def test(simulator, client):
+        results = await client.read_poll_data(client.inverter_poll_blocks)
+        assert all(results.values())
+        client.update_derived_data()
+        data = client.data
+
+        assert data['i_manufacturer'] == 'Fronius'
+        assert data['i_model'] == 'Primo GEN24 6.0 Plus'
+        assert data['i_serial'] == '34123456'
+        assert data['m1_serial'] == '12345678'
+        assert client.storage_configured and client.mppt_configured and client.meter_configured
+        assert client.max_charge_rate_w == 5120
+
+        # scaled by the V_SF, Hz_SF and Tmp_SF scale factors of the image
+        assert data['PhVphA'] == 230.1
+        assert data['line_frequency'] == 50.0
+        assert data['tempcab'] == 41.2
+        assert data['statusvendor'] == 'Normal'
+        assert data['soc'] == 65.5
+        assert data['minimum_reserve'] == 7.0
+        assert data['control_mode'] == 'Auto'
+        assert data['storage_power'] == 500
+        assert data['pv_power'] == data['mppt1_power'] + data['mppt2_power']
+        assert data['load'] == data['acpower'] + data['m1_power']
+
+    run_with_client(port, test)
+
+
+def test_storage_writes_are_read_back(port):
+    async def test(simulator, client):
+        storage = [client.block(STORAGE_BLOCK.name)]
+        await client.read_poll_data(storage, read_meters=False)
+
+        await client.change_settings(1, 40, 20, minimum_reserve=25)
+
+        image = simulator.inverter.image
+        assert image.get(client.storage_address('StorCtl_Mod'), 1) == [1]
+        assert image.get(client.storage_address('MinRsvPct'), 1) == [2500]
+        assert image.get(client.storage_address('OutWRte'), 2) == [2000, 4000]
+        results = await client.read_poll_data(storage, read_meters=False)
+        assert results[STORAGE_BLOCK.name]
+        assert client.data['control_mode'] == 'Charge'
+        assert client.data['minimum_reserve'] == 25.0
+        assert client.data['discharging_power'] == 20.0
+        assert client.data['charging_power'] == 40.0
+
+    run_with_client(port, test)
+
+
+def test_storage_writes_without_read_only_registers(port):
+    async def test(simulator, client):
+        storage = [client.block(STORAGE_BLOCK.name)]
+        await client.read_poll_data(storage, read_meters=False)
+        writes = simulator.writes
+
+        await client.change_settings(2, 30, 60)
+
+        # the span write covering read only registers is rejected, the writable runs are not
+        assert simulator.writes - writes == 2
+        image = simulator.inverter.image
+        assert image.get(client.storage_address('StorCtl_Mod'), 1) == [2]
+        assert image.get(client.storage_address('OutWRte'), 2) == [6000, 3000]
+
+    run_with_client(port, test, reject_readonly_writes=True)
+
+
+def test_exception_responses(port):
+    async def test(simulator, client):
+        inverter = [client.block(INVERTER_BLOCK.name)]
+        simulator.exception_rate = 1.0
+        results = await client.read_poll_data(inverter, read_meters=False)
+        assert results[INVERTER_BLOCK.name] == False
+        assert client.stats.exception_responses > 0
+        assert simulator.exceptions > 0
+
+        simulator.exception_rate = 0.0
+        results = await client.read_poll_data(inverter, read_meters=False)
+        assert results[INVERTER_BLOCK.name] == True
+
+    run_with_client(port, test)
+
+
+def test_dropped_connections(port):
+    async def test(simulator, client):
+        inverter = [client.block(INVERTER_BLOCK.name)]
+        simulator.drop_rate = 1.0
+        results = await client.read_poll_data(inverter, read_meters=False)
+        assert results[INVERTER_BLOCK.name] == False
+        assert simulator.drops > 0
+
+        # the client reconnects with the next request
+        simulator.drop_rate = 0.0
+        results = await client.read_poll_data(inverter, read_meters=False)
+        assert results[INVERTER_BLOCK.name] == True
+        assert client.connected
+
+    run_with_client(port, test)
+
+
+def test_hub_refresh_and_write(port):
+    pytest.importorskip('homeassistant')
+    from custom_components.fronius_modbus.hub import Hub
+
+    async def run():
+        async with Gen24Simulator(port=port, meter_unit_ids=[METER_UNIT_ID], seed=0) as simulator:
+            hass = types.SimpleNamespace(async_create_task=asyncio.create_task)
+            hub = Hub(hass, 'test', '127.0.0.1', port, INVERTER_UNIT_ID, [METER_UNIT_ID], scan_interval=10)
+            try:
+                await hub._client.init_data()
+                # subscribe like an entity without starting the refresh timer
+                updates = []
+                update_callback = lambda: updates.append(True)
+                hub._entities.append(update_callback)
+                hub._subscribers[None] = [update_callback]
+
+                await hub.async_refresh_modbus_data()
+                assert updates
+                assert hub.online
+                assert hub.data['i_serial'] == '34123456'
+                assert hub.data['soc'] == 65.5
+
+                await hub.set_mode(1)
+                assert simulator.inverter.image.get(hub._client.storage_address('StorCtl_Mod'), 1) == [1]
+                assert hub.data['ext_control_mode'] == 'PV Charge Limit'
+            finally:
+                hub.close()
+
+    asyncio.run(run())
@@ -0,0 +1,89 @@
+"""Grouping and ordering of storage control writes."""
+
+import asyncio
+
+from custom_components.fronius_modbus.froniusmodbusclient import FroniusModbusClient
+from custom_components.fronius_modbus.froniusmodbusclient_const import STORAGE_BLOCK
+
+MODE = 40348
+RESERVE = 40350
+DISCHARGE = 40355
+CHARGE = 40356
+GRID_CHARGING = 40360
+
+
+class RecordingClient(FroniusModbusClient):
+    """Client that records register writes instead of sending them."""
+
+    def __init__(self, rejected=()):
+        super().__init__(host='127.0.0.1', port=0, inverter_unit_id=1, meter_unit_ids=[], timeout=1)
+        self.writes = []
+        self.rejected = rejected
+        self.registers = [0] * STORAGE_BLOCK.count
+
+    async def write_registers(self, unit_id, address, payload):
+        if len(payload) in self.rejected:
+            raise Exception('rejected')
+        self.writes.append((address, list(payload)))
+
+    async def get_registers(self, unit_id, address, count, retries = 0, deadline = None, deferrable = False):
+        start = address - STORAGE_BLOCK.address
+        return self.registers[start:start + count]
+
+
+def run(test):
+    async def run_test():
+        client = RecordingClient()
+        await test(client)
+    asyncio.run(run_test())
+
+
+def test_storage_addresses():
+    async def test(client):
+        assert [client.storage_address(name) for name in ('StorCtl_Mod', 'MinRsvPct', 'OutWRte', 'InWRte', 'ChaGriSet')] == [MODE, RESERVE, DISCHARGE, CHARGE, GRID_CHARGING]
+    run(test)
+
+
+def test_runs_span_only_writable_registers():
+    async def test(client):
+        assert client.storage_write_runs({DISCHARGE: 1, CHARGE: 2}) == [[DISCHARGE, CHARGE]]
+        # 40357 to 40359 are read only
+        assert client.storage_write_runs({CHARGE: 1, GRID_CHARGING: 2}) == [[CHARGE], [GRID_CHARGING]]
+        assert client.storage_write_runs({RESERVE: 1}) == [[RESERVE]]
+    run(test)
+
+
+def test_run_of_the_mode_is_last():
+    async def test(client):
+        runs = client.storage_write_runs({MODE: 1, RESERVE: 2, DISCHARGE: 3, CHARGE: 4})
+        assert runs == [[RESERVE], [DISCHARGE, CHARGE], [MODE]]
+    run(test)
+
+
+def test_single_writes_without_image_write_the_mode_last():
+    async def test(client):
+        await client.change_settings(1, 40, 20, minimum_reserve=25)
+        assert [address for address, _ in client.writes] == [CHARGE, DISCHARGE, RESERVE, MODE]
+    run(test)
+
+
+def test_changed_span_is_written_at_once():
+    async def test(client):
+        client.registers[MODE - STORAGE_BLOCK.address + 1] = 77  # read only
+        client.decode_inverter_storage_data(list(client.registers))
+        await client.change_settings(1, 40, 20)
+        assert client.writes == [(MODE, [1, 77, 0, 0, 0, 0, 0, 2000, 4000])]
+
+        # unchanged registers are not written again
+        await client.change_settings(1, 40, 30)
+        assert client.writes[1:] == [(DISCHARGE, [3000])]
+    run(test)
+
+
+def test_rejected_span_falls_back_to_runs():
+    async def test(client):
+        client.rejected = (9,)
+        client.decode_inverter_storage_data(list(client.registers))
+        await client.change_settings(2, 40, 20)
+        assert client.writes == [(DISCHARGE, [2000, 4000]), (MODE, [2])]
+    run(test)
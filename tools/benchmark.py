@@ -0,0 +1,248 @@
+"""Benchmarks for the register decode paths and full refresh cycles
+
+Decode benchmarks run the ``read_*`` methods of FroniusModbusClient against
+captured register payloads. Refresh benchmarks poll the GEN24 simulator over
+Modbus TCP. Results are printed as JSON and compared with the thresholds in
+benchmark_thresholds.json, the exit code is 1 when a threshold is exceeded.
+
+    python tools/benchmark.py --output results.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import types
+
+TOOLS_DIR = os.path.dirname(os.path.realpath(__file__))
+REPOSITORY_DIR = os.path.dirname(TOOLS_DIR)
+sys.path.insert(0, REPOSITORY_DIR)
+sys.path.insert(0, TOOLS_DIR)
+
+# register the integration packages without running their __init__, which
+# imports Home Assistant, so the client modules can be used on their own
+for package in ['custom_components', 'custom_components.fronius_modbus']:
+    if not package in sys.modules:
+        module = types.ModuleType(package)
+        module.__path__ = [os.path.join(REPOSITORY_DIR, *package.split('.'))]
+        sys.modules[package] = module
+
+from custom_components.fronius_modbus.froniusmodbusclient import FroniusModbusClient
+from custom_components.fronius_modbus.froniusmodbusclient_const import (
+    DEVICE_INFO_BLOCK,
+    INVERTER_BLOCK,
+    NAMEPLATE_BLOCK,
+    MPPT_BLOCK,
+    STORAGE_BLOCK,
+    METER_BLOCK,
+)
+from custom_components.fronius_modbus.registermap import RegisterBuffer, registers_to_bytes
+from gen24_simulator import Gen24Simulator, SUNSPEC_ADDRESS
+
+INVERTER_UNIT_ID = 1
+METER_UNIT_ID = 200
+DEFAULT_THRESHOLDS = os.path.join(TOOLS_DIR, 'benchmark_thresholds.json')
+
+
+class CapturedClient(FroniusModbusClient):
+    """Client that serves register reads from captured payloads instead of the network."""
+
+    def __init__(self, payloads):
+        super().__init__(host='127.0.0.1', port=0, inverter_unit_id=INVERTER_UNIT_ID, meter_unit_ids=[METER_UNIT_ID], timeout=1)
+        # served as views of one buffer per unit, like the payloads of Modbus responses
+        self._payloads = {unit_id: (start, RegisterBuffer(registers_to_bytes(registers))) for unit_id, (start, registers) in payloads.items()}
+
+    async def get_registers(self, unit_id, address, count, retries = 0, deadline = None, deferrable = False):
+        start, registers = self._payloads[unit_id]
+        return registers[address - start:address - start + count]
+
+
+def simulator_payloads(storage=True):
+    """Return captured payloads by unit id from the simulator register images."""
+    simulator = Gen24Simulator(storage=storage, meter_unit_ids=[METER_UNIT_ID], seed=0)
+    return {
+        INVERTER_UNIT_ID: (SUNSPEC_ADDRESS, list(simulator.inverter.image.registers)),
+        METER_UNIT_ID: (SUNSPEC_ADDRESS, list(simulator.meters[METER_UNIT_ID].image.registers)),
+    }
+
+
+def load_payloads(path):
+    """Load payloads saved as {unit_id: {"address": start, "registers": [...]}}."""
+    with open(path) as file:
+        data = json.load(file)
+    return {int(unit_id): (payload['address'], payload['registers']) for unit_id, payload in data.items()}
+
+
+async def time_call(func, iterations, repeat=5):
+    """Return the fastest mean duration of ``func`` in microseconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            await func()
+        elapsed = (time.perf_counter() - start) / iterations * 1e6
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 2)
+
+
+async def benchmark_decode(payloads, iterations):
+    client = CapturedClient(payloads)
+    regs = await client.read_blocks(INVERTER_UNIT_ID, [DEVICE_INFO_BLOCK])
+    client.decode_device_info_data(regs[DEVICE_INFO_BLOCK.name], prefix='i_', unit_id=INVERTER_UNIT_ID)
+    nameplate = client.block(NAMEPLATE_BLOCK.name)
+    regs = await client.read_blocks(INVERTER_UNIT_ID, [client.block_layout(nameplate, INVERTER_UNIT_ID)])
+    client.decode_inverter_nameplate_data(regs[nameplate.name])
+    decoders = {
+        'device_info': (INVERTER_UNIT_ID, DEVICE_INFO_BLOCK, lambda regs: client.decode_device_info_data(regs, prefix='i_', unit_id=INVERTER_UNIT_ID)),
+        'inverter': (INVERTER_UNIT_ID, client.block(INVERTER_BLOCK.name), client.decode_inverter_data),
+        'mppt': (INVERTER_UNIT_ID, client.block(MPPT_BLOCK.name), client.decode_mppt_data),
+        'storage': (INVERTER_UNIT_ID, client.block(STORAGE_BLOCK.name), client.decode_inverter_storage_data),
+        'meter': (METER_UNIT_ID, client.block(METER_BLOCK.name, METER_UNIT_ID), lambda regs: client.decode_meter_data(regs, 'm1_', METER_UNIT_ID)),
+    }
+    results = {}
+    for name, (unit_id, block, decode) in decoders.items():
+        # the first read caches the scale factors, the following ones leave them out like the poll
+        for _ in range(2):
+            regs = (await client.read_blocks(unit_id, [client.block_layout(block, unit_id)]))[block.name]
+            if not decode(regs):
+                raise Exception(f'Decoding {name} failed')
+
+        async def decode_regs(decode=decode, regs=regs):
+            return decode(regs)
+        results[name] = {'us_per_call': await time_call(decode_regs, iterations)}
+    return results
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(fraction * (len(values) - 1)))]
+
+
+def latency_summary(durations, request_counts):
+    return {
+        'cycles': len(durations),
+        'latency_ms_p50': round(statistics.median(durations) * 1000, 2),
+        'latency_ms_p95': round(percentile(durations, 0.95) * 1000, 2),
+        'latency_ms_max': round(max(durations) * 1000, 2),
+        'requests_first_cycle': request_counts[0],
+        'requests_per_cycle': round(statistics.mean(request_counts[1:] or request_counts), 2),
+    }
+
+
+async def benchmark_client_cycle(port, cycles, max_connections):
+    """Time FroniusModbusClient.read_poll_data of all blocks and meters."""
+    client = FroniusModbusClient(host='127.0.0.1', port=port, inverter_unit_id=INVERTER_UNIT_ID, meter_unit_ids=[METER_UNIT_ID], timeout=3, max_connections=max_connections)
+    await client.init_data()
+    durations = []
+    request_counts = []
+    try:
+        for _ in range(cycles):
+            requests = client.request_count
+            start = time.perf_counter()
+            results = await client.read_poll_data(client.inverter_poll_blocks)
+            durations.append(time.perf_counter() - start)
+            request_counts.append(client.request_count - requests)
+            if not all(results.values()):
+                raise Exception(f'Refresh failed {results}')
+    finally:
+        client.close()
+    return latency_summary(durations, request_counts)
+
+
+async def benchmark_hub_refresh(port, cycles, max_connections):
+    """Time Hub.async_refresh_modbus_data including tiers and the command queue."""
+    from custom_components.fronius_modbus.hub import Hub
+
+    hub = Hub(None, 'benchmark', '127.0.0.1', port, INVERTER_UNIT_ID, [METER_UNIT_ID], scan_interval=10, max_connections=max_connections)
+    # init_data of the hub also fetches the Solar API, only the Modbus part is measured
+    await hub._client.init_data()
+    updates = []
+    update_callback = lambda: updates.append(True)
+    hub._entities.append(update_callback)
+    hub._subscribers[None] = [update_callback]
+    durations = []
+    request_counts = []
+    try:
+        for _ in range(cycles):
+            # the cycles run back to back, make all tiers due as in a cycle of the slowest tier
+            hub._tier_last_poll.clear()
+            requests = hub._client.request_count
+            start = time.perf_counter()
+            await hub.async_refresh_modbus_data()
+            durations.append(time.perf_counter() - start)
+            request_counts.append(hub._client.request_count - requests)
+    finally:
+        hub.close()
+    if len(updates) != cycles:
+        raise Exception(f'Only {len(updates)} of {cycles} refresh cycles updated entities')
+    return latency_summary(durations, request_counts)
+
+
+async def run_benchmarks(args):
+    payloads = load_payloads(args.payloads) if args.payloads else simulator_payloads()
+    results = {'decode': await benchmark_decode(payloads, args.iterations)}
+
+    async with Gen24Simulator(port=args.port, meter_unit_ids=[METER_UNIT_ID], latency=args.latency / 1000, seed=0):
+        results['client_cycle'] = await benchmark_client_cycle(args.port, args.cycles, args.max_connections)
+        try:
+            results['hub_refresh'] = await benchmark_hub_refresh(args.port, args.cycles, args.max_connections)
+        except ImportError as e:
+            logging.warning(f'Skipping hub refresh benchmark, Home Assistant is not installed: {e}')
+    return results
+
+
+def check_thresholds(results, thresholds, path=()):
+    """Return the metrics of ``results`` that exceed their threshold."""
+    regressions = []
+    for key, threshold in thresholds.items():
+        if not key in results:
+            continue
+        if isinstance(threshold, dict):
+            regressions.extend(check_thresholds(results[key], threshold, path + (key,)))
+        elif results[key] > threshold:
+            regressions.append({'metric': '.'.join(path + (key,)), 'value': results[key], 'threshold': threshold})
+    return regressions
+
+
+def drop_latency_thresholds(thresholds):
+    return {key: drop_latency_thresholds(value) if isinstance(value, dict) else value
+            for key, value in thresholds.items() if not key.startswith('latency')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fronius Modbus benchmarks')
+    parser.add_argument('--port', type=int, default=5020, help='port of the local simulator')
+    parser.add_argument('--payloads', help='JSON file with captured register payloads by unit id')
+    parser.add_argument('--iterations', type=int, default=1000, help='decode calls per measurement')
+    parser.add_argument('--cycles', type=int, default=20, help='refresh cycles')
+    parser.add_argument('--latency', type=float, default=5, help='simulated response delay in ms')
+    parser.add_argument('--max-connections', type=int, default=1)
+    parser.add_argument('--thresholds', default=DEFAULT_THRESHOLDS)
+    parser.add_argument('--output', help='write the results to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = asyncio.run(run_benchmarks(args))
+    results['settings'] = {'iterations': args.iterations, 'cycles': args.cycles, 'latency_ms': args.latency, 'max_connections': args.max_connections}
+
+    with open(args.thresholds) as file:
+        thresholds = json.load(file)
+    # latency thresholds are given for the default simulated latency
+    if args.latency != parser.get_default('latency') or args.max_connections != parser.get_default('max_connections'):
+        thresholds = drop_latency_thresholds(thresholds)
+    results['regressions'] = check_thresholds(results, thresholds)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+    print(output)
+    sys.exit(1 if results['regressions'] else 0)
+
+
+if __name__ == '__main__':
+    main()
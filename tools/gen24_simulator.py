@@ -0,0 +1,479 @@
+"""Fronius GEN24 Modbus TCP simulator
+
+Serves a SunSpec int+SF register map of a Primo/Symo GEN24 inverter with
+optional battery storage and smart meters, for tests and benchmarks without
+a physical inverter.
+
+    python tools/gen24_simulator.py --port 5020 --storage --meter 200
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import struct
+import time
+
+from pymodbus import ExceptionResponse
+from pymodbus.datastore import ModbusServerContext
+from pymodbus.datastore.context import ModbusBaseSlaveContext
+from pymodbus.server import ModbusTcpServer
+
+_LOGGER = logging.getLogger(__name__)
+
+SUNSPEC_ADDRESS = 40000
+COMMON_ADDRESS = 40004
+MODEL_START_ADDRESS = 40069
+NOT_IMPLEMENTED_UINT16 = 0xFFFF
+NOT_IMPLEMENTED_INT16 = 0x8000
+
+# SunSpec model id and length of the models served by a GEN24 in int+SF mode
+INVERTER_MODEL = (103, 50)
+NAMEPLATE_MODEL = (120, 26)
+SETTINGS_MODEL = (121, 30)
+STATUS_MODEL = (122, 44)
+CONTROLS_MODEL = (123, 24)
+MPPT_MODEL = 160
+STORAGE_MODEL = (124, 24)
+METER_MODEL = (203, 105)
+
+# Offsets in the storage model that are accepted by writes
+STORAGE_WRITABLE_OFFSETS = [3, 5, 10, 11, 12, 13, 14, 15]
+
+INVERTER_STATUS_NORMAL = 4
+INVERTER_STATUS_SLEEPING = 2
+
+
+class RegisterImage:
+    """Holding registers of one unit, starting at the SunSpec marker."""
+
+    def __init__(self):
+        self.registers = []
+        self.models = {}
+        self.writable = set()
+        self._put_string(SUNSPEC_ADDRESS, 'SunS', 2)
+
+    @property
+    def end(self):
+        return SUNSPEC_ADDRESS + len(self.registers)
+
+    def _ensure(self, address, count):
+        missing = address + count - self.end
+        if missing > 0:
+            self.registers.extend([0] * missing)
+
+    def set(self, address, values):
+        self._ensure(address, len(values))
+        start = address - SUNSPEC_ADDRESS
+        self.registers[start:start + len(values)] = values
+
+    def get(self, address, count=1):
+        start = address - SUNSPEC_ADDRESS
+        return self.registers[start:start + count]
+
+    def _put_string(self, address, value, size):
+        data = value.encode('ascii').ljust(size * 2, b'\x00')[:size * 2]
+        self.set(address, list(struct.unpack(f'>{size}H', data)))
+
+    def add_model(self, name, model_id, length):
+        """Append a model header and reserve its registers, returns the data address."""
+        address = self.end
+        self.set(address, [model_id, length])
+        self._ensure(address + 2, length)
+        self.models[name] = address + 2
+        return address + 2
+
+    def end_model_chain(self):
+        self.set(self.end, [NOT_IMPLEMENTED_UINT16, 0])
+
+    def put_uint16(self, name, offset, value):
+        self.set(self.models[name] + offset, [value & 0xFFFF])
+
+    def put_int16(self, name, offset, value):
+        self.set(self.models[name] + offset, [value & 0xFFFF])
+
+    def put_uint32(self, name, offset, value):
+        value = int(value) & 0xFFFFFFFF
+        self.set(self.models[name] + offset, [value >> 16, value & 0xFFFF])
+
+    def put_string(self, name, offset, value, size):
+        self._put_string(self.models[name] + offset, value, size)
+
+    def get_uint16(self, name, offset):
+        return self.get(self.models[name] + offset)[0]
+
+    def get_int16(self, name, offset):
+        value = self.get_uint16(name, offset)
+        return value - 0x10000 if value & 0x8000 else value
+
+
+def put_common_model(image, manufacturer, model, options, version, serial, unit_id):
+    image.set(COMMON_ADDRESS - 2, [1, 65])
+    image.models['common'] = COMMON_ADDRESS
+    image.put_string('common', 0, manufacturer, 16)
+    image.put_string('common', 16, model, 16)
+    image.put_string('common', 32, options, 8)
+    image.put_string('common', 40, version, 8)
+    image.put_string('common', 48, serial, 16)
+    image.put_uint16('common', 64, unit_id)
+
+
+class InverterSimulation:
+    """Register image and live values of a GEN24 inverter."""
+
+    def __init__(self, model='Primo GEN24 6.0 Plus', serial='34123456', version='1.34.6-1', storage=True, unit_id=1, seed=None):
+        self.storage = storage
+        self.status = INVERTER_STATUS_NORMAL
+        self.pv_power = [2400, 1800]
+        self.battery_power = 500 if storage else 0
+        self._random = random.Random(seed)
+        self._energy = {'ac': 12345678.0, 'mppt': [4567890.0, 3456789.0, 234567.0, 198765.0]}
+        self._last_update = time.monotonic()
+
+        self.image = image = RegisterImage()
+        put_common_model(image, 'Fronius', model, '', version, serial, unit_id)
+        image.add_model('inverter', *INVERTER_MODEL)
+        image.add_model('nameplate', *NAMEPLATE_MODEL)
+        image.add_model('settings', *SETTINGS_MODEL)
+        image.add_model('status', *STATUS_MODEL)
+        image.add_model('controls', *CONTROLS_MODEL)
+        modules = 4 if storage else 2
+        image.add_model('mppt', MPPT_MODEL, 8 + 20 * modules)
+        if storage:
+            image.add_model('storage', *STORAGE_MODEL)
+            image.writable.update(image.models['storage'] + offset for offset in STORAGE_WRITABLE_OFFSETS)
+        image.end_model_chain()
+
+        self._put_inverter_model()
+        self._put_nameplate_model()
+        self._put_settings_model()
+        self._put_status_model()
+        self._put_controls_model()
+        self._put_mppt_model(modules)
+        if storage:
+            self._put_storage_model()
+        self.update()
+
+    def _put_inverter_model(self):
+        image = self.image
+        for offset in (5, 6, 7):
+            image.put_uint16('inverter', offset, 4000)
+        for offset in (8, 9, 10):
+            image.put_uint16('inverter', offset, 2301)
+        image.put_int16('inverter', 11, -1)  # V_SF
+        image.put_int16('inverter', 13, 0)  # W_SF
+        image.put_uint16('inverter', 14, 5000)
+        image.put_int16('inverter', 15, -2)  # Hz_SF
+        image.put_int16('inverter', 24, 0)  # WH_SF
+        image.put_int16('inverter', 31, 412)  # TmpCab
+        for offset in (32, 33, 34):
+            image.put_int16('inverter', offset, NOT_IMPLEMENTED_INT16)
+        image.put_int16('inverter', 35, -1)  # Tmp_SF
+
+    def _put_nameplate_model(self):
+        image = self.image
+        image.put_uint16('nameplate', 0, 82 if self.storage else 4)  # DERTyp
+        image.put_uint16('nameplate', 1, 6000)  # WRtg
+        if self.storage:
+            image.put_uint16('nameplate', 17, 10240)  # WHRtg
+            image.put_uint16('nameplate', 21, 5120)  # MaxChaRte
+            image.put_uint16('nameplate', 23, 5120)  # MaxDisChaRte
+        else:
+            for offset in (17, 21, 23):
+                image.put_uint16('nameplate', offset, NOT_IMPLEMENTED_UINT16)
+
+    def _put_settings_model(self):
+        self.image.put_uint16('settings', 0, 6000)  # WMax
+        self.image.put_int16('settings', 20, 0)  # WMax_SF
+
+    def _put_status_model(self):
+        image = self.image
+        image.put_uint16('status', 0, 7)  # PVConn
+        image.put_uint16('status', 1, 7 if self.storage else 0)  # StorConn
+        image.put_uint16('status', 2, 1)  # ECPConn
+        image.put_uint32('status', 33, 0)  # StActCtl
+
+    def _put_controls_model(self):
+        image = self.image
+        image.put_uint16('controls', 2, 1)  # Conn
+        image.put_uint16('controls', 3, 10000)  # WMaxLimPct
+        image.put_uint16('controls', 7, 0)  # WMaxLim_Ena
+        image.put_uint16('controls', 12, 0)  # OutPFSet_Ena
+        image.put_uint16('controls', 20, 0)  # VArPct_Ena
+        image.put_int16('controls', 21, -2)  # WMaxLimPct_SF
+
+    def _put_mppt_model(self, modules):
+        image = self.image
+        image.put_int16('mppt', 0, -2)  # DCA_SF
+        image.put_int16('mppt', 1, -2)  # DCV_SF
+        image.put_int16('mppt', 2, 0)  # DCW_SF
+        image.put_int16('mppt', 3, 0)  # DCWH_SF
+        image.put_uint16('mppt', 6, modules)
+        names = ['MPPT1', 'MPPT2', 'StCha 3', 'StDisCha 4']
+        for module in range(modules):
+            base = 8 + 20 * module
+            image.put_uint16('mppt', base, module + 1)
+            image.put_string('mppt', base + 1, names[module], 8)
+
+    def _put_storage_model(self):
+        image = self.image
+        image.put_uint16('storage', 0, 5120)  # WChaMax
+        image.put_uint16('storage', 1, 100)  # WChaGra
+        image.put_uint16('storage', 2, 100)  # WDisChaGra
+        image.put_uint16('storage', 3, 0)  # StorCtl_Mod
+        image.put_uint16('storage', 4, NOT_IMPLEMENTED_UINT16)  # VAChaMax
+        image.put_uint16('storage', 5, 700)  # MinRsvPct
+        image.put_uint16('storage', 6, 6550)  # ChaState
+        image.put_uint16('storage', 9, 3)  # ChaSt
+        image.put_int16('storage', 10, 10000)  # OutWRte
+        image.put_int16('storage', 11, 10000)  # InWRte
+        image.put_uint16('storage', 15, 2)  # ChaGriSet
+        for offset, value in enumerate([0, 0, NOT_IMPLEMENTED_INT16, -2, -2, NOT_IMPLEMENTED_INT16, NOT_IMPLEMENTED_INT16, -2]):
+            image.put_int16('storage', 16 + offset, value)
+
+    def set_status(self, status):
+        """Set the vendor operating state, values of FRONIUS_INVERTER_STATUS."""
+        self.status = status
+        self.update()
+
+    def update(self):
+        """Advance energy counters and refresh the live values."""
+        now = time.monotonic()
+        elapsed = now - self._last_update
+        self._last_update = now
+
+        image = self.image
+        producing = self.status == INVERTER_STATUS_NORMAL
+        pv_power = [int(power * (0.98 + self._random.random() * 0.04)) if producing else 0 for power in self.pv_power]
+        battery_power = self.battery_power if producing else 0
+        ac_power = sum(pv_power) + battery_power
+
+        self._energy['ac'] += ac_power * elapsed / 3600
+        for module, power in enumerate(pv_power):
+            self._energy['mppt'][module] += power * elapsed / 3600
+        image.put_int16('inverter', 12, ac_power)
+        image.put_uint32('inverter', 22, self._energy['ac'])
+        image.put_uint16('inverter', 36, self.status)  # St
+        image.put_uint16('inverter', 37, self.status)  # StVnd
+
+        for module, power in enumerate(pv_power):
+            base = 8 + 20 * module
+            image.put_uint16('mppt', base + 11, power)
+            image.put_uint32('mppt', base + 12, self._energy['mppt'][module])
+
+        if self.storage:
+            charge, discharge = (0, battery_power) if battery_power >= 0 else (-battery_power, 0)
+            self._energy['mppt'][2] += charge * elapsed / 3600
+            self._energy['mppt'][3] += discharge * elapsed / 3600
+            for module, power in ((2, charge), (3, discharge)):
+                base = 8 + 20 * module
+                image.put_uint16('mppt', base + 11, power)
+                image.put_uint32('mppt', base + 12, self._energy['mppt'][module])
+
+
+class MeterSimulation:
+    """Register image and live values of a Fronius smart meter."""
+
+    def __init__(self, unit_id=200, model='Smart Meter TS 65A-3', serial='12345678', power=-1500, seed=None):
+        self.power = power
+        self._random = random.Random(seed)
+        self._exported = 2345678.0
+        self._imported = 3456789.0
+        self._last_update = time.monotonic()
+
+        self.image = image = RegisterImage()
+        put_common_model(image, 'Fronius', model, 'Primary Meter', '1.3', serial, unit_id)
+        image.add_model('meter', *METER_MODEL)
+        image.end_model_chain()
+
+        for offset in (5, 6, 7, 8):
+            image.put_int16('meter', offset, 2305)
+        for offset in (9, 10, 11, 12):
+            image.put_int16('meter', offset, 3992)
+        image.put_int16('meter', 13, -1)  # V_SF
+        image.put_int16('meter', 14, 5000)
+        image.put_int16('meter', 15, -2)  # Hz_SF
+        image.put_int16('meter', 20, 0)  # W_SF
+        image.put_int16('meter', 52, 0)  # TotWh_SF
+        self.update()
+
+    def update(self):
+        now = time.monotonic()
+        elapsed = now - self._last_update
+        self._last_update = now
+
+        power = int(self.power * (0.95 + self._random.random() * 0.1))
+        if power < 0:
+            self._exported -= power * elapsed / 3600
+        else:
+            self._imported += power * elapsed / 3600
+        image = self.image
+        image.put_int16('meter', 16, power)
+        for phase in range(3):
+            image.put_int16('meter', 17 + phase, power // 3)
+        image.put_uint32('meter', 36, self._exported)
+        image.put_uint32('meter', 44, self._imported)
+
+
+class SimulatorContext(ModbusBaseSlaveContext):
+    """Modbus unit serving a simulated register image with injected faults."""
+
+    def __init__(self, simulator, simulation):
+        self._simulator = simulator
+        self.simulation = simulation
+        self.reads = 0
+        self.writes = 0
+
+    def reset(self):
+        pass
+
+    async def async_getValues(self, fc_as_hex, address, count=1):
+        fault = await self._simulator.inject_faults()
+        if fault:
+            return fault
+
+        image = self.simulation.image
+        if address < SUNSPEC_ADDRESS or address + count > image.end:
+            return ExceptionResponse.ILLEGAL_ADDRESS
+        if fc_as_hex == 3:
+            self.reads += 1
+            self.simulation.update()
+        return image.get(address, count)
+
+    async def async_setValues(self, fc_as_hex, address, values):
+        fault = await self._simulator.inject_faults()
+        if fault:
+            return fault
+
+        image = self.simulation.image
+        addresses = range(address, address + len(values))
+        if not all(a in image.writable for a in addresses):
+            # GEN24 accepts read only registers in multi register writes as
+            # long as the written value matches, unless configured to reject
+            current = image.get(address, len(values))
+            if self._simulator.reject_readonly_writes or any(
+                    not a in image.writable and value != current[i] for i, (a, value) in enumerate(zip(addresses, values))):
+                return ExceptionResponse.ILLEGAL_ADDRESS
+        self.writes += 1
+        for a, value in zip(addresses, values):
+            if a in image.writable:
+                image.set(a, [value])
+        _LOGGER.debug(f'write {address} {list(values)}')
+        return None
+
+
+class Gen24Simulator:
+    """Modbus TCP server with a GEN24 inverter and optional smart meters.
+
+    ``latency`` delays every request in seconds. ``exception_rate`` and
+    ``drop_rate`` are the probabilities of answering a request with
+    ``exception_code`` or of dropping all client connections.
+    """
+
+    def __init__(self, host='127.0.0.1', port=5020, storage=True, inverter_unit_id=1, meter_unit_ids=(200,),
+                 latency=0.0, exception_rate=0.0, drop_rate=0.0, exception_code=ExceptionResponse.SLAVE_BUSY,
+                 reject_readonly_writes=False, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.exception_rate = exception_rate
+        self.drop_rate = drop_rate
+        self.exception_code = exception_code
+        self.reject_readonly_writes = reject_readonly_writes
+        self.exceptions = 0
+        self.drops = 0
+        self._random = random.Random(seed)
+        self._server = None
+        self._task = None
+
+        self.inverter = InverterSimulation(storage=storage, unit_id=inverter_unit_id, seed=seed)
+        self.meters = {unit_id: MeterSimulation(unit_id=unit_id, seed=seed) for unit_id in meter_unit_ids}
+        units = {inverter_unit_id: SimulatorContext(self, self.inverter)}
+        for unit_id, meter in self.meters.items():
+            units[unit_id] = SimulatorContext(self, meter)
+        self.units = units
+        self.context = ModbusServerContext(slaves=units, single=False)
+
+    @property
+    def reads(self):
+        return sum(unit.reads for unit in self.units.values())
+
+    @property
+    def writes(self):
+        return sum(unit.writes for unit in self.units.values())
+
+    async def inject_faults(self):
+        """Apply latency and faults to a request, returns an exception code or None."""
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.drop_rate and self._random.random() < self.drop_rate:
+            self.drops += 1
+            self.drop_connections()
+            return ExceptionResponse.SLAVE_FAILURE
+        if self.exception_rate and self._random.random() < self.exception_rate:
+            self.exceptions += 1
+            return self.exception_code
+        return None
+
+    def drop_connections(self):
+        """Close all client connections."""
+        if self._server is None:
+            return
+        for connection in list(self._server.active_connections.values()):
+            connection.close()
+
+    async def start(self):
+        self._server = ModbusTcpServer(context=self.context, address=(self.host, self.port))
+        await self._server.serve_forever(background=True)
+        _LOGGER.info(f'GEN24 simulator listening on {self.host}:{self.port}')
+
+    async def stop(self):
+        if not self._server is None:
+            await self._server.shutdown()
+            self._server = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+
+async def run(args):
+    simulator = Gen24Simulator(
+        host=args.host, port=args.port, storage=args.storage, inverter_unit_id=args.unit_id, meter_unit_ids=args.meter,
+        latency=args.latency / 1000, exception_rate=args.exception_rate, drop_rate=args.drop_rate,
+        reject_readonly_writes=args.reject_readonly_writes, seed=args.seed)
+    simulator.inverter.set_status(args.status)
+    async with simulator:
+        await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fronius GEN24 Modbus TCP simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5020)
+    parser.add_argument('--unit-id', type=int, default=1, help='inverter unit id')
+    parser.add_argument('--storage', action=argparse.BooleanOptionalAction, default=True, help='battery storage attached')
+    parser.add_argument('--meter', type=int, action='append', help='smart meter unit id, repeat for more meters')
+    parser.add_argument('--status', type=int, default=INVERTER_STATUS_NORMAL, help='vendor operating state (StVnd)')
+    parser.add_argument('--latency', type=float, default=0, help='response delay in ms')
+    parser.add_argument('--exception-rate', type=float, default=0, help='fraction of requests answered with an exception')
+    parser.add_argument('--drop-rate', type=float, default=0, help='fraction of requests that drop the connections')
+    parser.add_argument('--reject-readonly-writes', action='store_true', help='reject multi register writes covering read only registers')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--debug', action='store_true')
+    args = parser.parse_args()
+    if args.meter is None:
+        args.meter = [200]
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()